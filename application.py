@@ -13,12 +13,21 @@ Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
 """
 import datetime
 import json
+import multiprocessing
+import sys
+from typing import Optional
 
-from contract import PrepaidContract, MTMContract, TermContract
+from contract import create_contract
 from customer import Customer
 from phoneline import PhoneLine
 from visualizer import Visualizer
 from call import Call  # idk if i'm actually allowed to import this
+from call import MONTH_SHIFT, parse_time
+from numberregistry import NUMBERS
+from smslog import SMSLog
+
+# Start date of the contracts of all customers of the input dataset
+CONTRACT_START = datetime.date(2017, 12, 25)
 
 
 def import_data() -> dict[str, list[dict]]:
@@ -33,10 +42,17 @@ def import_data() -> dict[str, list[dict]]:
         return log
 
 
-def create_customers(log: dict[str, list[dict]]) -> list[Customer]:
+def create_customers(log: dict[str, list[dict]],
+                     lazy_bills: bool = False) -> list[Customer]:
     """ Returns a list of Customer instances for each customer from the input
     dataset from the dictionary <log>.
 
+    If <lazy_bills> is True, the phone lines only create a Bill for a month
+    once a call is billed in it (see PhoneLine).
+
+    Creating the phone lines registers every phone number of the dataset in
+    the NUMBERS registry, so that calls can refer to them by id.
+
     Precondition:
     - The <log> dictionary contains the input data in the correct format,
     matching the expected input format described in the handout.
@@ -45,19 +61,12 @@ def create_customers(log: dict[str, list[dict]]) -> list[Customer]:
     for cust in log['customers']:
         customer = Customer(cust['id'])
         for line in cust['lines']:
-            contract = None
-            if line['contract'] == 'prepaid':
-                # start with $100 credit on the account
-                contract = PrepaidContract(datetime.date(2017, 12, 25), 100)
-            elif line['contract'] == 'mtm':
-                contract = MTMContract(datetime.date(2017, 12, 25))
-            elif line['contract'] == 'term':
-                contract = TermContract(datetime.date(2017, 12, 25),
-                                        datetime.date(2019, 6, 25))
-            else:
+            # the rate plan registry gives e.g. prepaid lines $100 credit
+            contract = create_contract(line['contract'], CONTRACT_START)
+            if contract is None:
                 print("ERROR: unknown contract type")
 
-            line = PhoneLine(line['number'], contract)
+            line = PhoneLine(line['number'], contract, lazy_bills)
             customer.add_phone_line(line)
         customer_list.append(customer)
     return customer_list
@@ -85,13 +94,17 @@ def new_month(customer_list: list[Customer], month: int, year: int) -> None:
 
 
 def process_event_history(log: dict[str, list[dict]],
-                          customer_list: list[Customer]) -> None:
+                          customer_list: list[Customer],
+                          sms_log: Optional[SMSLog] = None) -> None:
     """ Process the calls from the <log> dictionary. The <customer_list>
     list contains all the customers that exist in the <log> dictionary.
 
     Construct Call objects from <log> and register the Call into the
     corresponding customer's call history.
 
+    SMS events are counted and billed by the phone lines that send and
+    receive them. If <sms_log> is not None, they are also stored in it.
+
     Hint: You must advance all customers to a new month using the new_month()
     function, everytime a new month is detected for the current event you are
     extracting.
@@ -105,52 +118,226 @@ def process_event_history(log: dict[str, list[dict]],
     handout.
     - The <customer_list> already contains all the customers from the <log>.
     """
-    billing_date = datetime.datetime.strptime(log['events'][0]['time'],
-                                              "%Y-%m-%d %H:%M:%S")
-    billing_month = billing_date.month
-    billing_year = billing_date.year
+    _process_events(log['events'], customer_list,
+                    _map_numbers_to_customers(customer_list), sms_log)
 
-    new_month(customer_list, billing_date.month, billing_date.year)
 
-    for item in log['events']:
-        billing_date = datetime.datetime.strptime(item['time'],
-                                                  "%Y-%m-%d %H:%M:%S")
+def _map_numbers_to_customers(customer_list: list[Customer]) \
+        -> dict[int, Customer]:
+    """ Return a dictionary mapping the id of every phone number owned by a
+    customer in <customer_list> to that customer. As in
+    find_customer_by_number, a number owned by several customers is mapped to
+    the last of them.
+    """
+    owners = {}
+    for customer in customer_list:
+        for nid in customer.get_number_ids():
+            owners[nid] = customer
+    return owners
+
+
+def _process_events(events: list[dict], customer_list: list[Customer],
+                    owners: dict[int, Customer],
+                    sms_log: Optional[SMSLog] = None,
+                    billing_month: Optional[int] = None,
+                    new_calls: Optional[list[Call]] = None) -> Optional[int]:
+    """ Process the chronologically ordered <events> for the customers in
+    <customer_list>, as described in process_event_history, and return the
+    month index (12 * year + month - 1) of the last event, or <billing_month>
+    if there are no events.
+
+    Each call or SMS is made by the owner of its source number and received
+    by the owner of its destination number, as given by <owners> for the
+    number ids. A side of a call whose number is not in <owners> is skipped,
+    which lets a shard of the customers process only its own side of a call.
+
+    If <billing_month> is not None, the customers are already in that month,
+    which lets events be processed in several batches without advancing
+    them to the same month again.
+
+    If <sms_log> is not None, every SMS is also added to it. If <new_calls>
+    is not None, every Call created is also appended to it.
+    """
+    if billing_month is not None:
+        year, month = divmod(billing_month, 12)
+        month += 1
+
+    for item in events:
+        # parse the time straight into its packed form (see call.pack_time)
+        call_time = parse_time(item['time'])
 
         # check to see if the date is difference (i.e. month and year
         # don't match up)
-        if billing_date.year != billing_year or billing_date.month != \
-                billing_month:
+        if call_time >> MONTH_SHIFT != billing_month:
             # advance to a new time
-            new_month(customer_list, billing_date.month, billing_date.year)
-            billing_year = billing_date.year  # update year
-            billing_month = billing_date.month  # update month
+            billing_month = call_time >> MONTH_SHIFT
+            year, month = divmod(billing_month, 12)
+            month += 1
+            new_month(customer_list, month, year)
 
-        # RECORD ONLY CALL EVENTS !!!
         if item['type'] == 'call':
 
-            # get all required arguments needed to create a new Call object
-            the_src_number = item['src_number']
-            the_dst_number = item['dst_number']
-            the_call_time = datetime.datetime.strptime(item['time'],
-                                                       "%Y-%m-%d %H:%M:%S")
-            the_duration = item['duration']
-            the_src_log = item['src_loc']
-            the_dst_log = item['dst_loc']
+            # look the numbers up once, and use their ids from then on
+            src_id = NUMBERS.intern(item['src_number'])
+            dst_id = NUMBERS.intern(item['dst_number'])
 
             # create a new call object that is currently processing
-            current_processing = Call(the_src_number, the_dst_number,
-                                      the_call_time, the_duration, the_src_log,
-                                      the_dst_log)
+            current_processing = Call(src_id, dst_id,
+                                      call_time, item['duration'],
+                                      item['src_loc'], item['dst_loc'])
+
+            # record it in the Customer class (i.e. both source_dst and
+            # dst_customer)
+            source_customer = owners.get(src_id)
+            dst_customer = owners.get(dst_id)
+
+            if source_customer is not None:
+                source_customer.make_call(current_processing)
+            if dst_customer is not None:
+                dst_customer.receive_call(current_processing)
+            if new_calls is not None:
+                new_calls.append(current_processing)
+
+        elif item['type'] == 'sms':
+            # SMSs are only counted and billed, no object is created for them
+            src_id = NUMBERS.intern(item['src_number'])
+            dst_id = NUMBERS.intern(item['dst_number'])
+            source_customer = owners.get(src_id)
+            dst_customer = owners.get(dst_id)
+
+            if source_customer is not None:
+                source_customer.send_sms(src_id, month, year)
+            if dst_customer is not None:
+                dst_customer.receive_sms(dst_id, month, year)
+            if sms_log is not None:
+                sms_log.add(src_id, dst_id, call_time)
+
+    return billing_month
+
+
+# The work of each shard of process_event_history_sharded, as (events,
+# customers, owners) Tuples. Worker processes are forked after it is set, so
+# they inherit it instead of receiving the customers and events pickled.
+_shard_jobs: list[tuple[list[dict], list[Customer], dict[int, Customer]]] = []
+
+
+def _process_shard(shard: int) -> list[list[tuple]]:
+    """ Process the events of shard number <shard> of _shard_jobs, in a worker
+    process, and return the billing state of each of its customers.
+    """
+    events, customers, owners = _shard_jobs[shard]
+    _process_events(events, customers, owners)
+    return [customer.get_billing_state() for customer in customers]
+
+
+def process_event_history_sharded(log: dict[str, list[dict]],
+                                  customer_list: list[Customer],
+                                  num_shards: int,
+                                  sms_log: Optional[SMSLog] = None) -> None:
+    """ Process the calls from the <log> dictionary like process_event_history,
+    with the billing split over <num_shards> worker processes.
+
+    The customers are partitioned into <num_shards> shards, each owning the
+    phone numbers of its customers. Every call and SMS event is routed to the
+    shards owning its source and destination numbers, and the first event of
+    every month is routed to every shard, so that each shard starts the same
+    months as the serial path. Each shard bills its calls in a forked worker
+    process and sends back the bills and contracts of its phone lines.
+
+    Meanwhile, this process creates the Call objects and registers them in
+    the call histories, in event order, so that the same Call object is shared
+    by the source and destination lines as in the serial path. It also counts
+    the SMSs in the call histories, and adds them to <sms_log> if it is not
+    None. The resulting bills and call histories are the same as those of
+    process_event_history.
+
+    If <num_shards> is 1, or processes cannot be forked on this platform,
+    process_event_history is used instead.
 
-            # using find_customer_by_number, record it in the Customer
-            # class (i.e. both source_dst and dst_customer)
-            source_customer = find_customer_by_number(item['src_number'],
-                                                      customer_list)
-            dst_customer = find_customer_by_number(item['dst_number'],
-                                                   customer_list)
+    Preconditions:
+    - the same as for process_event_history
+    - num_shards >= 1
+    """
+    if num_shards <= 1 or \
+            'fork' not in multiprocessing.get_all_start_methods():
+        process_event_history(log, customer_list, sms_log)
+        return
+
+    global _shard_jobs
+    shard_of = {}
+    shards = [([], [], {}) for _ in range(num_shards)]
+    for i, customer in enumerate(customer_list):
+        shard = i % num_shards
+        shards[shard][1].append(customer)
+        for nid in customer.get_number_ids():
+            shard_of[nid] = shard
+            shards[shard][2][nid] = customer
+
+    # route the events; the "YYYY-MM" prefix of the time identifies the month
+    current_month = None
+    for item in log['events']:
+        targets = set()
+        if item['type'] in ('call', 'sms'):
+            # a number without a customer has no shard, and is skipped
+            for number in (item['src_number'], item['dst_number']):
+                shard = shard_of.get(NUMBERS.lookup(number))
+                if shard is not None:
+                    targets.add(shard)
+        if item['time'][:7] != current_month:
+            current_month = item['time'][:7]
+            targets = range(num_shards)
+        for shard in targets:
+            shards[shard][0].append(item)
+
+    _shard_jobs = shards
+    try:
+        with multiprocessing.get_context('fork').Pool(num_shards) as pool:
+            pending = pool.map_async(_process_shard, range(num_shards))
+            _register_call_histories(log['events'],
+                                     _map_numbers_to_customers(customer_list),
+                                     sms_log)
+            results = pending.get()
+    finally:
+        _shard_jobs = []
+
+    for (_, customers, _), states in zip(shards, results):
+        for customer, state in zip(customers, states):
+            customer.set_billing_state(state)
+
+
+def _register_call_histories(events: list[dict],
+                             owners: dict[int, Customer],
+                             sms_log: Optional[SMSLog]) -> None:
+    """ Create a Call for every call in <events>, and register it in the call
+    histories of its source and destination lines, without billing it.
+    Count every SMS in the same way, and add it to <sms_log> if it is not
+    None. A side whose number is not in <owners> is skipped.
+    """
+    histories = {}
+    for nid, customer in owners.items():
+        histories[nid] = customer.get_call_history(nid)[-1]
 
-            source_customer.make_call(current_processing)
-            dst_customer.receive_call(current_processing)
+    for item in events:
+        if item['type'] == 'call':
+            call = Call(NUMBERS.intern(item['src_number']),
+                        NUMBERS.intern(item['dst_number']),
+                        parse_time(item['time']), item['duration'],
+                        item['src_loc'], item['dst_loc'])
+            if call.src_id in histories:
+                histories[call.src_id].register_outgoing_call(call)
+            if call.dst_id in histories:
+                histories[call.dst_id].register_incoming_call(call)
+        elif item['type'] == 'sms':
+            src_id = NUMBERS.intern(item['src_number'])
+            dst_id = NUMBERS.intern(item['dst_number'])
+            sms_time = parse_time(item['time'])
+            year, month = divmod(sms_time >> MONTH_SHIFT, 12)
+            if src_id in histories:
+                histories[src_id].register_outgoing_sms(month + 1, year)
+            if dst_id in histories:
+                histories[dst_id].register_incoming_sms(month + 1, year)
+            if sms_log is not None:
+                sms_log.add(src_id, dst_id, sms_time)
 
 
 if __name__ == '__main__':
@@ -174,11 +361,33 @@ if __name__ == '__main__':
     # (Each call is registered as both an incoming and outgoing)
     all_calls = []
     for c in customers:
-        hist = c.get_history()
-        all_calls.extend(hist[0])
+        for line_calls in c.get_outgoing_views():
+            all_calls.extend(line_calls)
     print("\n-----------------------------------------")
     print("Total Calls in the dataset:", len(all_calls))
 
+    # Optionally keep ingesting events as they arrive, from a JSON Lines file
+    # or FIFO given by its path, from a local socket given as "tcp:PORT", or
+    # from any number of producers connecting to "serve:ADDRESS", where
+    # ADDRESS is a unix domain socket path or "tcp:PORT"
+    live = None
+    if len(sys.argv) > 1:
+        # imported here, since liveingest builds on this module
+        from liveingest import LiveIngestor, follow_file, socket_lines
+        from asyncfeed import AsyncEventServer
+        ingestor = LiveIngestor(customers)
+        live = ingestor
+        if sys.argv[1].startswith('serve:'):
+            live = AsyncEventServer(sys.argv[1][6:], ingestor)
+            live.start()
+        elif sys.argv[1].startswith('tcp:'):
+            ingestor.start(socket_lines(int(sys.argv[1][4:]),
+                                        ingestor.get_stop_event()))
+        else:
+            ingestor.start(follow_file(sys.argv[1],
+                                       ingestor.get_stop_event()))
+        print("Ingesting live events from", sys.argv[1])
+
     # Main loop for the application.
     # 1) Wait for user interaction with the system and processes everything
     #    appropriately
@@ -188,6 +397,9 @@ if __name__ == '__main__':
     events = all_calls
     while not v.has_quit():
         events = v.handle_window_events(customers, events)
+        if live is not None:
+            # only the new calls go through the filters applied so far
+            events = v.add_live_calls(customers, events, live.poll())
 
         connections = []
         drawables = []
@@ -199,15 +411,20 @@ if __name__ == '__main__':
         drawables.extend(connections)
         v.render_drawables(drawables)
 
+    if live is not None:
+        live.stop()
+
     import python_ta
 
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'json', 'datetime',
-            'visualizer', 'customer', 'call', 'contract', 'phoneline'
+            'python_ta', 'typing', 'json', 'datetime', 'multiprocessing',
+            'sys', 'visualizer', 'customer', 'call', 'contract', 'phoneline',
+            'numberregistry', 'smslog', 'liveingest', 'asyncfeed'
         ],
         'allowed-io': [
             'create_customers', 'import_data'
         ],
+        'disable': ['W0603'],
         'generated-members': 'pygame.*'
     })
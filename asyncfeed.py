@@ -0,0 +1,396 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains an asyncio front end for the live ingestion of events,
+which accepts JSON Lines events from any number of local producers at once,
+over a unix domain socket (or a local TCP port).
+
+An event loop runs in a background thread: it reads the lines of every
+producer, parses and validates them, and groups them into batches of events,
+in the format of the "events" of the dataset. The thread that owns the model
+takes the batches with AsyncEventServer.poll() and processes them with a
+LiveIngestor.
+
+Each producer must send its events in chronological order, and the streams
+of the producers are merged by time: an event is only batched once every
+connected producer has sent an event at least as late, so that the events of
+a month are not rejected because another producer is already sending the
+next month.
+
+Both the merge and the batches queue are bounded. When the model falls
+behind, the batches queue fills up, the merge fills up in turn, and the
+producers are no longer read from, so that they are slowed down by their
+socket instead of the queues growing without bounds.
+"""
+import asyncio
+import heapq
+import json
+import queue
+import threading
+import time
+from typing import Optional
+from call import Call
+from liveingest import BATCH_SIZE, LiveIngestor, parse_event
+
+# Maximum number of parsed events waiting to be put in a batch. When it is
+# reached, the earliest events are batched without waiting for the producers
+# that are behind.
+MAX_PENDING_EVENTS = 10000
+
+# Maximum number of batches waiting to be processed
+MAX_PENDING_BATCHES = 4
+
+# Line sent to a producer once it is taken into account by the merge
+READY_LINE = b'ready\n'
+
+# Seconds to wait before checking again for room in a full batches queue
+BACKOFF_INTERVAL = 0.005
+
+
+async def _connect(address: str) -> asyncio.StreamWriter:
+    """ Connect to the server at <address>, a unix domain socket path or
+    "tcp:PORT" for a local TCP port, and return the writer of the connection
+    once the server is ready to merge its events.
+    """
+    if address.startswith('tcp:'):
+        reader, writer = await asyncio.open_connection('localhost',
+                                                       int(address[4:]))
+    else:
+        reader, writer = await asyncio.open_unix_connection(address)
+    await reader.readline()
+    return writer
+
+
+class AsyncEventServer:
+    """ A server accepting events from local producers, for a LiveIngestor.
+
+    Events are batched in chronological order across the producers, as long
+    as each producer sends its own events in order, after waiting for the
+    READY_LINE that the server sends it once it takes it into account. A
+    producer that stays connected without sending anything holds back the
+    events later than its last one, until MAX_PENDING_EVENTS events are
+    waiting. As for the
+    LiveIngestor, an event of a month before the month of the events already
+    processed is rejected.
+
+    === Public Attributes ===
+    received:
+         number of valid events read from the producers
+    rejected:
+         number of lines read from the producers that were not valid events
+    """
+    # === Private Attributes ===
+    # _address:
+    #     the unix domain socket path, or "tcp:PORT", to listen on
+    # _ingestor:
+    #     the LiveIngestor that processes the batches
+    # _batch_size:
+    #     the maximum number of events in a batch
+    # _pending:
+    #     the parsed events waiting to be put in a batch, as a heap of Tuples
+    #     (time, arrival number, event); only used by the event loop
+    # _producers:
+    #     the time of the last event of every connected producer, or '' if it
+    #     has not sent any, keyed by the number of the producer
+    # _arrivals:
+    #     the number of events and producers received so far, used to number
+    #     them
+    # _added:
+    #     set when an event is added to _pending or a producer disconnects
+    # _room:
+    #     set when events are taken out of _pending
+    # _batches:
+    #     the batches waiting to be processed by poll()
+    # _loop:
+    #     the event loop, once it is running
+    # _thread:
+    #     the thread running the event loop, once started
+    # _ready:
+    #     set once the server is listening, or failed to
+    # _closing:
+    #     set, in the event loop, to stop the server
+    # _error:
+    #     the exception raised while starting the server, if any
+    # _started:
+    #     the time at which the server started listening
+    received: int
+    rejected: int
+    _address: str
+    _ingestor: LiveIngestor
+    _batch_size: int
+    _pending: list[tuple[str, int, dict]]
+    _producers: dict[int, str]
+    _arrivals: int
+    _added: Optional[asyncio.Event]
+    _room: Optional[asyncio.Event]
+    _batches: queue.Queue
+    _loop: Optional[asyncio.AbstractEventLoop]
+    _thread: Optional[threading.Thread]
+    _ready: threading.Event
+    _closing: Optional[asyncio.Event]
+    _error: Optional[BaseException]
+    _started: float
+
+    def __init__(self, address: str, ingestor: LiveIngestor,
+                 batch_size: int = BATCH_SIZE,
+                 max_batches: int = MAX_PENDING_BATCHES) -> None:
+        """ Create a server listening on <address>, a unix domain socket path
+        or "tcp:PORT" for a local TCP port, whose events are processed by
+        <ingestor> in batches of at most <batch_size> events. At most
+        <max_batches> batches wait to be processed.
+        """
+        self.received = 0
+        self.rejected = 0
+        self._address = address
+        self._ingestor = ingestor
+        self._batch_size = batch_size
+        self._pending = []
+        self._producers = {}
+        self._arrivals = 0
+        self._added = None
+        self._room = None
+        self._batches = queue.Queue(max_batches)
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._closing = None
+        self._error = None
+        self._started = time.perf_counter()
+
+    def start(self) -> None:
+        """ Start the event loop of this server in a background thread, and
+        return once the server is listening.
+
+        Raise the OSError of the server if it cannot listen on its address.
+        """
+        self._thread = threading.Thread(target=asyncio.run,
+                                        args=(self._serve(),), daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def get_address(self) -> str:
+        """ Return the address this server listens on.
+        """
+        return self._address
+
+    def stop(self) -> None:
+        """ Stop this server, and wait for its event loop to finish. The
+        batches not processed yet, and the events waiting to be batched, are
+        kept for poll(). The events that producers still connected have not
+        sent yet are lost.
+        """
+        if self._loop is not None and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._closing.set)
+            self._thread.join()
+
+    async def _serve(self) -> None:
+        """ Listen for producers until _closing is set.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._added = asyncio.Event()
+        self._room = asyncio.Event()
+        self._closing = asyncio.Event()
+        try:
+            if self._address.startswith('tcp:'):
+                server = await asyncio.start_server(
+                    self._read_producer, 'localhost', int(self._address[4:]))
+            else:
+                server = await asyncio.start_unix_server(
+                    self._read_producer, self._address)
+        except OSError as error:
+            self._error = error
+            self._ready.set()
+            return
+
+        self._started = time.perf_counter()
+        self._ready.set()
+        batcher = asyncio.create_task(self._batch_events())
+        async with server:
+            await self._closing.wait()
+        batcher.cancel()
+        try:
+            await batcher
+        except asyncio.CancelledError:
+            pass
+        self._flush_pending()
+
+    def _flush_pending(self) -> None:
+        """ Put every pending event in the batches waiting for poll(), in
+        chronological order, once the server is closed.
+        """
+        # no producer is left to slow down, and poll() may only be called
+        # after the event loop finished, so the queue can no longer be full
+        self._batches.maxsize = 0
+        while self._pending:
+            count = min(self._batch_size, len(self._pending))
+            self._batches.put_nowait([heapq.heappop(self._pending)[2]
+                                      for _ in range(count)])
+
+    async def _read_producer(self, reader: asyncio.StreamReader,
+                             writer: asyncio.StreamWriter) -> None:
+        """ Parse the lines sent by a producer, and add its valid events to
+        the merge, waiting for room when it is full.
+        """
+        self._arrivals += 1
+        producer = self._arrivals
+        # until its first event, the producer holds back every event
+        self._producers[producer] = ''
+        writer.write(READY_LINE)
+        try:
+            async for line in reader:
+                event = parse_event(line.decode())
+                if event is None:
+                    self.rejected += 1
+                    continue
+                self.received += 1
+                while len(self._pending) >= MAX_PENDING_EVENTS:
+                    self._room.clear()
+                    await self._room.wait()
+                self._arrivals += 1
+                heapq.heappush(self._pending,
+                               (event['time'], self._arrivals, event))
+                self._producers[producer] = event['time']
+                self._added.set()
+        finally:
+            self._producers.pop(producer, None)
+            self._added.set()
+            writer.close()
+
+    def _can_batch(self) -> bool:
+        """ Return whether the earliest pending event can be batched: no
+        connected producer is behind it, or the merge is full.
+        """
+        if not self._pending:
+            return False
+        return not self._producers \
+            or len(self._pending) >= MAX_PENDING_EVENTS \
+            or self._pending[0][0] <= min(self._producers.values())
+
+    async def _batch_events(self) -> None:
+        """ Group the pending events into chronologically ordered batches of
+        at most _batch_size events, and hand them over to poll(), waiting,
+        without blocking the event loop, for room in the batches queue when it
+        is full.
+        """
+        while True:
+            while not self._can_batch():
+                self._added.clear()
+                await self._added.wait()
+            batch = []
+            while len(batch) < self._batch_size and self._can_batch():
+                batch.append(heapq.heappop(self._pending))
+            self._room.set()
+            # only this task adds batches, so there is room once not full
+            try:
+                while self._batches.full():
+                    await asyncio.sleep(BACKOFF_INTERVAL)
+            except asyncio.CancelledError:
+                # the server is closing: keep the batch for _flush_pending()
+                for entry in batch:
+                    heapq.heappush(self._pending, entry)
+                raise
+            self._batches.put_nowait([entry[2] for entry in batch])
+
+    def poll(self, max_batches: int = MAX_PENDING_BATCHES) -> list[Call]:
+        """ Process at most <max_batches> of the batches of events received
+        so far, and return the Calls created, in the order they were received.
+        """
+        new_calls = []
+        for _ in range(max_batches):
+            try:
+                batch = self._batches.get_nowait()
+            except queue.Empty:
+                break
+            new_calls.extend(self._ingestor.process(batch))
+        return new_calls
+
+    def get_metrics(self) -> dict[str, float]:
+        """ Return the metrics of this server, with the keys:
+        - "received", "rejected": as the attributes of the same name
+        - "processed": the number of events processed by the ingestor
+        - "queued_events": the number of events waiting to be batched
+        - "queued_batches": the number of batches waiting to be processed
+        - "events_per_second": the number of events processed per second
+          since the server started
+        """
+        elapsed = time.perf_counter() - self._started
+        processed = self._ingestor.processed
+        return {'received': self.received,
+                'rejected': self.rejected,
+                'processed': processed,
+                'queued_events': len(self._pending),
+                'queued_batches': self._batches.qsize(),
+                'events_per_second': processed / elapsed if elapsed else 0.0}
+
+
+async def _write_lines(writer: asyncio.StreamWriter, lines: list[str]) -> None:
+    """ Write the <lines>, one per line, to <writer>, waiting whenever the
+    server does not read them fast enough.
+    """
+    for line in lines:
+        writer.write(line.encode() + b'\n')
+        await writer.drain()
+
+
+async def send_events(address: str, lines: list[str]) -> None:
+    """ Send the JSON <lines> of events, one per line, to the server at
+    <address>, like a producer.
+    """
+    writer = await _connect(address)
+    await _write_lines(writer, lines)
+    writer.close()
+    await writer.wait_closed()
+
+
+def generate_load(address: str, events: list[dict],
+                  num_producers: int = 4) -> None:
+    """ Send the chronologically ordered <events> to the server at <address>
+    from <num_producers> concurrent producers.
+
+    Consecutive events are sent by different producers, and the producers
+    only start sending the events of a month once they have all sent the
+    events of the previous month, so that the server receives them roughly in
+    order.
+    """
+    months = {}
+    for event in events:
+        months.setdefault(event['time'][:7], []).append(json.dumps(event))
+
+    async def _send_all() -> None:
+        """ Run every producer at once, one month at a time """
+        writers = []
+        for _ in range(num_producers):
+            writers.append(await _connect(address))
+        for lines in months.values():
+            await asyncio.gather(*(
+                _write_lines(writer, lines[i::num_producers])
+                for i, writer in enumerate(writers)))
+        for writer in writers:
+            writer.close()
+            await writer.wait_closed()
+
+    asyncio.run(_send_all())
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'asyncio', 'heapq', 'json', 'queue',
+            'threading', 'time', 'call', 'liveingest'
+        ],
+    })
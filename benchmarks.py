@@ -0,0 +1,677 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+Timing scripts for the bulk operations on the model, run on synthetic data.
+Run this file to print the results, e.g.:
+
+    python benchmarks.py export 100000
+"""
+import datetime
+import io
+import multiprocessing
+import os
+import pickle
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from array import array
+from asyncfeed import AsyncEventServer, generate_load
+from application import create_customers, new_month, process_event_history
+from billexport import export_bills
+from billing import MonthlyBatch
+from call import Call, parse_time
+from callbitmap import CallIndex
+from callgraph import CallGraph
+from callstore import SharedCallStore
+from customer import Customer
+from filtercache import FilterCache
+from filter import CustomerFilter, DurationFilter, LocationFilter, \
+    MonthFilter, QueryFilter, ResetFilter, apply_by_month, apply_shared
+from liveingest import LiveIngestor
+from monthindex import MonthIndex
+from queryserver import QueryServer
+from snapshot import SnapshotPublisher
+from smslog import SMSLog
+
+CONTRACT_TYPES = ['mtm', 'term', 'prepaid']
+
+
+def synthetic_log(num_customers: int, lines_per_customer: int = 2) \
+        -> dict[str, list[dict]]:
+    """ Return an input dictionary with <num_customers> customers owning
+    <lines_per_customer> lines each, with contracts of every type and no
+    events.
+    """
+    customers = []
+    for i in range(num_customers):
+        lines = []
+        for j in range(lines_per_customer):
+            n = i * lines_per_customer + j
+            lines.append({'number': f'{n // 10000:03d}-{n % 10000:04d}',
+                          'contract': CONTRACT_TYPES[n % 3]})
+        customers.append({'id': i, 'lines': lines})
+    return {'events': [], 'customers': customers}
+
+
+def synthetic_customers(num_customers: int, months: int = 12,
+                        lazy_bills: bool = False) -> list[Customer]:
+    """ Return <num_customers> synthetic customers advanced through <months>
+    billing cycles starting in January 2018.
+    """
+    customers = create_customers(synthetic_log(num_customers), lazy_bills)
+    for m in range(months):
+        new_month(customers, m % 12 + 1, 2018 + m // 12)
+    return customers
+
+
+def bench_export(num_customers: int) -> None:
+    """ Time the bulk bill export of <num_customers> synthetic customers with
+    12 months of bills, in both formats and with 1 and 4 processes.
+    """
+    customers = synthetic_customers(num_customers)
+    for fmt in ['csv', 'jsonl']:
+        for processes in [1, 4]:
+            out = io.StringIO()
+            t1 = time.perf_counter()
+            rows = export_bills(customers, out, fmt, processes=processes)
+            elapsed = time.perf_counter() - t1
+            print(f'export {fmt:5} processes={processes}: {rows} bills in '
+                  f'{elapsed:.2f}s, {rows / elapsed:,.0f} bills/s, '
+                  f'{num_customers / elapsed:,.0f} customers/s, '
+                  f'1M customers ~{1000000 / num_customers * elapsed:.0f}s')
+
+
+def _synthetic_month(num_calls: int) \
+        -> tuple[list[Customer], list[Call]]:
+    """ Return 100 synthetic customers with 3 lines each and <num_calls>
+    calls made from their lines in January 2018, with random durations.
+    """
+    customers = create_customers(synthetic_log(100, 3))
+    numbers = [n for c in customers for n in c.get_phone_numbers()]
+    rng = random.Random(148)
+    calls = []
+    for i in range(num_calls):
+        calls.append(Call(numbers[i % len(numbers)], numbers[0],
+                          datetime.datetime(2018, 1, 1 + i * 30 // num_calls),
+                          rng.randint(1, 1800), (-79.5, 43.7),
+                          (-79.4, 43.6)))
+    return customers, calls
+
+
+def bench_billing(num_calls: int) -> None:
+    """ Time the billing of <num_calls> calls over 300 lines in one month,
+    call by call with Contract.bill_call() and in a batch with MonthlyBatch.
+    """
+    customers, calls = _synthetic_month(num_calls)
+    lines = {}
+    for c in customers:
+        for nid in c.get_number_ids():
+            lines[nid] = c.get_phone_line(nid)
+
+    new_month(customers, 1, 2018)
+    t1 = time.perf_counter()
+    for call in calls:
+        lines[call.src_id].contract.bill_call(call)
+    per_call = time.perf_counter() - t1
+    expected = [c.generate_bill(1, 2018) for c in customers]
+
+    customers, _ = _synthetic_month(0)
+    lines = {}
+    for c in customers:
+        for nid in c.get_number_ids():
+            lines[nid] = c.get_phone_line(nid)
+    new_month(customers, 1, 2018)
+    t1 = time.perf_counter()
+    batch = MonthlyBatch()
+    for call in calls:
+        batch.add_call(lines[call.src_id], call.duration)
+    t2 = time.perf_counter()
+    batch.bill()
+    t3 = time.perf_counter()
+
+    same = expected == [c.generate_bill(1, 2018) for c in customers]
+    print(f'billing {num_calls} calls: per call {per_call:.3f}s '
+          f'({num_calls / per_call:,.0f} calls/s); batch {t3 - t1:.3f}s '
+          f'({num_calls / (t3 - t1):,.0f} calls/s) = collect {t2 - t1:.3f}s '
+          f'+ bill {t3 - t2:.3f}s; identical bills: {same}')
+
+
+def _sparse_billing(num_customers: int, lazy_bills: bool) \
+        -> list[Customer]:
+    """ Return <num_customers> synthetic customers advanced through 12 months,
+    in which only 1 line in 20 makes calls each month.
+    """
+    customers = create_customers(synthetic_log(num_customers), lazy_bills)
+    lines = [c.get_phone_line(n) for c in customers
+             for n in c.get_phone_numbers()]
+    rng = random.Random(148)
+    for month in range(1, 13):
+        new_month(customers, month, 2018)
+        batch = MonthlyBatch()
+        for line in rng.sample(lines, len(lines) // 20):
+            batch.add_calls(line, [rng.randint(1, 1800) for _ in range(5)])
+        batch.bill()
+    return customers
+
+
+def bench_lazy_bills(num_customers: int) -> None:
+    """ Measure the memory used by the bills of <num_customers> synthetic
+    customers over 12 months, where 1 line in 20 is active each month, with
+    and without lazy bills.
+    """
+    sizes = {}
+    for lazy_bills in [False, True]:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        t1 = time.perf_counter()
+        customers = _sparse_billing(num_customers, lazy_bills)
+        elapsed = time.perf_counter() - t1
+        sizes[lazy_bills] = tracemalloc.get_traced_memory()[0] - base
+        tracemalloc.stop()
+        print(f'lazy_bills={lazy_bills}: {sizes[lazy_bills] / 2 ** 20:.1f} '
+              f'MiB for {num_customers} customers, built in {elapsed:.2f}s')
+        summaries = [c.generate_bill(m, 2018) for c in customers
+                     for m in range(1, 13)]
+        if lazy_bills:
+            print('identical bills:', summaries == eager_summaries)
+        eager_summaries = summaries
+        del customers
+    print(f'saved {1 - sizes[True] / sizes[False]:.0%}')
+
+
+def synthetic_events(numbers: list[str], num_events: int,
+                     sms_share: float = 0.0) -> list[dict]:
+    """ Return <num_events> chronologically ordered events between the
+    phone numbers <numbers>, spread over the 12 months of 2018. A share
+    <sms_share> of them are SMSs, and the others are calls.
+    """
+    rng = random.Random(148)
+    start = datetime.datetime(2018, 1, 1)
+    step = 365 * 86400 / num_events
+    events = []
+    for i in range(num_events):
+        calltime = start + datetime.timedelta(seconds=int(i * step))
+        event = {'type': 'call',
+                 'src_number': rng.choice(numbers),
+                 'dst_number': rng.choice(numbers),
+                 'time': calltime.strftime('%Y-%m-%d %H:%M:%S'),
+                 'src_loc': [-79.5, 43.7], 'dst_loc': [-79.4, 43.6]}
+        if rng.random() < sms_share:
+            event['type'] = 'sms'
+        else:
+            event['duration'] = rng.randint(1, 1800)
+        events.append(event)
+    return events
+
+
+def bench_ingest(num_calls: int) -> None:
+    """ Time the ingestion of <num_calls> calls made by 1000 synthetic
+    customers over 2018, and measure the memory traced per call (which
+    leaves out the pygame sprites). Then time
+    parsing the call times alone, into datetimes and into packed times, and
+    compare the size of both.
+    """
+    log = synthetic_log(1000)
+    numbers = [line['number'] for cust in log['customers']
+               for line in cust['lines']]
+    log['events'] = synthetic_events(numbers, num_calls)
+
+    t1 = time.perf_counter()
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    elapsed = time.perf_counter() - t1
+
+    # tracing slows allocations down, so measure the memory in another run
+    del customers
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    size = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    print(f'ingest {num_calls} calls: {elapsed:.2f}s '
+          f'({num_calls / elapsed:,.0f} calls/s), '
+          f'{size / num_calls:.0f} B traced per call')
+
+    texts = [event['time'] for event in log['events']]
+    t1 = time.perf_counter()
+    stamps = [datetime.datetime.strptime(t, '%Y-%m-%d %H:%M:%S')
+              for t in texts]
+    t2 = time.perf_counter()
+    packed = [parse_time(t) for t in texts]
+    t3 = time.perf_counter()
+    print(f'parse times: datetime {t2 - t1:.3f}s '
+          f'({sys.getsizeof(stamps[-1])} B each), packed {t3 - t2:.3f}s '
+          f'({sys.getsizeof(packed[-1])} B each)')
+
+
+def bench_sms(num_events: int) -> None:
+    """ Time the ingestion of <num_events> events of 1000 synthetic
+    customers, half of them SMSs, when the SMSs are counted and billed, also
+    stored in an SMSLog, or skipped like unknown events.
+    """
+    log = synthetic_log(1000)
+    numbers = [line['number'] for cust in log['customers']
+               for line in cust['lines']]
+    events = synthetic_events(numbers, num_events, 0.5)
+    num_sms = sum(event['type'] == 'sms' for event in events)
+    skipped = [dict(event, type='skipped') if event['type'] == 'sms'
+               else event for event in events]
+
+    times = {}
+    for name, run_events, sms_log in [('skipped', skipped, None),
+                                      ('counted', events, None),
+                                      ('stored', events, SMSLog())]:
+        log['events'] = run_events
+        customers = create_customers(log)
+        t1 = time.perf_counter()
+        process_event_history(log, customers, sms_log)
+        times[name] = time.perf_counter() - t1
+        print(f'SMSs {name}: {times[name]:.2f}s for {num_events} events')
+    for name in ['counted', 'stored']:
+        print(f'cost per SMS {name}: '
+              f'{(times[name] - times["skipped"]) / num_sms * 1e6:.2f} us')
+
+
+def bench_graph(num_calls: int) -> None:
+    """ Time building the call graph of <num_calls> calls between 1000
+    synthetic customers, and its neighbour, degree and two-hop queries,
+    against a scan of every call for the neighbours of each number.
+    """
+    log = synthetic_log(1000)
+    numbers = [line['number'] for cust in log['customers']
+               for line in cust['lines']]
+    # Each number only calls the next 10 numbers, so that the graph is sparse
+    positions = {number: i for i, number in enumerate(numbers)}
+    rng = random.Random(148)
+    for event in synthetic_events(numbers, num_calls):
+        position = positions[event['src_number']] + rng.randint(1, 10)
+        event['dst_number'] = numbers[position % len(numbers)]
+        log['events'].append(event)
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    calls = [call for customer in customers
+             for call in customer.get_history()[0]]
+
+    t1 = time.perf_counter()
+    graph = CallGraph.from_customers(customers)
+    t2 = time.perf_counter()
+    print(f'graph build: {t2 - t1:.3f}s for {num_calls} calls')
+
+    for name, query in [('neighbours', graph.get_neighbour_ids),
+                        ('degree', graph.get_degree),
+                        ('two-hop', graph.get_two_hop_ids)]:
+        t1 = time.perf_counter()
+        for number in numbers:
+            query(number)
+        t2 = time.perf_counter()
+        print(f'{name}: {(t2 - t1) / len(numbers) * 1e6:.1f} us per number')
+
+    t1 = time.perf_counter()
+    for number in numbers[:20]:
+        {call.dst_number for call in calls if call.src_number == number} \
+            | {call.src_number for call in calls if call.dst_number == number}
+    t2 = time.perf_counter()
+    print(f'neighbours by scanning: {(t2 - t1) / 20 * 1e6:.1f} us per number')
+
+
+def bench_async(num_events: int) -> None:
+    """ Time the ingestion of <num_events> events of 1000 synthetic
+    customers, a fifth of them SMSs, sent by 4 producers to an
+    AsyncEventServer, and report its throughput and largest queue depths.
+    """
+    log = synthetic_log(1000)
+    numbers = [line['number'] for cust in log['customers']
+               for line in cust['lines']]
+    events = synthetic_events(numbers, num_events, 0.2)
+    ingestor = LiveIngestor(create_customers(log))
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = AsyncEventServer(os.path.join(directory, 'events.sock'),
+                                  ingestor)
+        server.start()
+        t1 = time.perf_counter()
+        producers = threading.Thread(
+            target=generate_load, args=(server.get_address(), events))
+        producers.start()
+        max_events = max_batches = 0
+        while producers.is_alive() or \
+                ingestor.processed + ingestor.rejected < server.received:
+            server.poll()
+            metrics = server.get_metrics()
+            max_events = max(max_events, metrics['queued_events'])
+            max_batches = max(max_batches, metrics['queued_batches'])
+            time.sleep(0.001)
+        t2 = time.perf_counter()
+        server.stop()
+
+    print(f'async ingest: {t2 - t1:.2f}s for {num_events} events, '
+          f'{num_events / (t2 - t1):.0f} events/s')
+    print(f'processed {ingestor.processed}, rejected as late '
+          f'{ingestor.rejected}')
+    print(f'largest queues: {max_events} events, {max_batches} batches')
+
+
+def bench_query(num_requests: int) -> None:
+    """ Load-test a QueryServer over 1000 synthetic customers with 100000
+    calls: 8 client threads send <num_requests> bill, filter and history
+    queries in total, while another thread keeps ingesting live events.
+    Report the requests per second and the cache hit rate.
+    """
+    log = synthetic_log(1000)
+    numbers = [line['number'] for cust in log['customers']
+               for line in cust['lines']]
+    events = synthetic_events(numbers, 110000)
+    log['events'] = events[:100000]
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    ingestor = LiveIngestor(customers)
+    server = QueryServer(customers)
+    server.start()
+
+    rng = random.Random(148)
+    ids = [cust['id'] for cust in log['customers']]
+    queries = []
+    for _ in range(num_requests):
+        kind = rng.randrange(3)
+        if kind == 0:
+            queries.append(f'/bill?customer={rng.choice(ids)}'
+                           f'&month={rng.randint(1, 12)}&year=2018')
+        elif kind == 1:
+            queries.append(f'/calls?customer={rng.choice(ids[:50])}'
+                           f'&duration=G{rng.choice([60, 600, 1200])}'
+                           f'&limit=10')
+        else:
+            queries.append(f'/history?number={rng.choice(numbers)}'
+                           f'&start=2018-03-01&end=2018-03-31')
+
+    def _ingest() -> None:
+        """ Ingest the remaining events in small batches """
+        for i in range(100000, len(events), 100):
+            with server.writing():
+                ingestor.process(events[i:i + 100])
+            time.sleep(0.01)
+
+    def _client(start: int) -> None:
+        """ Send every 8th query from <start> """
+        url = f'http://localhost:{server.get_port()}'
+        for query in queries[start::8]:
+            with urllib.request.urlopen(url + query) as response:
+                response.read()
+
+    writer = threading.Thread(target=_ingest)
+    clients = [threading.Thread(target=_client, args=(i,)) for i in range(8)]
+    t1 = time.perf_counter()
+    writer.start()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    t2 = time.perf_counter()
+    writer.join()
+    server.stop()
+
+    print(f'queries: {num_requests / (t2 - t1):.0f} requests/s, '
+          f'{server.cache_hits / server.requests:.0%} cache hits, '
+          f'{ingestor.processed} events ingested meanwhile')
+
+
+def bench_snapshot(num_calls: int) -> None:
+    """ Time publishing a snapshot of 1000 synthetic customers with
+    <num_calls> calls, then publishing again after each of 10 batches of 100
+    live events, which only copies the lines that the batch touched.
+    """
+    log = synthetic_log(1000)
+    numbers = [line['number'] for cust in log['customers']
+               for line in cust['lines']]
+    events = synthetic_events(numbers, num_calls + 1000)
+    log['events'] = events[:num_calls]
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    ingestor = LiveIngestor(customers)
+    publisher = SnapshotPublisher(customers)
+
+    t1 = time.perf_counter()
+    publisher.publish()
+    t2 = time.perf_counter()
+    print(f'first snapshot: {t2 - t1:.3f}s for {num_calls} calls')
+
+    elapsed = 0.0
+    for i in range(num_calls, num_calls + 1000, 100):
+        ingestor.process(events[i:i + 100])
+        t1 = time.perf_counter()
+        publisher.publish()
+        elapsed += time.perf_counter() - t1
+    print(f'snapshot after 100 events: {elapsed / 10 * 1000:.1f} ms')
+
+
+def bench_shared(num_calls: int) -> None:
+    """ Time filtering <num_calls> calls between 1000 synthetic customers by
+    duration and location with apply(), against matching the columns of a
+    SharedCallStore in this process and in a pool of 2 processes, and print
+    the bytes sent to the pool.
+    """
+    log = synthetic_log(1000)
+    numbers = [line['number'] for cust in log['customers']
+               for line in cust['lines']]
+    log['events'] = synthetic_events(numbers, num_calls)
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    calls = [call for customer in customers
+             for call in customer.get_history()[0]]
+    queries = [(DurationFilter(), 'L300'),
+               (LocationFilter(), '-79.6, 43.6, -79.3, 43.7')]
+
+    t1 = time.perf_counter()
+    store = SharedCallStore.create(calls)
+    indices = array('l', range(len(calls)))
+    t2 = time.perf_counter()
+    print(f'store: {t2 - t1:.3f}s for {len(calls)} calls')
+
+    with multiprocessing.Pool(2) as pool:
+        pool.map(abs, range(2))
+        for f, filter_string in queries:
+            t1 = time.perf_counter()
+            expected = f.apply(customers, calls, filter_string)
+            t2 = time.perf_counter()
+            found = apply_shared(f, customers, calls, store, indices,
+                                 filter_string)
+            t3 = time.perf_counter()
+            pooled = apply_shared(f, customers, calls, store, indices,
+                                  filter_string, pool)
+            t4 = time.perf_counter()
+            assert [calls[i] for i in pooled] == expected == \
+                [calls[i] for i in found]
+            print(f'{type(f).__name__}: apply {t2 - t1:.3f}s, '
+                  f'store {t3 - t2:.3f}s, pool of 2 {t4 - t3:.3f}s')
+    # the calls themselves hold Surfaces, which cannot be pickled at all
+    print(f'sent to the pool: {len(pickle.dumps(indices))} bytes of indices')
+    store.close()
+    store.unlink()
+
+
+def bench_planner(num_calls: int) -> None:
+    """ Time applying the customer, duration and location filters one after
+    the other to <num_calls> calls between 1000 synthetic customers, against
+    the same criteria in a single QueryFilter, in the order written and with
+    the most selective last.
+    """
+    log = synthetic_log(1000)
+    numbers = [line['number'] for cust in log['customers']
+               for line in cust['lines']]
+    log['events'] = synthetic_events(numbers, num_calls)
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    calls = [call for customer in customers
+             for call in customer.get_history()[0]]
+    cid = customers[0].get_id()
+
+    t1 = time.perf_counter()
+    expected = CustomerFilter().apply(customers, calls, str(cid))
+    expected = DurationFilter().apply(customers, expected, 'G120')
+    expected = LocationFilter().apply(customers, expected,
+                                      '-79.6, 43.6, -79.3, 43.7')
+    t2 = time.perf_counter()
+    print(f'filters one after the other: {t2 - t1:.3f}s')
+
+    for query in [f'customer={cid} AND duration>120 AND '
+                  f'bbox(-79.6, 43.6, -79.3, 43.7)',
+                  f'bbox(-79.6, 43.6, -79.3, 43.7) AND duration>120 AND '
+                  f'customer={cid}']:
+        t1 = time.perf_counter()
+        found = QueryFilter().apply(customers, calls, query)
+        t2 = time.perf_counter()
+        assert found == expected
+        print(f'query "{query[:30]}...": {t2 - t1:.3f}s')
+
+    t1 = time.perf_counter()
+    DurationFilter().apply(customers, LocationFilter().apply(
+        customers, calls, '-79.6, 43.6, -79.3, 43.7'), 'G120')
+    t2 = time.perf_counter()
+    QueryFilter().apply(customers, calls,
+                        'bbox(-79.6, 43.6, -79.3, 43.7) AND duration>120')
+    t3 = time.perf_counter()
+    print(f'location then duration: filters {t2 - t1:.3f}s, '
+          f'query {t3 - t2:.3f}s')
+
+
+def bench_filter_cache(num_calls: int) -> None:
+    """ Time applying customer and location filters to <num_calls> calls
+    between 1000 synthetic customers, for 20 filter strings used 5 times
+    each in a random order, with and without a FilterCache.
+    """
+    log = synthetic_log(1000)
+    numbers = [line['number'] for cust in log['customers']
+               for line in cust['lines']]
+    log['events'] = synthetic_events(numbers, num_calls)
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    calls = [call for customer in customers
+             for call in customer.get_history()[0]]
+    queries = [(CustomerFilter(), str(customer.get_id()))
+               for customer in customers[:10]]
+    queries += [(LocationFilter(), f'-79.6, 43.6, -79.{i}, 43.7')
+                for i in range(3, 13)]
+    queries *= 5
+    random.Random(148).shuffle(queries)
+
+    t1 = time.perf_counter()
+    for f, filter_string in queries:
+        f.apply(customers, calls, filter_string)
+    t2 = time.perf_counter()
+    cache = FilterCache()
+    for f, filter_string in queries:
+        cache.apply(f, customers, calls, filter_string)
+    t3 = time.perf_counter()
+    print(f'{len(queries)} filters: {t2 - t1:.3f}s uncached, '
+          f'{t3 - t2:.3f}s cached ({cache.hits} hits, '
+          f'{cache.misses} misses)')
+
+
+def bench_bitmaps(num_calls: int) -> None:
+    """ Time combining the results of duration, location and customer
+    filters on <num_calls> calls between 1000 synthetic customers with AND,
+    OR and NOT, as lists of calls and as bitmaps.
+    """
+    log = synthetic_log(1000)
+    numbers = [line['number'] for cust in log['customers']
+               for line in cust['lines']]
+    log['events'] = synthetic_events(numbers, num_calls)
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    calls = ResetFilter().apply(customers, [], '')
+    specs = [(DurationFilter(), 'L300'),
+             (LocationFilter(), '-79.6, 43.6, -79.3, 43.7'),
+             (CustomerFilter(), str(customers[0].get_id()))]
+
+    t1 = time.perf_counter()
+    lists = [f.apply(customers, calls, s) for f, s in specs]
+    t2 = time.perf_counter()
+    index = CallIndex(calls)
+    everything = index.get_all()
+    bitmaps = [f.apply_bitmap(customers, everything, s) for f, s in specs]
+    t3 = time.perf_counter()
+    print(f'filters: {t2 - t1:.3f}s as lists, {t3 - t2:.3f}s as bitmaps, '
+          f'including the index')
+
+    # (duration AND location) OR customer, then NOT
+    t1 = time.perf_counter()
+    located = set(lists[1])
+    kept = set(call for call in lists[0] if call in located) | set(lists[2])
+    combined = [call for call in calls if call not in kept]
+    t2 = time.perf_counter()
+    bitmap = ~((bitmaps[0] & bitmaps[1]) | bitmaps[2])
+    t3 = time.perf_counter()
+    assert bitmap.to_calls() == combined
+    t4 = time.perf_counter()
+    print(f'AND, OR, NOT: {t2 - t1:.4f}s as lists, {t3 - t2:.6f}s as '
+          f'bitmaps, {t4 - t3:.4f}s to list the {len(bitmap)} calls')
+
+
+def bench_months(num_calls: int) -> None:
+    """ Time selecting one month of <num_calls> calls over a year between
+    1000 synthetic customers, and applying a duration filter to each month,
+    by scanning every call and from a MonthIndex.
+    """
+    log = synthetic_log(1000)
+    numbers = [line['number'] for cust in log['customers']
+               for line in cust['lines']]
+    log['events'] = synthetic_events(numbers, num_calls)
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    calls = ResetFilter().apply(customers, [], '')
+    month, duration = MonthFilter(), DurationFilter()
+
+    t1 = time.perf_counter()
+    index = MonthIndex(calls)
+    t2 = time.perf_counter()
+    scanned = month.apply(customers, calls, '2018-06')
+    t3 = time.perf_counter()
+    indexed = month.apply_index(index, '2018-06')
+    t4 = time.perf_counter()
+    assert indexed == scanned
+    print(f'index: {t2 - t1:.3f}s; one month: {t3 - t2:.4f}s scanned, '
+          f'{t4 - t3:.4f}s from the index ({len(indexed)} calls)')
+
+    t1 = time.perf_counter()
+    scanned = [duration.apply(customers,
+                              month.apply(customers, calls, f'2018-{m:02d}'),
+                              'G600')
+               for m in range(1, 13)]
+    t2 = time.perf_counter()
+    indexed = [result for _, result in
+               apply_by_month(duration, customers, index, 'G600')]
+    t3 = time.perf_counter()
+    assert indexed == scanned
+    print(f'duration per month: {t2 - t1:.3f}s scanned, '
+          f'{t3 - t2:.3f}s by partition')
+
+
+BENCHMARKS = {'export': bench_export, 'billing': bench_billing,
+              'lazy_bills': bench_lazy_bills, 'ingest': bench_ingest,
+              'sms': bench_sms, 'graph': bench_graph,
+              'async': bench_async, 'query': bench_query,
+              'snapshot': bench_snapshot, 'shared': bench_shared,
+              'planner': bench_planner, 'filter_cache': bench_filter_cache,
+              'bitmaps': bench_bitmaps, 'months': bench_months}
+
+if __name__ == '__main__':
+    name = sys.argv[1] if len(sys.argv) > 1 else 'export'
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    BENCHMARKS[name](size)
@@ -13,6 +13,30 @@ Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
 """
 from typing import Union
 
+# Money is stored as an integer number of mills (thousandths of a dollar), so
+# that per-minute rates such as $0.025 are exact and sums never drift
+MILLS_PER_DOLLAR = 1000
+
+
+def to_mills(amount: float) -> int:
+    """ Return the dollar <amount> as the nearest integer number of mills.
+
+    >>> to_mills(0.025)
+    25
+    >>> to_mills(-29.925)
+    -29925
+    """
+    return round(amount * MILLS_PER_DOLLAR)
+
+
+def to_dollars(mills: int) -> float:
+    """ Return the amount of <mills> mills in dollars.
+
+    >>> to_dollars(50050)
+    50.05
+    """
+    return mills / MILLS_PER_DOLLAR
+
 
 class Bill:
     """ A single month's bill for a customer's phone line.
@@ -21,22 +45,33 @@ class Bill:
     corresponding cost per call.
     - The billable minutes and the free minutes are incrementally updated as
     calls are loaded from the historic data.
-    - The billing rate per call and the fixed monthly cost depend on the type
-    of contract.
+    - The billable and free SMSs sent are counted in the same way.
+    - The billing rates per call and per SMS and the fixed monthly cost depend
+    on the type of contract.
 
     The bill does not store the amount due. Instead, the amount due can be
     computed on demand by the get_cost() method.
 
+    Amounts of money are stored as integers in mills, and are also available
+    in dollars through the <min_rate> and <fixed_cost> properties.
+
     === Public Attributes ===
     billed_min:
          number of billable minutes used in the month associated with this bill.
     free_min:
          number of non-billable minutes used in the month associated with this
          bill.
-    min_rate:
-         cost for one minute of calling
-    fixed_cost:
-         fixed costs for the bill (e.g., fixed monthly cost of the
+    billed_sms:
+         number of billable SMSs sent in the month associated with this bill.
+    free_sms:
+         number of non-billable SMSs sent in the month associated with this
+         bill.
+    min_rate_mills:
+         cost in mills for one minute of calling
+    sms_rate_mills:
+         cost in mills for one billable SMS
+    fixed_cost_mills:
+         fixed costs in mills for the bill (e.g., fixed monthly cost of the
          contract, term deposits, etc.)
     type:
          type of contract
@@ -44,13 +79,20 @@ class Bill:
     === Representation Invariants ===
     -   billed_min >= 0
     -   free_min >= 0
-    -   min_rate >= 0
-    -   type: "" | "MTM" | "TERM" | "PREPAID"
+    -   billed_sms >= 0
+    -   free_sms >= 0
+    -   min_rate_mills >= 0
+    -   sms_rate_mills >= 0
+    -   type: "" | "MTM" | "TERM" | "PREPAID" | the bill type of another
+        registered rate plan
     """
     billed_min: int
     free_min: int
-    min_rate: float
-    fixed_cost: float
+    billed_sms: int
+    free_sms: int
+    min_rate_mills: int
+    sms_rate_mills: int
+    fixed_cost_mills: int
     type: str
 
     def __init__(self) -> None:
@@ -58,22 +100,66 @@ class Bill:
         """
         self.billed_min = 0
         self.free_min = 0
-        self.fixed_cost = 0
-        self.min_rate = 0
+        self.billed_sms = 0
+        self.free_sms = 0
+        self.fixed_cost_mills = 0
+        self.min_rate_mills = 0
+        self.sms_rate_mills = 0
         self.type = ""
 
+    @property
+    def min_rate(self) -> float:
+        """ The cost in dollars for one minute of calling
+        """
+        return to_dollars(self.min_rate_mills)
+
+    @min_rate.setter
+    def min_rate(self, value: float) -> None:
+        """ Set the cost for one minute of calling to <value> dollars
+        """
+        self.min_rate_mills = to_mills(value)
+
+    @property
+    def fixed_cost(self) -> float:
+        """ The fixed costs in dollars for the bill
+        """
+        return to_dollars(self.fixed_cost_mills)
+
+    @fixed_cost.setter
+    def fixed_cost(self, value: float) -> None:
+        """ Set the fixed costs for the bill to <value> dollars
+        """
+        self.fixed_cost_mills = to_mills(value)
+
     def set_rates(self, contract_type: str, min_cost: float) \
             -> None:
         """ Set this Bill's contract type to <contract_type>.
-        Set this Bill's calling rate to <min_cost>.
+        Set this Bill's calling rate to <min_cost> dollars.
+        """
+        self.type = contract_type
+        self.min_rate_mills = to_mills(min_cost)
+
+    def set_rates_mills(self, contract_type: str, min_cost: int) -> None:
+        """ Set this Bill's contract type to <contract_type>.
+        Set this Bill's calling rate to <min_cost> mills.
         """
         self.type = contract_type
-        self.min_rate = min_cost
+        self.min_rate_mills = min_cost
+
+    def set_sms_rate_mills(self, sms_cost: int) -> None:
+        """ Set this Bill's rate per billable SMS to <sms_cost> mills.
+        """
+        self.sms_rate_mills = sms_cost
 
     def add_fixed_cost(self, cost: float) -> None:
-        """ Add a fixed one-time cost <cost> onto the bill.
+        """ Add a fixed one-time cost of <cost> dollars onto the bill.
         """
-        self.fixed_cost += cost
+        self.fixed_cost_mills += to_mills(cost)
+
+    def add_fixed_cost_mills(self, cost: int) -> None:
+        """ Add a fixed one-time cost of <cost> mills onto the bill.
+        """
+        self.fixed_cost_mills += cost
 
     def add_billed_minutes(self, minutes: int) -> None:
         """ Add <minutes> minutes as billable minutes
@@ -85,11 +171,27 @@ class Bill:
         """
         self.free_min += minutes
 
+    def add_billed_sms(self, count: int) -> None:
+        """ Add <count> SMSs as billable SMSs
+        """
+        self.billed_sms += count
+
+    def add_free_sms(self, count: int) -> None:
+        """ Add <count> SMSs as free SMSs
+        """
+        self.free_sms += count
+
     def get_cost(self) -> float:
         """ Return bill amount, considering the rates for billable calls for
         this Bill's contract type.
         """
-        return self.min_rate * self.billed_min + self.fixed_cost
+        return to_dollars(self.get_cost_mills())
+
+    def get_cost_mills(self) -> int:
+        """ Return the bill amount in mills, as an exact integer.
+        """
+        return self.min_rate_mills * self.billed_min \
+            + self.sms_rate_mills * self.billed_sms + self.fixed_cost_mills
 
     # ----------------------------------------------------------
     # NOTE: You do not need to understand the implementation of
@@ -105,10 +207,30 @@ class Bill:
                         'free_mins': self.free_min,
                         'billed_mins': self.billed_min,
                         'min_rate': self.min_rate,
+                        'free_sms': self.free_sms,
+                        'billed_sms': self.billed_sms,
+                        'sms_rate': to_dollars(self.sms_rate_mills),
                         'total': self.get_cost()
                         }
         return bill_summary
 
+    def get_summary_mills(self) -> dict[str, Union[int, str]]:
+        """ Return a bill summary like get_summary(), with the amounts of
+        money ("fixed", "min_rate", "sms_rate" and "total") as integers in
+        mills.
+        """
+        bill_summary = {'type': self.type,
+                        'fixed': self.fixed_cost_mills,
+                        'free_mins': self.free_min,
+                        'billed_mins': self.billed_min,
+                        'min_rate': self.min_rate_mills,
+                        'free_sms': self.free_sms,
+                        'billed_sms': self.billed_sms,
+                        'sms_rate': self.sms_rate_mills,
+                        'total': self.get_cost_mills()
+                        }
+        return bill_summary
+
 
 if __name__ == '__main__':
     import python_ta
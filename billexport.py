@@ -0,0 +1,215 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains functions for exporting the bills of every customer, for
+every month or for a single billing cycle, to CSV or JSON Lines files. The
+running usage statistics of every phone line can be exported in the same
+formats.
+
+Rows are produced and written customer by customer, so memory use does not
+grow with the size of the customer base. The formatting work can optionally be
+spread over a pool of processes.
+"""
+import csv
+import io
+import json
+import multiprocessing
+from typing import Iterator, Optional, TextIO, Union
+from customer import Customer
+
+# Columns of an exported bill row, in order
+BILL_FIELDS = ['customer', 'number', 'month', 'year', 'type', 'fixed',
+               'free_mins', 'billed_mins', 'min_rate', 'free_sms',
+               'billed_sms', 'sms_rate', 'total']
+
+# Columns of an exported usage statistics row, in order; "direction" is "out"
+# or "in", and "top" lists the most frequent other numbers as "number:count"
+# pairs separated by spaces
+USAGE_FIELDS = ['customer', 'number', 'direction', 'count', 'total', 'mean',
+                'max', 'median', 'top']
+
+# Supported export formats
+FORMATS = ('csv', 'jsonl')
+
+# Number of customers formatted by a worker process at a time
+CUSTOMERS_PER_TASK = 2000
+
+# The customers being exported by a process pool. Worker processes are forked
+# after it is set, so they inherit it instead of receiving pickled customers.
+_export_customers: list[Customer] = []
+
+
+def iter_bill_rows(customers: list[Customer], month: int = None,
+                   year: int = None) -> Iterator[dict]:
+    """ Yield one row per bill of every phone line of <customers>, customer
+    by customer. Each row is a dictionary with the keys in BILL_FIELDS.
+
+    If <month> and <year> are provided, only yield the bills for that billing
+    cycle.
+    """
+    for customer in customers:
+        cid = customer.get_id()
+        for bill_month, bill_year, summary in customer.iter_line_bills(month,
+                                                                       year):
+            row = {'customer': cid, 'month': bill_month, 'year': bill_year}
+            row.update(summary)
+            yield row
+
+
+def iter_usage_rows(customers: list[Customer], top: int = 3) \
+        -> Iterator[dict]:
+    """ Yield two rows per phone line of <customers>, with the running
+    statistics of its outgoing and incoming calls, customer by customer. Each
+    row is a dictionary with the keys in USAGE_FIELDS, where "top" lists the
+    <top> most frequent other numbers.
+    """
+    for customer in customers:
+        cid = customer.get_id()
+        for number in customer.get_phone_numbers():
+            stats = customer.get_phone_line(number).get_usage_stats()
+            for direction, line_stats in zip(['out', 'in'], stats):
+                row = {'customer': cid, 'number': number,
+                       'direction': direction}
+                row.update(line_stats.get_summary(top))
+                row['top'] = ' '.join(f'{other}:{count}'
+                                      for other, count in row['top'])
+                yield row
+
+
+def _format_rows(rows: Iterator[dict], fmt: str,
+                 fields: list[str] = None) -> tuple[str, int]:
+    """ Return the <rows> formatted as <fmt> text without a header, and the
+    number of rows. The columns are <fields>, or BILL_FIELDS if <fields> is
+    None.
+    """
+    if fields is None:
+        fields = BILL_FIELDS
+    buffer = io.StringIO()
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(buffer, lineterminator='\n')
+        for row in rows:
+            writer.writerow([row[field] for field in fields])
+            count += 1
+    else:
+        for row in rows:
+            buffer.write(json.dumps({field: row[field] for field in fields}))
+            buffer.write('\n')
+            count += 1
+    return buffer.getvalue(), count
+
+
+def _format_customer_range(task: tuple[int, int, str, Optional[int],
+                                       Optional[int]]) -> tuple[str, int]:
+    """ Format the bills of the inherited customers at positions
+    [start, end), for a worker process. <task> is (start, end, format, month,
+    year).
+    """
+    start, end, fmt, month, year = task
+    return _format_rows(iter_bill_rows(_export_customers[start:end], month,
+                                       year), fmt)
+
+
+def export_bills(customers: list[Customer], out: Union[str, TextIO],
+                 fmt: str = 'csv', month: int = None, year: int = None,
+                 processes: int = 1) -> int:
+    """ Write the bills of every phone line of <customers> to <out>, a file
+    name or an open text file, in the format <fmt> ("csv" with a header row,
+    or "jsonl" with one JSON object per line). Return the number of bills
+    written.
+
+    If <month> and <year> are provided, only export that billing cycle.
+
+    If <processes> is more than 1, customers are formatted in batches of
+    CUSTOMERS_PER_TASK by that many forked worker processes and written in
+    their original order. Where processes cannot be forked, the export runs
+    in this process.
+
+    Precondition:
+    - fmt in FORMATS
+    """
+    if isinstance(out, str):
+        with open(out, 'w', newline='') as f:
+            return export_bills(customers, f, fmt, month, year, processes)
+
+    if fmt == 'csv':
+        out.write(','.join(BILL_FIELDS) + '\n')
+
+    if processes <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        total = 0
+        for start in range(0, len(customers), CUSTOMERS_PER_TASK):
+            text, count = _format_rows(
+                iter_bill_rows(customers[start:start + CUSTOMERS_PER_TASK],
+                               month, year), fmt)
+            out.write(text)
+            total += count
+        return total
+
+    global _export_customers
+    _export_customers = customers
+    tasks = [(start, start + CUSTOMERS_PER_TASK, fmt, month, year)
+             for start in range(0, len(customers), CUSTOMERS_PER_TASK)]
+    total = 0
+    try:
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            for text, count in pool.imap(_format_customer_range, tasks):
+                out.write(text)
+                total += count
+    finally:
+        _export_customers = []
+    return total
+
+
+def export_usage_stats(customers: list[Customer], out: Union[str, TextIO],
+                       fmt: str = 'csv', top: int = 3) -> int:
+    """ Write the usage statistics of every phone line of <customers> to
+    <out>, a file name or an open text file, in the format <fmt> like
+    export_bills(), with the <top> most frequent other numbers of each line.
+    Return the number of rows written.
+
+    The statistics are kept up to date during ingestion, so no call history
+    is scanned.
+
+    Precondition:
+    - fmt in FORMATS
+    """
+    if isinstance(out, str):
+        with open(out, 'w', newline='') as f:
+            return export_usage_stats(customers, f, fmt, top)
+
+    if fmt == 'csv':
+        out.write(','.join(USAGE_FIELDS) + '\n')
+    total = 0
+    for start in range(0, len(customers), CUSTOMERS_PER_TASK):
+        text, count = _format_rows(
+            iter_usage_rows(customers[start:start + CUSTOMERS_PER_TASK], top),
+            fmt, USAGE_FIELDS)
+        out.write(text)
+        total += count
+    return total
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'csv', 'io', 'json', 'multiprocessing',
+            'customer'
+        ],
+        'allowed-io': ['export_bills', 'export_usage_stats'],
+        'disable': ['W0603'],
+        'generated-members': 'pygame.*'
+    })
@@ -0,0 +1,102 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains the batch billing engine. Instead of billing every call as
+it is loaded, the engine collects the charged minutes of a month's outgoing
+calls for each phone line into compact integer arrays as the calls are added,
+and bills each line's whole month at once through Contract.bill_calls(). SMSs
+sent are counted per line and billed at once through Contract.bill_sms().
+
+The results written into the Bill objects are the same as with the call by
+call path of PhoneLine.make_call().
+"""
+from array import array
+from typing import Iterable
+from phoneline import PhoneLine
+
+
+class MonthlyBatch:
+    """ The outgoing calls of many phone lines for one monthly billing cycle,
+    waiting to be billed.
+    """
+    # === Private Attributes ===
+    # _minutes:
+    #     the number of minutes each call of a phone line is charged for, in
+    #     the order the calls were made
+    # _sms:
+    #     the number of SMSs sent by a phone line
+    _minutes: dict[PhoneLine, array]
+    _sms: dict[PhoneLine, int]
+
+    def __init__(self) -> None:
+        """ Create an empty batch.
+        """
+        self._minutes = {}
+        self._sms = {}
+
+    def add_call(self, line: PhoneLine, duration: int) -> None:
+        """ Add an outgoing call of <line> lasting <duration> seconds to this
+        batch.
+        """
+        minutes = self._minutes.get(line)
+        if minutes is None:
+            minutes = self._minutes[line] = array('l')
+        # ceil(duration / 60) in integer arithmetic
+        minutes.append(-(-duration // 60))
+
+    def add_calls(self, line: PhoneLine, durations: Iterable[int]) -> None:
+        """ Add outgoing calls of <line> lasting <durations> seconds, in the
+        order they were made, to this batch.
+        """
+        minutes = self._minutes.get(line)
+        if minutes is None:
+            minutes = self._minutes[line] = array('l')
+        minutes.extend(-(-duration // 60) for duration in durations)
+
+    def add_sms(self, line: PhoneLine, count: int = 1) -> None:
+        """ Add <count> SMSs sent by <line> to this batch.
+        """
+        self._sms[line] = self._sms.get(line, 0) + count
+
+    def __len__(self) -> int:
+        """ Return the number of calls in this batch
+        """
+        return sum(len(minutes) for minutes in self._minutes.values())
+
+    def bill(self) -> None:
+        """ Bill every call and SMS of this batch to its phone line, then
+        empty this batch.
+
+        Precondition:
+        - every phone line of the batch is in the monthly billing cycle when
+        its calls were made
+        """
+        for line, minutes in self._minutes.items():
+            line.bill_calls(minutes)
+        for line, count in self._sms.items():
+            line.bill_sms(count)
+        self._minutes = {}
+        self._sms = {}
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'array', 'phoneline'
+        ],
+        'generated-members': 'pygame.*'
+    })
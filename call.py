@@ -13,14 +13,59 @@ Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
 """
 import datetime
 import os
-from typing import Optional
+from typing import Optional, Union
 import pygame
+from numberregistry import NUMBERS
 
 
 # Sprite files to display the start and end of a call
 START_CALL_SPRITE = 'data/call-start-2.png'
 END_CALL_SPRITE = 'data/call-end-2.png'
 
+# A packed call time holds the month index (12 * year + month - 1) above
+# MONTH_SHIFT bits, and the seconds elapsed since the start of that month in
+# the low MONTH_SHIFT bits. 22 bits hold the 2678400 seconds of a 31 day month.
+MONTH_SHIFT = 22
+SECONDS_MASK = (1 << MONTH_SHIFT) - 1
+
+
+def pack_time(calltime: datetime.datetime) -> int:
+    """ Return the packed form of <calltime>, dropping its microseconds.
+
+    Packed times compare in the same order as the times they stand for, and
+    the calls of a month are packed times between pack_month(month, year) and
+    pack_month of the next month.
+    """
+    return ((calltime.year * 12 + calltime.month - 1) << MONTH_SHIFT) \
+        | ((calltime.day - 1) * 86400 + calltime.hour * 3600
+           + calltime.minute * 60 + calltime.second)
+
+
+def pack_month(month: int, year: int) -> int:
+    """ Return the packed time of the start of <month> of <year>
+    """
+    return (year * 12 + month - 1) << MONTH_SHIFT
+
+
+def unpack_time(packed: int) -> datetime.datetime:
+    """ Return the time that was packed into <packed> by pack_time()
+    """
+    year, month = divmod(packed >> MONTH_SHIFT, 12)
+    return datetime.datetime(year, month + 1, 1) \
+        + datetime.timedelta(seconds=packed & SECONDS_MASK)
+
+
+def parse_time(text: str) -> int:
+    """ Return the packed form of the "YYYY-MM-DD HH:MM:SS" time <text>, as
+    used by the input dataset, without building a datetime.
+
+    >>> unpack_time(parse_time('2018-01-02 03:04:05'))
+    datetime.datetime(2018, 1, 2, 3, 4, 5)
+    """
+    return ((int(text[:4]) * 12 + int(text[5:7]) - 1) << MONTH_SHIFT) \
+        | ((int(text[8:10]) - 1) * 86400 + int(text[11:13]) * 3600
+           + int(text[14:16]) * 60 + int(text[17:19]))
+
 
 # ----------------------------------------------------------------------------
 # NOTE: You do not need to understand the implementation of the Drawable class
@@ -80,12 +125,13 @@ class Call:
     """ A call made by a customer to another customer.
 
     === Public Attributes ===
-    src_number:
-         source number for this Call
-    dst_number:
-         destination number for this Call
-    time:
-         date and time of this Call
+    src_id:
+         id of the source number for this Call in the NUMBERS registry
+    dst_id:
+         id of the destination number for this Call in the NUMBERS registry
+    packed_time:
+         date and time of this Call, packed into an int by pack_time(); the
+         time property gives it back as a datetime
     duration:
          duration in seconds for this Call
     src_loc:
@@ -95,47 +141,99 @@ class Call:
          location of the destination of this Call; a Tuple containing the
          longitude and latitude coordinates
     drawables:
-         sprites for drawing the source and destination of this Call
+         sprites for drawing the source and destination of this Call, created
+         the first time they are used
     connection:
          connecting line between the two sprites representing the source and
-         destination of this Call
+         destination of this Call, created the first time it is used
 
     === Representation Invariants ===
     -   duration >= 0
     """
-    src_number: str
-    dst_number: str
-    time: datetime.datetime
+    # === Private Attributes ===
+    # _sprites:
+    #     the (drawables, connection) of this Call, or None until they are
+    #     first used: most calls are never drawn, and loading the sprites of
+    #     every call would cost more than the rest of the call
+    src_id: int
+    dst_id: int
+    packed_time: int
     duration: int
     src_loc: tuple[float, float]
     dst_loc: tuple[float, float]
-    drawables: list[Drawable]
-    connection: Drawable
+    _sprites: Optional[tuple[list[Drawable], Drawable]]
 
-    def __init__(self, src_nr: str, dst_nr: str,
-                 calltime: datetime.datetime, duration: int,
+    def __init__(self, src_nr: Union[str, int], dst_nr: Union[str, int],
+                 calltime: Union[datetime.datetime, int], duration: int,
                  src_loc: tuple[float, float], dst_loc: tuple[float, float]) \
             -> None:
         """ Create a new Call object with the given parameters.
+
+        The source and destination numbers <src_nr> and <dst_nr> are given
+        either as phone numbers, which are registered in NUMBERS if needed,
+        or directly as their ids. <calltime> is given either as a datetime,
+        whose microseconds are dropped, or already packed.
         """
-        self.src_number = src_nr
-        self.dst_number = dst_nr
-        self.time = calltime
+        self.src_id = NUMBERS.intern(src_nr)
+        self.dst_id = NUMBERS.intern(dst_nr)
+        if isinstance(calltime, int):
+            self.packed_time = calltime
+        else:
+            self.packed_time = pack_time(calltime)
         self.duration = duration
         self.src_loc = src_loc
         self.dst_loc = dst_loc
-        self.drawables = [Drawable(sprite_file=START_CALL_SPRITE,
-                                   location=src_loc),
-                          Drawable(sprite_file=END_CALL_SPRITE,
-                                   location=dst_loc)]
+        self._sprites = None
+
+    @property
+    def drawables(self) -> list[Drawable]:
+        """ The sprites for drawing the source and destination of this Call
+        """
+        return self._get_sprites()[0]
+
+    @property
+    def connection(self) -> Drawable:
+        """ The connecting line between the sprites of this Call
+        """
+        return self._get_sprites()[1]
 
-        self.connection = Drawable(linelimits=(src_loc, dst_loc))
+    def _get_sprites(self) -> tuple[list[Drawable], Drawable]:
+        """ Return the (drawables, connection) of this Call, creating them
+        the first time.
+        """
+        if self._sprites is None:
+            drawables = [Drawable(sprite_file=START_CALL_SPRITE,
+                                  location=self.src_loc),
+                         Drawable(sprite_file=END_CALL_SPRITE,
+                                  location=self.dst_loc)]
+            connection = Drawable(linelimits=(self.src_loc, self.dst_loc))
+            self._sprites = (drawables, connection)
+        return self._sprites
+
+    @property
+    def src_number(self) -> str:
+        """ The source phone number for this Call
+        """
+        return NUMBERS.get_number(self.src_id)
+
+    @property
+    def dst_number(self) -> str:
+        """ The destination phone number for this Call
+        """
+        return NUMBERS.get_number(self.dst_id)
+
+    @property
+    def time(self) -> datetime.datetime:
+        """ The date and time of this Call, computed from its packed time
+        """
+        return unpack_time(self.packed_time)
 
     def get_bill_date(self) -> tuple[int, int]:
         """ Return the billing date for this Call, as a tuple containing the
         month and the year
         """
-        return self.time.month, self.time.year
+        year, month = divmod(self.packed_time >> MONTH_SHIFT, 12)
+        return month + 1, year
 
     # ----------------------------------------------------------
     # NOTE: You do not need to understand the implementation of
@@ -164,7 +262,8 @@ if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'datetime', 'os', 'pygame'
+            'python_ta', 'typing', 'datetime', 'os', 'pygame',
+            'numberregistry'
         ],
         'disable': ['R0902', 'R0913'],
         'generated-members': 'pygame.*'
@@ -0,0 +1,204 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains sets of calls represented as bitmaps, for combining the
+results of filters with AND, OR and NOT.
+
+A CallIndex gives each call a stable position: calls are only ever added to
+it, at the end. A CallBitmap is a set of calls of an index, stored as the bits
+of a Python integer, where bit i is set if the call at position i is in the
+set. Intersections, unions and complements of bitmaps are single operations
+on integers, which process their bits a machine word at a time, instead of
+comparing calls one by one. Bitmaps are only turned back into lists of calls,
+in the order of the index, to be drawn.
+"""
+from collections.abc import Iterable
+from typing import Callable, Iterator
+from call import Call
+
+# The positions of the bits set in each byte value, from the lowest
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1)
+              for value in range(256)]
+
+# Maximum number of bitmaps of queries kept by an index
+MAX_QUERY_BITMAPS = 64
+
+
+class CallIndex:
+    """ The stable positions of calls, for bitmaps of calls.
+    """
+    # === Private Attributes ===
+    # _calls:
+    #     the calls of the index, in the order of their positions
+    # _positions:
+    #     the position of every call of the index
+    # _query_bitmaps:
+    #     the bits of the calls selected by queries, keyed by query, with the
+    #     number of calls of the index when they were computed
+    _calls: list[Call]
+    _positions: dict[Call, int]
+    _query_bitmaps: dict[object, tuple[int, int]]
+
+    def __init__(self, calls: Iterable[Call] = ()) -> None:
+        """ Create an index of <calls>, in order.
+        """
+        self._calls = []
+        self._positions = {}
+        self._query_bitmaps = {}
+        self.add(calls)
+
+    def __len__(self) -> int:
+        """ Return the number of calls in this index
+        """
+        return len(self._calls)
+
+    def add(self, calls: Iterable[Call]) -> None:
+        """ Add the calls of <calls> that are not in this index yet, after
+        the calls already in it.
+        """
+        positions = self._positions
+        for call in calls:
+            if call not in positions:
+                positions[call] = len(self._calls)
+                self._calls.append(call)
+
+    def get_all(self) -> 'CallBitmap':
+        """ Return the bitmap of every call of this index.
+        """
+        return CallBitmap(self, (1 << len(self._calls)) - 1)
+
+    def to_bitmap(self, calls: Iterable[Call]) -> 'CallBitmap':
+        """ Return the bitmap of <calls>, adding those that are not in this
+        index yet.
+        """
+        calls = list(calls)
+        self.add(calls)
+        positions = self._positions
+        bits = bytearray((len(self._calls) + 7) // 8)
+        for call in calls:
+            position = positions[call]
+            bits[position >> 3] |= 1 << (position & 7)
+        return CallBitmap(self, int.from_bytes(bits, 'little'))
+
+    def to_calls(self, bits: int) -> list[Call]:
+        """ Return the calls of positions the bits set in <bits>, in the order
+        of this index.
+        """
+        calls = self._calls
+        result = []
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+        for i, byte in enumerate(data):
+            if byte:
+                base = i * 8
+                for bit in _BYTE_BITS[byte]:
+                    result.append(calls[base + bit])
+        return result
+
+    def get_query_bitmap(self, query: object,
+                         match: Callable[[list[Call]], Iterator[Call]]) \
+            -> 'CallBitmap':
+        """ Return the bitmap of the calls of this index selected by <query>,
+        where match(calls) yields the calls of <calls> selected by <query>.
+
+        Bitmaps are kept by query, and only the calls added since a bitmap
+        was computed are matched again.
+        """
+        bits, size = self._query_bitmaps.pop(query, (0, 0))
+        if size < len(self._calls):
+            positions = self._positions
+            new_bits = bytearray((len(self._calls) + 7) // 8)
+            for call in match(self._calls[size:]):
+                position = positions[call]
+                new_bits[position >> 3] |= 1 << (position & 7)
+            bits |= int.from_bytes(new_bits, 'little')
+            size = len(self._calls)
+        # keep the most recently used bitmaps last
+        self._query_bitmaps[query] = (bits, size)
+        if len(self._query_bitmaps) > MAX_QUERY_BITMAPS:
+            del self._query_bitmaps[next(iter(self._query_bitmaps))]
+        return CallBitmap(self, bits)
+
+
+class CallBitmap:
+    """ A set of calls of a CallIndex, as a bitmap. Bitmaps are immutable:
+    the operators return new bitmaps.
+
+    === Public Attributes ===
+    index:
+        the index of the calls of this bitmap
+    bits:
+        the integer whose bit i is set if the call at position i of the
+        index is in this set
+    """
+    index: CallIndex
+    bits: int
+
+    def __init__(self, index: CallIndex, bits: int) -> None:
+        """ Create the set of the calls of <index> whose positions are the
+        bits set in <bits>.
+        """
+        self.index = index
+        self.bits = bits
+
+    def __len__(self) -> int:
+        """ Return the number of calls in this set
+        """
+        return self.bits.bit_count()
+
+    def __bool__(self) -> bool:
+        """ Return whether this set has any call
+        """
+        return self.bits != 0
+
+    def __eq__(self, other: object) -> bool:
+        """ Return whether <other> is a bitmap of the same calls of the same
+        index
+        """
+        return isinstance(other, CallBitmap) and \
+            self.index is other.index and self.bits == other.bits
+
+    def __and__(self, other: 'CallBitmap') -> 'CallBitmap':
+        """ Return the calls in both this set and <other>
+        """
+        return CallBitmap(self.index, self.bits & other.bits)
+
+    def __or__(self, other: 'CallBitmap') -> 'CallBitmap':
+        """ Return the calls in this set or in <other>
+        """
+        return CallBitmap(self.index, self.bits | other.bits)
+
+    def __sub__(self, other: 'CallBitmap') -> 'CallBitmap':
+        """ Return the calls in this set but not in <other>
+        """
+        return CallBitmap(self.index, self.bits & ~other.bits)
+
+    def __invert__(self) -> 'CallBitmap':
+        """ Return the calls of the index that are not in this set
+        """
+        return CallBitmap(self.index, self.index.get_all().bits ^ self.bits)
+
+    def to_calls(self) -> list[Call]:
+        """ Return the calls of this set, in the order of the index
+        """
+        return self.index.to_calls(self.bits)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'collections.abc', 'call'
+        ],
+    })
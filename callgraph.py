@@ -0,0 +1,207 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains the call graph of the phone numbers: two numbers are
+neighbours if either one called the other, and each edge is weighted by the
+number of calls between them and their total duration.
+
+The graph is stored in compressed sparse row (CSR) form over the number ids of
+the NUMBERS registry: the neighbours of the number with id i are
+_neighbours[_offsets[i]:_offsets[i + 1]], sorted by id, and the weights of
+these edges are at the same positions of _calls and _seconds. Neighbour lists
+and degrees are read in constant time, without scanning any call.
+"""
+from array import array
+from typing import Iterable, Optional, Union
+from call import Call
+from customer import Customer, get_version
+from numberregistry import NUMBERS
+
+# The graph last returned by CallGraph.of_customers(), with the list of
+# customers it was built from and their version (see customer.get_version)
+_latest: Optional[tuple[list[Customer], tuple[int, int], 'CallGraph']] = None
+
+
+def _iter_calls(customers: list[Customer]) -> Iterable[Call]:
+    """ Yield every call of the phone lines of <customers> once: the outgoing
+    calls of every line, and the incoming calls from numbers that do not
+    belong to any of <customers>.
+    """
+    histories = [customer.get_phone_line(number).get_call_history()
+                 for customer in customers
+                 for number in customer.get_phone_numbers()]
+    owned = set()
+    for customer in customers:
+        owned.update(customer.get_number_ids())
+    for history in histories:
+        yield from history.get_outgoing_view()
+    for history in histories:
+        for call in history.get_incoming_view():
+            if call.src_id not in owned:
+                yield call
+
+
+class CallGraph:
+    """ The undirected call graph of a set of calls, over the number ids of
+    the NUMBERS registry.
+
+    A call between two numbers adds one call and its duration to the weight
+    of their edge, whichever number made the call. A number never has an edge
+    to itself.
+    """
+    # === Private Attributes ===
+    # _offsets:
+    #     the neighbours of the number with id i are at the positions
+    #     _offsets[i] to _offsets[i + 1] - 1 of the other arrays; the
+    #     length of _offsets is one more than the number of ids in the graph
+    # _neighbours:
+    #     the neighbour ids of every number, sorted by id for each number
+    # _calls:
+    #     the number of calls on each edge
+    # _seconds:
+    #     the total duration of the calls on each edge, in seconds
+    _offsets: array
+    _neighbours: array
+    _calls: array
+    _seconds: array
+
+    def __init__(self, calls: Iterable[Call]) -> None:
+        """ Create the call graph of <calls>, each of which is counted once.
+        """
+        edges = {}
+        for call in calls:
+            if call.src_id == call.dst_id:
+                continue
+            for key in ((call.src_id, call.dst_id),
+                        (call.dst_id, call.src_id)):
+                weight = edges.get(key)
+                if weight is None:
+                    edges[key] = [1, call.duration]
+                else:
+                    weight[0] += 1
+                    weight[1] += call.duration
+
+        size = len(NUMBERS)
+        self._offsets = array('l', [0] * (size + 1))
+        self._neighbours = array('l')
+        self._calls = array('l')
+        self._seconds = array('q')
+        for (src, dst) in sorted(edges):
+            self._offsets[src + 1] += 1
+            self._neighbours.append(dst)
+            self._calls.append(edges[src, dst][0])
+            self._seconds.append(edges[src, dst][1])
+        for i in range(size):
+            self._offsets[i + 1] += self._offsets[i]
+
+    @classmethod
+    def from_customers(cls, customers: list[Customer]) -> 'CallGraph':
+        """ Return the call graph of the calls in the histories of the phone
+        lines of <customers>, as registered by process_event_history().
+        """
+        return cls(_iter_calls(customers))
+
+    @classmethod
+    def of_customers(cls, customers: list[Customer]) -> 'CallGraph':
+        """ Return the call graph of <customers>, like from_customers(), but
+        reuse the graph last returned if it was built from the same list of
+        customers and their version did not change since, i.e. no call was
+        added to them.
+
+        The version is counted in time proportional to the number of
+        customers, instead of scanning and sorting every call.
+        """
+        global _latest
+        latest = _latest
+        version = get_version(customers)
+        if latest is not None and latest[0] is customers and \
+                latest[1] == version:
+            return latest[2]
+        graph = cls.from_customers(customers)
+        # replacing the tuple is atomic: concurrent filters at worst build
+        # the same graph twice
+        _latest = (customers, version, graph)
+        return graph
+
+    def _range(self, number: Union[str, int]) -> range:
+        """ Return the positions of the edges of <number>, a phone number or
+        its id, in the edge arrays. The range is empty if <number> has no
+        edges.
+        """
+        nid = NUMBERS.lookup(number)
+        if nid is None or not 0 <= nid < len(self._offsets) - 1:
+            return range(0)
+        return range(self._offsets[nid], self._offsets[nid + 1])
+
+    def get_degree(self, number: Union[str, int]) -> int:
+        """ Return the number of distinct numbers that <number>, a phone
+        number or its id, called or was called by.
+        """
+        return len(self._range(number))
+
+    def get_neighbour_ids(self, number: Union[str, int]) -> array:
+        """ Return the ids of the numbers that <number>, a phone number or its
+        id, called or was called by, in increasing order.
+        """
+        edges = self._range(number)
+        return self._neighbours[edges.start:edges.stop]
+
+    def get_neighbours(self, number: Union[str, int]) \
+            -> list[tuple[str, int, int]]:
+        """ Return the numbers that <number>, a phone number or its id, called
+        or was called by, as Tuples (phone number, number of calls, total
+        duration in seconds), in the order of their ids.
+        """
+        return [(NUMBERS.get_number(self._neighbours[i]), self._calls[i],
+                 self._seconds[i]) for i in self._range(number)]
+
+    def get_ids_within(self, numbers: Iterable[Union[str, int]],
+                       hops: int) -> set[int]:
+        """ Return the ids of the numbers that are at most <hops> edges away
+        from any of <numbers>, phone numbers or their ids, including the ids
+        of <numbers> themselves.
+        """
+        seen = {nid for nid in map(NUMBERS.lookup, numbers) if nid is not None}
+        frontier = list(seen)
+        for _ in range(hops):
+            next_frontier = []
+            for nid in frontier:
+                for other in self.get_neighbour_ids(nid):
+                    if other not in seen:
+                        seen.add(other)
+                        next_frontier.append(other)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        return seen
+
+    def get_two_hop_ids(self, number: Union[str, int]) -> set[int]:
+        """ Return the ids of the numbers exactly two edges away from
+        <number>, a phone number or its id: the contacts of its contacts that
+        are neither <number> nor one of its own contacts.
+        """
+        return self.get_ids_within([number], 2) \
+            - self.get_ids_within([number], 1)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'array', 'call', 'customer',
+            'numberregistry'
+        ],
+        'disable': ['W0603'],
+    })
@@ -11,11 +11,149 @@ any changes, are expressly prohibited.
 All of the files in this directory and all subdirectories are:
 Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
 """
-from call import Call
+import datetime
+from bisect import bisect_left, bisect_right, insort_right
+from collections.abc import Collection, Sequence
+from itertools import chain
+from typing import Iterator, Optional, Union
+from call import Call, pack_time, unpack_time
+from linestats import UsageStats
+
+
+class CallsView(Sequence):
+    """A read-only view of a list of calls.
+
+    The view does not copy the calls: it always reflects the current contents
+    of the list it was created from, including calls registered after the
+    view was created.
+    """
+    # === Private Attributes ===
+    # _calls:
+    #     the list of calls seen through this view
+    _calls: list[Call]
+
+    def __init__(self, calls: list[Call]) -> None:
+        """ Create a view of <calls>.
+        """
+        self._calls = calls
+
+    def __len__(self) -> int:
+        """ Return the number of calls in this view
+        """
+        return len(self._calls)
+
+    def __getitem__(self, index: Union[int, slice]) \
+            -> Union[Call, list[Call]]:
+        """ Return the call at <index>, or a new list of calls if <index> is a
+        slice
+        """
+        return self._calls[index]
+
+    def __iter__(self) -> Iterator[Call]:
+        """ Return an iterator over the calls in this view, in order
+        """
+        return iter(self._calls)
+
+    def __repr__(self) -> str:
+        """ Return a string representation of this view
+        """
+        return 'CallsView(' + str(len(self._calls)) + ' calls)'
+
+
+class MonthlyCallsView(Collection):
+    """A read-only, lazily chained view of the calls of one or all months of
+    a monthly call dictionary, such as CallHistory.outgoing_calls.
+
+    Iterating the view walks the monthly lists in place, without copying
+    them, and always reflects calls registered after the view was created.
+    """
+    # === Private Attributes ===
+    # _months:
+    #     the monthly call dictionary seen through this view
+    # _key:
+    #     the (month, year) of the calls in this view, or None for all months
+    _months: dict[tuple[int, int], list[Call]]
+    _key: Optional[tuple[int, int]]
+
+    def __init__(self, months: dict[tuple[int, int], list[Call]],
+                 key: Optional[tuple[int, int]] = None) -> None:
+        """ Create a view of the calls of <months> for the month <key>, or for
+        all months if <key> is None.
+        """
+        self._months = months
+        self._key = key
+
+    def __len__(self) -> int:
+        """ Return the number of calls in this view
+        """
+        if self._key is not None:
+            return len(self._months.get(self._key, ()))
+        return sum(len(calls) for calls in self._months.values())
+
+    def __iter__(self) -> Iterator[Call]:
+        """ Return an iterator over the calls in this view, month by month
+        """
+        if self._key is not None:
+            return iter(self._months.get(self._key, ()))
+        return chain.from_iterable(self._months.values())
+
+    def __contains__(self, call: object) -> bool:
+        """ Return whether <call> is in this view
+        """
+        if self._key is not None:
+            return call in self._months.get(self._key, ())
+        return any(call in calls for calls in self._months.values())
+
+    def __repr__(self) -> str:
+        """ Return a string representation of this view
+        """
+        return 'MonthlyCallsView(' + str(len(self)) + ' calls)'
+
+
+def _packed_time(call: Call) -> int:
+    """ Return the packed time of <call>, by which call logs are sorted.
+    """
+    return call.packed_time
+
+
+def _insert_by_time(calls: list[Call], call: Call) -> None:
+    """ Insert <call> into the chronologically sorted <calls>.
+
+    Calls with equal times stay in the order they were inserted. Calls that
+    arrive in chronological order are simply appended.
+    """
+    if not calls or calls[-1].packed_time <= call.packed_time:
+        calls.append(call)
+    else:
+        insort_right(calls, call, key=_packed_time)
+
+
+def _calls_between(calls: list[Call], start: datetime.datetime,
+                   end: datetime.datetime) -> list[Call]:
+    """ Return the calls of the chronologically sorted <calls> whose time is
+    between <start> and <end> inclusive.
+    """
+    # call times are whole seconds, so a start within a second starts at the
+    # next one
+    first = pack_time(start) + (start.microsecond > 0)
+    return calls[bisect_left(calls, first, key=_packed_time):
+                 bisect_right(calls, pack_time(end), key=_packed_time)]
+
+
+def _add_to_index(index: dict[Call, int], call: Call, count: int) -> None:
+    """ Add <count> registrations of <call> to <index>, dropping the call from
+    <index> once it has no registrations left.
+    """
+    new_count = index.get(call, 0) + count
+    if new_count > 0:
+        index[call] = new_count
+    else:
+        index.pop(call, None)
 
 
 class CallHistory:
-    """A class for recording incoming and outgoing calls for a particular number
+    """A class for recording incoming and outgoing calls for a particular
+    number, and counting its SMSs
 
     === Public Attributes ===
     incoming_calls:
@@ -25,36 +163,208 @@ class CallHistory:
          Dictionary of outgoing calls. Keys are tuples containing a month and a
          year, values are a List of Call objects for that month and year.
     """
+    # === Private Attributes ===
+    # _outgoing_log:
+    #     all outgoing calls, in chronological order
+    # _incoming_log:
+    #     all incoming calls, in chronological order
+    # _indexes:
+    #     call indexes, such as the owning customer's, which map every call
+    #     registered in this history to its number of registrations (2 for a
+    #     call this number made to itself), and are updated as calls are
+    #     registered
+    # _flat_history:
+    #     the (outgoing calls, incoming calls) of all months flattened in
+    #     month order, or None if a call was registered since it was built
+    # _sms_counts:
+    #     the number of SMSs [sent, received] in each month, keyed by
+    #     (month, year) tuples; SMSs are counted rather than stored
+    # _outgoing_stats:
+    #     running statistics of all outgoing calls
+    # _incoming_stats:
+    #     running statistics of all incoming calls
     incoming_calls: dict[tuple[int, int], list[Call]]
     outgoing_calls: dict[tuple[int, int], list[Call]]
+    _outgoing_log: list[Call]
+    _incoming_log: list[Call]
+    _indexes: list[dict[Call, int]]
+    _flat_history: Optional[tuple[list[Call], list[Call]]]
+    _sms_counts: dict[tuple[int, int], list[int]]
+    _outgoing_stats: UsageStats
+    _incoming_stats: UsageStats
 
     def __init__(self) -> None:
         """ Create an empty CallHistory.
         """
         self.outgoing_calls = {}
         self.incoming_calls = {}
+        self._outgoing_log = []
+        self._incoming_log = []
+        self._indexes = []
+        self._flat_history = None
+        self._sms_counts = {}
+        self._outgoing_stats = UsageStats(
+            MonthlyCallsView(self.outgoing_calls), outgoing=True)
+        self._incoming_stats = UsageStats(
+            MonthlyCallsView(self.incoming_calls), outgoing=False)
 
     def register_outgoing_call(self, call: Call) -> None:
         """ Register a Call <call> into this outgoing call history
         """
         # CASE 1 --> already exists
-        if (call.time.month, call.time.year) in self.outgoing_calls:
+        date = call.get_bill_date()
+        if date in self.outgoing_calls:
             # add to existing list in dictionary
-            self.outgoing_calls[(call.time.month, call.time.year)].append(call)
+            self.outgoing_calls[date].append(call)
         # CASE 2 --> create new dict entry
         else:
             # create new entry in the dictionary
-            self.outgoing_calls[(call.time.month, call.time.year)] = [call]
+            self.outgoing_calls[date] = [call]
+        _insert_by_time(self._outgoing_log, call)
+        self._outgoing_stats.add_call(call.duration)
+        self._index_call(call)
+        self._flat_history = None
 
     def register_incoming_call(self, call: Call) -> None:
         """ Register a Call <call> into this incoming call history
         """
         # CASE 1 --> already exists
-        if (call.time.month, call.time.year) in self.incoming_calls:
-            self.incoming_calls[(call.time.month, call.time.year)].append(call)
+        date = call.get_bill_date()
+        if date in self.incoming_calls:
+            self.incoming_calls[date].append(call)
         # CASE 2 --> create new dict entry
         else:
-            self.incoming_calls[(call.time.month, call.time.year)] = [call]
+            self.incoming_calls[date] = [call]
+        _insert_by_time(self._incoming_log, call)
+        self._incoming_stats.add_call(call.duration)
+        self._index_call(call)
+        self._flat_history = None
+
+    def register_outgoing_sms(self, month: int, year: int,
+                              count: int = 1) -> None:
+        """ Count <count> SMSs sent in <month> of <year>
+        """
+        counts = self._sms_counts.get((month, year))
+        if counts is None:
+            counts = self._sms_counts[(month, year)] = [0, 0]
+        counts[0] += count
+
+    def register_incoming_sms(self, month: int, year: int,
+                              count: int = 1) -> None:
+        """ Count <count> SMSs received in <month> of <year>
+        """
+        counts = self._sms_counts.get((month, year))
+        if counts is None:
+            counts = self._sms_counts[(month, year)] = [0, 0]
+        counts[1] += count
+
+    def get_sms_counts(self, month: int = None, year: int = None) \
+            -> tuple[int, int]:
+        """ Return the number of SMSs sent and received in <month> of <year>,
+        or in all months if <month> and <year> are both None, as a Tuple
+        (sent, received).
+        """
+        if month is not None and year is not None:
+            sent, received = self._sms_counts.get((month, year), (0, 0))
+            return sent, received
+        return (sum(counts[0] for counts in self._sms_counts.values()),
+                sum(counts[1] for counts in self._sms_counts.values()))
+
+    def count_calls(self, month: int = None, year: int = None) \
+            -> tuple[int, int]:
+        """ Return the number of outgoing and incoming calls in <month> of
+        <year>, or in all months if <month> and <year> are both None, as a
+        Tuple (outgoing count, incoming count), without scanning any calls.
+        """
+        if month is not None and year is not None:
+            return (len(self.outgoing_calls.get((month, year), ())),
+                    len(self.incoming_calls.get((month, year), ())))
+        return self._outgoing_stats.count, self._incoming_stats.count
+
+    def get_usage_stats(self) -> tuple[UsageStats, UsageStats]:
+        """ Return the running statistics of all outgoing and incoming calls
+        of this history, as a Tuple (outgoing stats, incoming stats). They are
+        kept up to date as calls are registered, and must not be modified.
+        """
+        return self._outgoing_stats, self._incoming_stats
+
+    def _index_call(self, call: Call) -> None:
+        """ Record one more registration of <call> in every attached index
+        """
+        for index in self._indexes:
+            index[call] = index.get(call, 0) + 1
+
+    def attach_index(self, index: dict[Call, int]) -> None:
+        """ Add the calls of this history to <index>, and keep <index> up to
+        date with every call registered from now on.
+
+        <index> maps each call to its number of registrations, so that one
+        index can be shared by several call histories.
+        """
+        self._indexes.append(index)
+        for call in chain(self._outgoing_log, self._incoming_log):
+            _add_to_index(index, call, 1)
+
+    def detach_index(self, index: dict[Call, int]) -> None:
+        """ Remove the calls of this history from <index>, which was attached
+        with attach_index(), and stop updating it.
+        """
+        self._indexes.remove(index)
+        for call in chain(self._outgoing_log, self._incoming_log):
+            _add_to_index(index, call, -1)
+
+    def get_outgoing_view(self) -> CallsView:
+        """ Return a read-only view of all outgoing calls, in chronological
+        order
+        """
+        return CallsView(self._outgoing_log)
+
+    def get_incoming_view(self) -> CallsView:
+        """ Return a read-only view of all incoming calls, in chronological
+        order
+        """
+        return CallsView(self._incoming_log)
+
+    def get_call_set(self) -> frozenset[Call]:
+        """ Return the set of all calls in this history.
+
+        The set is built from the calls of this history when this method is
+        called, and does not include the calls registered after that. The
+        owning customer keeps an up to date set of the calls of all its lines
+        instead (see Customer.get_call_set()).
+        """
+        return frozenset(chain(self._outgoing_log, self._incoming_log))
+
+    def get_calls_between(self, start: datetime.datetime,
+                          end: datetime.datetime) \
+            -> tuple[list[Call], list[Call]]:
+        """ Return all outgoing and incoming calls made between <start> and
+        <end> inclusive, in chronological order, as a Tuple
+        (outgoing calls, incoming calls).
+
+        The calls are found by bisecting the chronological logs by time,
+        without scanning the months of this history.
+        """
+        return (_calls_between(self._outgoing_log, start, end),
+                _calls_between(self._incoming_log, start, end))
+
+    def get_recent_calls(self, days: float,
+                         now: Optional[datetime.datetime] = None) \
+            -> tuple[list[Call], list[Call]]:
+        """ Return all outgoing and incoming calls made in the <days> days up
+        to <now>, in chronological order, as a Tuple
+        (outgoing calls, incoming calls).
+
+        If <now> is None, the time of the latest call in this history is used,
+        since the call records are historic.
+        """
+        if now is None:
+            latest = self._outgoing_log[-1:] + self._incoming_log[-1:]
+            if not latest:
+                return [], []
+            now = unpack_time(max(map(_packed_time, latest)))
+        return self.get_calls_between(now - datetime.timedelta(days=days),
+                                      now)
 
     # ----------------------------------------------------------
     # NOTE: You do not need to understand the implementation of
@@ -76,23 +386,51 @@ class CallHistory:
         - if <month> and <year> are specified (non-None), they are both valid
         monthly cycles according to the input dataset
         """
-        monthly_history = ([], [])
         if month is not None and year is not None:
-            if (month, year) in self.outgoing_calls:
-                for call in self.outgoing_calls[(month, year)]:
-                    monthly_history[0].append(call)
+            return (list(self.outgoing_calls.get((month, year), ())),
+                    list(self.incoming_calls.get((month, year), ())))
+        outgoing, incoming = self._get_flat_history()
+        return list(outgoing), list(incoming)
 
-            if (month, year) in self.incoming_calls:
-                for call in self.incoming_calls[(month, year)]:
-                    monthly_history[1].append(call)
-        else:
-            for entry in self.outgoing_calls:
-                for call in self.outgoing_calls[entry]:
-                    monthly_history[0].append(call)
-            for entry in self.incoming_calls:
-                for call in self.incoming_calls[entry]:
-                    monthly_history[1].append(call)
-        return monthly_history
+    def get_monthly_view(self, month: int = None, year: int = None) -> \
+            tuple[MonthlyCallsView, MonthlyCallsView]:
+        """ Return read-only views of the outgoing and incoming calls for
+        <month> and <year>, in the same order as get_monthly_history(), as a
+        Tuple (outgoing calls, incoming calls).
+
+        If <month> and <year> are both None, the views chain the calls of all
+        months. No call lists are copied.
+
+        Precondition:
+        - <month> and <year> are either both specified, or are both
+          missing/None
+        """
+        key = None
+        if month is not None and year is not None:
+            key = (month, year)
+        return (MonthlyCallsView(self.outgoing_calls, key),
+                MonthlyCallsView(self.incoming_calls, key))
+
+    def get_flat_history(self) -> tuple[CallsView, CallsView]:
+        """ Return read-only views of all outgoing and incoming calls of this
+        history, flattened in month order, as a Tuple
+        (outgoing calls, incoming calls).
+
+        The flattened lists are built once and cached until the next call is
+        registered, so the views must not be kept across registrations.
+        """
+        outgoing, incoming = self._get_flat_history()
+        return CallsView(outgoing), CallsView(incoming)
+
+    def _get_flat_history(self) -> tuple[list[Call], list[Call]]:
+        """ Return the cached flattened (outgoing calls, incoming calls) of all
+        months, rebuilding it if calls were registered since it was built.
+        """
+        if self._flat_history is None:
+            self._flat_history = (
+                list(chain.from_iterable(self.outgoing_calls.values())),
+                list(chain.from_iterable(self.incoming_calls.values())))
+        return self._flat_history
 
 
 if __name__ == '__main__':
@@ -100,8 +438,8 @@ if __name__ == '__main__':
 
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'datetime', 'call'
-                                               ''
+            'python_ta', 'typing', 'datetime', 'call', 'collections.abc',
+            'itertools', 'bisect', 'linestats'
         ],
         'disable': ['R0902', 'R0913'],
         'generated-members': 'pygame.*'
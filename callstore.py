@@ -0,0 +1,144 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains the export of calls to shared memory, for filters run in
+a pool of processes.
+
+A SharedCallStore holds the calls in a multiprocessing.shared_memory block, as
+fixed-width columns of 8 byte values: the ids of the source and destination
+numbers, the packed times and the durations as integers, and the source and
+destination coordinates as floats. The column of a value is read through a
+memoryview of the block, so a worker process attaches to the store by its
+name and reads the calls without any copy, instead of receiving the pickled
+Call objects. The calls are identified by their index in the store.
+"""
+from array import array
+from multiprocessing import shared_memory
+from typing import Sequence
+from call import Call
+
+# Names of the columns of a store, in the order of the block. The first ones
+# hold integers, the others floats.
+INT_COLUMNS = ('src_id', 'dst_id', 'packed_time', 'duration')
+FLOAT_COLUMNS = ('src_long', 'src_lat', 'dst_long', 'dst_lat')
+
+# Size of a value of any column, in bytes
+VALUE_SIZE = 8
+
+
+class SharedCallStore:
+    """ The columns of a sequence of calls, in shared memory.
+
+    The process that creates a store with create() must close() and unlink()
+    it once every process is done with it; the other processes attach to it
+    with attach() and only close() it. These processes must be started by the
+    multiprocessing module, so that they share the resource tracker of the
+    creator.
+
+    === Public Attributes ===
+    src_id, dst_id, packed_time, duration:
+        integer columns: the value of the call of index i is at index i
+    src_long, src_lat, dst_long, dst_lat:
+        float columns, indexed in the same way
+    """
+    # === Private Attributes ===
+    # _memory:
+    #     the shared memory block holding the columns, one after the other
+    # _size:
+    #     the number of calls in the store
+    src_id: memoryview
+    dst_id: memoryview
+    packed_time: memoryview
+    duration: memoryview
+    src_long: memoryview
+    src_lat: memoryview
+    dst_long: memoryview
+    dst_lat: memoryview
+    _memory: shared_memory.SharedMemory
+    _size: int
+
+    def __init__(self, memory: shared_memory.SharedMemory,
+                 size: int) -> None:
+        """ Create a store of <size> calls over the block <memory>. Use
+        create() or attach() instead.
+        """
+        self._memory = memory
+        self._size = size
+        column_size = size * VALUE_SIZE
+        for i, name in enumerate(INT_COLUMNS + FLOAT_COLUMNS):
+            column = memory.buf[i * column_size:(i + 1) * column_size]
+            setattr(self, name,
+                    column.cast('q' if name in INT_COLUMNS else 'd'))
+
+    @classmethod
+    def create(cls, calls: Sequence[Call]) -> 'SharedCallStore':
+        """ Return a new store holding <calls>, in order.
+        """
+        count = len(calls)
+        block_size = max(1, count * VALUE_SIZE
+                         * (len(INT_COLUMNS) + len(FLOAT_COLUMNS)))
+        store = cls(shared_memory.SharedMemory(create=True, size=block_size),
+                    count)
+        # fill each column at once from an array of the same type
+        store.src_id[:] = array('q', [call.src_id for call in calls])
+        store.dst_id[:] = array('q', [call.dst_id for call in calls])
+        store.packed_time[:] = array('q', [call.packed_time for call in calls])
+        store.duration[:] = array('q', [call.duration for call in calls])
+        store.src_long[:] = array('d', [call.src_loc[0] for call in calls])
+        store.src_lat[:] = array('d', [call.src_loc[1] for call in calls])
+        store.dst_long[:] = array('d', [call.dst_loc[0] for call in calls])
+        store.dst_lat[:] = array('d', [call.dst_loc[1] for call in calls])
+        return store
+
+    @classmethod
+    def attach(cls, handle: tuple[str, int]) -> 'SharedCallStore':
+        """ Return the store of <handle>, as returned by get_handle() in
+        another process.
+        """
+        name, size = handle
+        return cls(shared_memory.SharedMemory(name=name), size)
+
+    def get_handle(self) -> tuple[str, int]:
+        """ Return the name of the block and the number of calls of this
+        store, to attach to it from another process.
+        """
+        return self._memory.name, self._size
+
+    def __len__(self) -> int:
+        """ Return the number of calls in this store
+        """
+        return self._size
+
+    def close(self) -> None:
+        """ Stop using this store in this process. The columns must not be
+        used afterwards.
+        """
+        for name in INT_COLUMNS + FLOAT_COLUMNS:
+            getattr(self, name).release()
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """ Free the block of this store, once every process closed it.
+        """
+        self._memory.unlink()
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'array', 'multiprocessing', 'call'
+        ],
+    })
@@ -11,10 +11,13 @@ any changes, are expressly prohibited.
 All of the files in this directory and all subdirectories are:
 Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
 """
+import calendar
 import datetime
+from bisect import bisect_left
+from itertools import accumulate
 from math import ceil
-from typing import Optional
-from bill import Bill
+from typing import NamedTuple, Optional, Sequence
+from bill import Bill, to_mills, to_dollars
 from call import Call
 
 # Constants for the month-to-month contract monthly fee and term deposit
@@ -34,6 +37,23 @@ TERM_MINS_COST = 0.1
 # Cost per minute and per SMS in the prepaid contract
 PREPAID_MINS_COST = 0.025
 
+# The amounts above in mills, which the contracts bill with
+MTM_MONTHLY_FEE_MILLS = to_mills(MTM_MONTHLY_FEE)
+TERM_MONTHLY_FEE_MILLS = to_mills(TERM_MONTHLY_FEE)
+TERM_DEPOSIT_MILLS = to_mills(TERM_DEPOSIT)
+MTM_MINS_COST_MILLS = to_mills(MTM_MINS_COST)
+TERM_MINS_COST_MILLS = to_mills(TERM_MINS_COST)
+PREPAID_MINS_COST_MILLS = to_mills(PREPAID_MINS_COST)
+
+# Prepaid top-up, applied while the balance is above the threshold (i.e. the
+# credit is less than $10), and the initial credit, in mills
+PREPAID_TOP_UP_MILLS = 25000
+PREPAID_TOP_UP_THRESHOLD_MILLS = -10000
+PREPAID_INITIAL_CREDIT_MILLS = 100000
+
+# Length of the term contracts, in months
+TERM_LENGTH_MONTHS = 18
+
 
 class Contract:
     """ A contract for a phone line
@@ -76,6 +96,24 @@ class Contract:
         """
         self.bill.add_billed_minutes(ceil(call.duration / 60.0))
 
+    def bill_calls(self, minutes: Sequence[int]) -> None:
+        """ Add a batch of calls to the bill, given as the number of minutes
+        <minutes> each call is charged for, in the order the calls were made.
+        This has the same effect as calling bill_call() on each call in turn.
+
+        Precondition:
+        - the same as for bill_call(), for every call of the batch
+        """
+        self.bill.add_billed_minutes(sum(minutes))
+
+    def bill_sms(self, count: int = 1) -> None:
+        """ Add <count> SMSs sent in the current month to the bill.
+
+        Precondition:
+        - the same as for bill_call()
+        """
+        self.bill.add_billed_sms(count)
+
     def cancel_contract(self) -> float:
         """ Return the amount owed in order to close the phone line associated
         with this contract.
@@ -89,77 +127,275 @@ class Contract:
         return self.bill.get_cost()
 
 
-class TermContract(Contract):
+class RatePlan(NamedTuple):
+    """ The parameters of a rate plan. All amounts of money are in mills.
+
+    === Public Attributes ===
+    bill_type:
+        contract type shown on the bills of this plan
+    monthly_fee_mills:
+        fixed cost charged every month
+    deposit_mills:
+        fixed cost charged in the first month of the contract, and refunded
+        when a contract with a term is cancelled after its end date
+    included_mins:
+        calls are free in a month until this many free minutes were used
+    min_rate_mills:
+        cost for one minute of calling
+    included_sms:
+        SMSs are free in a month until this many free SMSs were sent
+    sms_rate_mills:
+        cost for one SMS
+    prepaid:
+        whether calls and SMSs are charged to a balance, which is carried over
+        to the bill of every month
+    initial_credit_mills:
+        credit on the balance of a new prepaid contract
+    top_up_mills:
+        credit added every month while the balance is above
+        <top_up_threshold_mills>
+    top_up_threshold_mills:
+        balance above which the monthly top-up is applied
+    term_months:
+        length of the term of the contract, or 0 for no term
     """
-    A contract in which the customer must pay according
-    to a fixed term, with a specified start and end date.
+    bill_type: str
+    monthly_fee_mills: int = 0
+    deposit_mills: int = 0
+    included_mins: int = 0
+    min_rate_mills: int = 0
+    included_sms: int = 0
+    sms_rate_mills: int = 0
+    prepaid: bool = False
+    initial_credit_mills: int = 0
+    top_up_mills: int = 0
+    top_up_threshold_mills: int = 0
+    term_months: int = 0
+
+
+# The rate plans available to new contracts, by the name used for the
+# "contract" of a line in the input dataset
+RATE_PLANS: dict[str, RatePlan] = {
+    'mtm': RatePlan('MTM', monthly_fee_mills=MTM_MONTHLY_FEE_MILLS,
+                    min_rate_mills=MTM_MINS_COST_MILLS),
+    'term': RatePlan('TERM', monthly_fee_mills=TERM_MONTHLY_FEE_MILLS,
+                     deposit_mills=TERM_DEPOSIT_MILLS,
+                     included_mins=TERM_MINS,
+                     min_rate_mills=TERM_MINS_COST_MILLS,
+                     term_months=TERM_LENGTH_MONTHS),
+    'prepaid': RatePlan('PREPAID', min_rate_mills=PREPAID_MINS_COST_MILLS,
+                        prepaid=True,
+                        initial_credit_mills=PREPAID_INITIAL_CREDIT_MILLS,
+                        top_up_mills=PREPAID_TOP_UP_MILLS,
+                        top_up_threshold_mills=PREPAID_TOP_UP_THRESHOLD_MILLS)
+}
+
+
+def load_rate_plans(plans: dict[str, dict]) -> None:
+    """ Add the rate plans described by <plans> to RATE_PLANS, replacing any
+    plan with the same name. <plans> maps each plan name to a dictionary of
+    RatePlan parameters, e.g. as loaded from a JSON file:
+
+    {"family": {"bill_type": "FAMILY", "monthly_fee_mills": 35000,
+                "included_mins": 300, "min_rate_mills": 40}}
+
+    Raise a TypeError if a plan has unknown or missing parameters.
+    """
+    for name, params in plans.items():
+        RATE_PLANS[name] = RatePlan(**params)
+
+
+class PlanContract(Contract):
+    """ A contract whose rates and fees are given by a RatePlan.
 
     === Public Attributes ===
     start:
-         This is the starting date for the contract
-    end:
-        This is the date at which the contract ends.
+         starting date for the contract
     bill:
-        This is the bill for this contract for the last month of call
-         records loaded from the input dataset.
+         bill for this contract for the last month of call records loaded from
+         the input dataset
+    plan:
+        the rate plan of this contract
     current:
-        This is the current date, updated every time months advance.
+        the first day of the current month, updated every time months advance
+    balance_mills:
+        the balance in mills of a prepaid plan, where a negative value
+        indicates credit; always 0 for other plans
     """
+    # === Private Attributes ===
+    # _included_mins:
+    #     the included minutes of the plan
+    # _balance_rate:
+    #     the cost of one minute charged to the balance, i.e. the rate of a
+    #     prepaid plan or 0
+    # _included_sms:
+    #     the included SMSs of the plan
+    # _sms_balance_rate:
+    #     the cost of one SMS charged to the balance, i.e. the SMS rate of a
+    #     prepaid plan or 0
+    #
+    # These copies of the plan parameters keep bill_call() and bill_sms() free
+    # of lookups through the plan.
     start: datetime.date
-    current: datetime.date
     bill: Optional[Bill]
-    end: datetime.date
-
-    def __init__(self, start: datetime.date, end: datetime.date) -> None:
-        """ Create a new TermContract with the <start> date, starts as inactive.
+    plan: RatePlan
+    current: datetime.date
+    balance_mills: int
+    _included_mins: int
+    _balance_rate: int
+    _included_sms: int
+    _sms_balance_rate: int
+
+    def __init__(self, start: datetime.date, plan: RatePlan) -> None:
+        """ Create a new contract on the rate plan <plan> with the <start>
+        date, starts as inactive.
         """
         Contract.__init__(self, start)
-        self.bill = None
+        self.plan = plan
         self.current = start
-        self.end = end
+        self.balance_mills = -plan.initial_credit_mills if plan.prepaid else 0
+        self._included_mins = plan.included_mins
+        self._balance_rate = plan.min_rate_mills if plan.prepaid else 0
+        self._included_sms = plan.included_sms
+        self._sms_balance_rate = plan.sms_rate_mills if plan.prepaid else 0
+
+    @property
+    def balance(self) -> float:
+        """ The balance in dollars, where a negative value indicates credit
+        """
+        return to_dollars(self.balance_mills)
 
-    def new_month(self, month: int, year: int, bill: Bill) -> None:
+    @balance.setter
+    def balance(self, value: float) -> None:
+        """ Set the balance to <value> dollars
         """
-        This method overrides the method in the superclass because
-        it is an abstract (uninitiated) method.
+        self.balance_mills = to_mills(value)
 
-        Advance to a new month in the term contract (either an already
-        existing contract or the first month of the contract). Store the
-        <bill> argument in this contract and set the appropriate rate
-        per minute and fixed cost.
+    def new_month(self, month: int, year: int, bill: Bill) -> None:
+        """ Advance to a new month (either an already existing contract or
+        the first month of the contract). Store the <bill> argument in this
+        contract and set the rates and fixed cost of the plan.
+
+        A prepaid balance is carried over as a fixed cost, and topped up while
+        it is above the plan's threshold.
         """
-        # store the bill argument
         self.bill = bill
-        # set rates using pre-defined constant
-        self.bill.set_rates('TERM', TERM_MINS_COST)
+        self.charge_month(month, year, bill, self.balance_mills)
+        self.current = datetime.date(year, month, 1)
 
-        first_month = self.start.month
-        first_year = self.start.year
+    def charge_month(self, month: int, year: int, bill: Bill,
+                     balance_mills: int) -> None:
+        """ Set the rates per minute and per SMS and add the fixed costs of
+        the month <month> of <year> to <bill>, as new_month() does, for a
+        prepaid balance of <balance_mills> at the start of that month.
 
-        if first_month == month and first_year == year:
-            self.bill.add_fixed_cost(TERM_DEPOSIT)
+        Unlike new_month(), this does not advance this contract, so it can
+        also fill in the bill of a past month.
+        """
+        plan = self.plan
+        bill.set_rates_mills(plan.bill_type, plan.min_rate_mills)
+        bill.set_sms_rate_mills(plan.sms_rate_mills)
 
-        # add fixed cost
-        self.bill.add_fixed_cost(TERM_MONTHLY_FEE)
+        if plan.deposit_mills and self.start.month == month \
+                and self.start.year == year:
+            bill.add_fixed_cost_mills(plan.deposit_mills)
+        bill.add_fixed_cost_mills(plan.monthly_fee_mills)
 
-        # add free minimum
-        # self.bill.free_min = 0
-
-        # update current date
-        self.current = datetime.date(year, month, 1)
+        if plan.prepaid:
+            bill.add_fixed_cost_mills(balance_mills)
+            if balance_mills > plan.top_up_threshold_mills:
+                bill.add_fixed_cost_mills(-plan.top_up_mills)
 
     def bill_call(self, call: Call) -> None:
         """ Add the <call> to the bill.
 
+        The call is free as long as fewer than the plan's included minutes
+        were used for free this month, and billed otherwise.
+
         Precondition:
         - a bill has already been created for the month+year when the <call>
         was made. In other words, you can safely assume that self.bill has been
         already advanced to the right month+year.
         """
-        if self.bill.free_min >= TERM_MINS:
-            self.bill.add_billed_minutes(ceil(call.duration / 60.0))
+        minutes = ceil(call.duration / 60.0)
+        bill = self.bill
+        if bill.free_min < self._included_mins:
+            bill.free_min += minutes
         else:
-            self.bill.add_free_minutes(ceil(call.duration / 60.0))
+            bill.billed_min += minutes
+        self.balance_mills += minutes * self._balance_rate
+
+    def bill_calls(self, minutes: Sequence[int]) -> None:
+        """ Add a batch of calls to the bill, given as the number of minutes
+        <minutes> each call is charged for, in the order the calls were made.
+
+        As in bill_call(), a call is free as long as fewer than the included
+        minutes were used before it, so the running total of free minutes is
+        bisected to find the first billed call.
+        """
+        # used[i] is the number of free minutes used before call i, as long
+        # as all the calls before it were free
+        used = list(accumulate(minutes, initial=self.bill.free_min))
+        num_free = bisect_left(used, self._included_mins, 0, len(minutes))
+        self.bill.add_free_minutes(used[num_free] - used[0])
+        self.bill.add_billed_minutes(used[-1] - used[num_free])
+        self.balance_mills += (used[-1] - used[0]) * self._balance_rate
+
+    def bill_sms(self, count: int = 1) -> None:
+        """ Add <count> SMSs sent in the current month to the bill.
+
+        SMSs are free until the plan's included SMSs were sent this month, and
+        billed after that.
+        """
+        bill = self.bill
+        free = min(count, max(0, self._included_sms - bill.free_sms))
+        bill.free_sms += free
+        bill.billed_sms += count - free
+        self.balance_mills += (count - free) * self._sms_balance_rate
+
+    def cancel_contract(self) -> float:
+        """ Return the amount owed in order to close the phone line associated
+        with this contract.
+
+        A prepaid contract owes its last bill only if its balance is positive;
+        otherwise the remaining credit is forfeited and nothing is owed.
+        """
+        self.start = None
+        if self.plan.prepaid and self.balance_mills <= 0:
+            return 0
+        return self.bill.get_cost()
+
+
+class TermContract(PlanContract):
+    """
+    A contract in which the customer must pay according
+    to a fixed term, with a specified start and end date.
+
+    === Public Attributes ===
+    start:
+         This is the starting date for the contract
+    end:
+        This is the date at which the contract ends.
+    bill:
+        This is the bill for this contract for the last month of call
+         records loaded from the input dataset.
+    current:
+        This is the current date, updated every time months advance.
+    """
+    start: datetime.date
+    current: datetime.date
+    bill: Optional[Bill]
+    end: datetime.date
+
+    def __init__(self, start: datetime.date, end: datetime.date,
+                 plan: Optional[RatePlan] = None) -> None:
+        """ Create a new TermContract with the <start> date, starts as inactive.
+        The rates are those of the <plan>, or of the "term" rate plan if <plan>
+        is None.
+        """
+        PlanContract.__init__(self, start,
+                              RATE_PLANS['term'] if plan is None else plan)
+        self.end = end
 
     def cancel_contract(self) -> float:
         """
@@ -176,16 +412,15 @@ class TermContract(Contract):
             return self.bill.get_cost()
 
         else:  # customer gets deposit - months cost back
-            # self.bill.add_fixed_cost((-1) * TERM_DEPOSIT)
-            # return (- 1 * TERM_DEPOSIT) + self.bill.get_cost()
-            return_v = (- 1 * TERM_DEPOSIT) + self.bill.get_cost()
-            return return_v
+            return_v = (- 1 * self.plan.deposit_mills) + \
+                self.bill.get_cost_mills()
+            return to_dollars(return_v)
 
 
-class MTMContract(Contract):
+class MTMContract(PlanContract):
     """
     A contract in which the phone line's billing is done on a
-    month-to-month basis.
+    month-to-month basis, on the "mtm" rate plan.
 
     === Public Attributes ===
     start:
@@ -201,100 +436,61 @@ class MTMContract(Contract):
     bill: Optional[Bill]
 
     def __init__(self, start: datetime.date) -> None:
-        """ Create a new TermContract with the <start> date, starts as inactive.
+        """ Create a new MTMContract with the <start> date, starts as inactive.
         """
-        Contract.__init__(self, start)
-        self.bill = None
+        PlanContract.__init__(self, start, RATE_PLANS['mtm'])
 
-    def new_month(self, month: int, year: int, bill: Bill) -> None:
-        """
-        This method overrides the method in the superclass because
-        it is an abstract (uninitiated) method.
 
-        Advance to a new month in the term contract (either an already
-        existing contract or the first month of the contract). Store the
-        <bill> argument in this contract and set the appropriate rate
-        per minute and fixed cost.
-        """
-        self.bill = bill
-        # set the rates according to the provided constant
-        self.bill.set_rates('MTM', MTM_MINS_COST)
-        # no initial deposit so just add monthly fee
-        self.bill.add_fixed_cost(MTM_MONTHLY_FEE)
-
-
-class PrepaidContract(Contract):
+class PrepaidContract(PlanContract):
     """ A contract in which there is a start date but not an end date, no
-    included minutes and an associated balance.
+    included minutes and an associated balance, on the "prepaid" rate plan.
 
     === Public Attributes ===
     bill:
          This is the bill for this contract for the last month of call
          records loaded from the input dataset.
-    balance:
-        the balance, where a negative value indicates credit
+    balance_mills:
+        the balance in mills, where a negative value indicates credit
 
     === Preconditions ===
     Once again, assume that the customer pays the bill on time each month.
     """
     start: datetime.date
     bill: Optional[Bill]
-    balance: float
+    balance_mills: int
 
     def __init__(self, start: datetime.date, balance: float) -> None:
-        Contract.__init__(self, start)
-        self.balance = - balance
-        self.bill = None
-
-    def new_month(self, month: int, year: int, bill: Bill) -> None:
+        """ Create a new PrepaidContract with the <start> date and <balance>
+        dollars of credit, starts as inactive.
         """
-        Advance to a new month, corresponding to <month> and <year>.
-        Then, store the <bill> argument in this argument. If the balance
-        is less than $10, top up the balance with $25.
-        """
-        # store the <bill> argument
-        self.bill = bill
+        PlanContract.__init__(self, start, RATE_PLANS['prepaid'])
+        self.balance_mills = - to_mills(balance)
 
-        self.bill.add_fixed_cost(self.balance)
-        self.bill.set_rates('PREPAID', PREPAID_MINS_COST)
 
-        # later months: only method of payment/cycle = $25 top-up
-
-        # now we have to consider the $25 top up
-        if self.balance > -10:
-            # self.balance -= -25
-            self.bill.add_fixed_cost(-25)
-
-    def bill_call(self, call: Call) -> None:
-        """ Add the <call> to the bill.
-
-        Precondition:
-        - a bill has already been created for the month+year when the <call>
-        was made. In other words, you can safely assume that self.bill has been
-        already advanced to the right month+year.
-        """
-        self.bill.add_billed_minutes(ceil(call.duration / 60.0))
-
-        # take away amount
-        self.balance = self.balance + (
-            ceil(call.duration / 60.0) * PREPAID_MINS_COST)
+def _add_months(start: datetime.date, months: int) -> datetime.date:
+    """ Return the date <months> months after <start>, on the same day of the
+    month or on the last day of a shorter month.
+    """
+    month_index = start.year * 12 + start.month - 1 + months
+    year, month = divmod(month_index, 12)
+    day = min(start.day, calendar.monthrange(year, month + 1)[1])
+    return datetime.date(year, month + 1, day)
 
-    def cancel_contract(self) -> float:
-        """
-        Return the amount owed. If the balance is negative, forfeit the
-        balance. Otherwise, if it is positive, it is returned
 
-        Precondition:
-        Assume self.bill exists for the right month+year when the
-        cancellation is requested
-        """
-        self.start = None
+def create_contract(plan_name: str, start: datetime.date) \
+        -> Optional[Contract]:
+    """ Return a new contract starting on <start> on the rate plan registered
+    in RATE_PLANS as <plan_name>, or None if there is no such plan.
 
-        if self.balance > 0:
-            # return self.balance  # return cost
-            return self.bill.get_cost()
-        else:
-            return 0  # amount forfeited
+    Plans with a term create a TermContract ending <term_months> months after
+    <start>.
+    """
+    plan = RATE_PLANS.get(plan_name)
+    if plan is None:
+        return None
+    if plan.term_months:
+        return TermContract(start, _add_months(start, plan.term_months), plan)
+    return PlanContract(start, plan)
 
 
 if __name__ == '__main__':
@@ -302,7 +498,8 @@ if __name__ == '__main__':
 
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'datetime', 'bill', 'call', 'math'
+            'python_ta', 'typing', 'datetime', 'bill', 'call', 'math',
+            'bisect', 'itertools', 'calendar'
         ],
         'disable': ['R0902', 'R0913'],
         'generated-members': 'pygame.*'
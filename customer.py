@@ -11,29 +11,41 @@ any changes, are expressly prohibited.
 All of the files in this directory and all subdirectories are:
 Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
 """
-from typing import Union
+import datetime
+from collections.abc import KeysView
+from typing import Iterator, Optional, Union
 from phoneline import PhoneLine
 from call import Call
-from callhistory import CallHistory
+from callhistory import CallHistory, CallsView
+from bill import to_mills, to_dollars
+from numberregistry import NUMBERS
 
 
 class Customer:
     """ A MewbileTech customer.
 
+    Methods taking a phone number also accept the id of the number in the
+    NUMBERS registry instead.
     """
     # === Private Attributes ===
     # _id:
     #     this customer's 4 digit Customer id
     # _phone_lines:
     #     this customer's phone lines
+    # _calls:
+    #     every call made or received by this customer's phone lines, mapped
+    #     to its number of registrations; kept up to date by the lines' call
+    #     histories
     _id: int
     _phone_lines: list[PhoneLine]
+    _calls: dict[Call, int]
 
     def __init__(self, cid: int) -> None:
         """ Create a new Customer with the <cid> id
         """
         self._id = cid
         self._phone_lines = []
+        self._calls = {}
 
     def new_month(self, month: int, year: int) -> None:
         """ Advance to a new month (specified by <month> and <year>) in the
@@ -54,8 +66,7 @@ class Customer:
         # change this one up
         # check if the phone line is associated with the source phone number
         for i in self._phone_lines:
-            num = i.get_number()
-            if num == call.src_number:
+            if i.get_number_id() == call.src_id:
                 i.make_call(call)
 
     def receive_call(self, call: Call) -> None:
@@ -68,19 +79,47 @@ class Customer:
         # check if the phone line is associated with the destination phone
         # number
         for i in self._phone_lines:
-            num = i.get_number()
-            if num == call.dst_number:
+            if i.get_number_id() == call.dst_id:
                 i.receive_call(call)
 
-    def cancel_phone_line(self, number: str) -> Union[float, None]:
+    def send_sms(self, number: Union[str, int], month: int,
+                 year: int) -> None:
+        """ Record that an SMS was sent from the phone number <number> in
+        <month> of <year>.
+
+        Precondition: The phone line with the number <number> is owned by this
+        customer
+        """
+        nid = NUMBERS.lookup(number)
+        for line in self._phone_lines:
+            if line.get_number_id() == nid:
+                line.send_sms(month, year)
+
+    def receive_sms(self, number: Union[str, int], month: int,
+                    year: int) -> None:
+        """ Record that an SMS was sent to the phone number <number> in
+        <month> of <year>.
+
+        Precondition: The phone line with the number <number> is owned by this
+        customer
+        """
+        nid = NUMBERS.lookup(number)
+        for line in self._phone_lines:
+            if line.get_number_id() == nid:
+                line.receive_sms(month, year)
+
+    def cancel_phone_line(self, number: Union[str, int]) \
+            -> Union[float, None]:
         """ Remove PhoneLine with number <number> from this customer and return
         the amount still owed by this customer.
         Return None if <number> is not owned by this customer.
         """
         fee = None
+        nid = NUMBERS.lookup(number)
         for pl in self._phone_lines:
-            if pl.get_number() == number:
+            if pl.get_number_id() == nid:
                 self._phone_lines.remove(pl)
+                pl.get_call_history().detach_index(self._calls)
                 fee = pl.cancel_line()
         return fee
 
@@ -94,6 +133,18 @@ class Customer:
         """ Add a new PhoneLine to this customer.
         """
         self._phone_lines.append(pline)
+        pline.get_call_history().attach_index(self._calls)
+
+    def get_phone_line(self, number: Union[str, int]) -> Optional[PhoneLine]:
+        """ Return the phone line with the number <number> owned by this
+        customer, or None if this customer does not own <number>.
+        """
+        found = None
+        nid = NUMBERS.lookup(number)
+        for line in self._phone_lines:
+            if line.get_number_id() == nid:
+                found = line
+        return found
 
     def get_phone_numbers(self) -> list[str]:
         """ Return a list of all of the numbers this customer owns
@@ -103,17 +154,24 @@ class Customer:
             numbers.append(line.get_number())
         return numbers
 
+    def get_number_ids(self) -> list[int]:
+        """ Return a list of the ids of all of the numbers this customer owns,
+        in the NUMBERS registry
+        """
+        return [line.get_number_id() for line in self._phone_lines]
+
     def get_id(self) -> int:
         """ Return the id for this customer
         """
         return self._id
 
-    def __contains__(self, item: str) -> bool:
+    def __contains__(self, item: Union[str, int]) -> bool:
         """ Check if this customer owns the phone number <item>
         """
         contains = False
+        nid = NUMBERS.lookup(item)
         for line in self._phone_lines:
-            if line.get_number() == item:
+            if line.get_number_id() == nid:
                 contains = True
         return contains
 
@@ -127,11 +185,60 @@ class Customer:
         total = 0
         for line in self._phone_lines:
             line_bill = line.get_bill(month, year)
+            if line_bill is not None:
+                bills.append(line_bill)
+                # line totals are whole numbers of mills, so add them exactly
+                total += to_mills(line_bill['total'])
+        return self._id, to_dollars(total), bills
+
+    def generate_bill_mills(self, month: int, year: int) \
+            -> tuple[int, int, list[dict]]:
+        """ Return a bill summary like generate_bill(), with all amounts of
+        money as integers in mills: the total cost for all phone lines, and
+        the amounts in the bill summary of each phone line.
+        """
+        bills = []
+        total = 0
+        for line in self._phone_lines:
+            line_bill = line.get_bill_mills(month, year)
             if line_bill is not None:
                 bills.append(line_bill)
                 total += line_bill['total']
         return self._id, total, bills
 
+    def get_billing_state(self) -> list[tuple]:
+        """ Return the billing state of each phone line owned by this customer,
+        in order, as returned by PhoneLine.get_billing_state().
+        """
+        return [line.get_billing_state() for line in self._phone_lines]
+
+    def set_billing_state(self, states: list[tuple]) -> None:
+        """ Replace the billing state of each phone line owned by this customer
+        with the corresponding entry of <states>, as returned by
+        get_billing_state() on an identical customer.
+        """
+        for line, state in zip(self._phone_lines, states):
+            line.set_billing_state(state)
+
+    def iter_line_bills(self, month: int = None, year: int = None) \
+            -> Iterator[tuple[int, int, dict]]:
+        """ Yield a (month, year, bill summary) Tuple for every bill of every
+        phone line owned by this customer, line by line and month by month.
+        The bill summaries are the same as those of generate_bill().
+
+        If <month> and <year> are provided, only yield the bills for that
+        billing cycle.
+        """
+        for line in self._phone_lines:
+            if month is not None and year is not None:
+                dates = [(month, year)]
+            else:
+                dates = line.get_bill_dates()
+            for bill_month, bill_year in dates:
+                line_bill = line.get_bill(bill_month, bill_year)
+                if line_bill is not None:
+                    yield bill_month, bill_year, line_bill
+
     def print_bill(self, month: int, year: int) -> None:
         """ Print the bill for the <month> and <year> billing cycle, to the
         console.
@@ -158,32 +265,81 @@ class Customer:
         """
         history = ([], [])
         for line in self._phone_lines:
-            line_history = line.get_monthly_history()
-            history[0].extend(line_history[0])
-            history[1].extend(line_history[1])
+            line_history = line.get_call_history()
+            history[0].extend(line_history.get_outgoing_view())
+            history[1].extend(line_history.get_incoming_view())
         return history
 
-    def get_call_history(self, number: str = None) -> list[CallHistory]:
+    def get_outgoing_views(self) -> list[CallsView]:
+        """ Return read-only views of the outgoing calls of each phone line
+        owned by this customer, in the same order as get_history().
+        """
+        return [line.get_call_history().get_outgoing_view()
+                for line in self._phone_lines]
+
+    def get_call_set(self) -> KeysView[Call]:
+        """ Return a read-only, set-like view of all calls made or received by
+        this customer's phone lines. The view is not a copy: it is updated as
+        new calls are registered.
+        """
+        return self._calls.keys()
+
+    def get_calls_between(self, start: datetime.datetime,
+                          end: datetime.datetime,
+                          number: Union[str, int] = None) \
+            -> tuple[list[Call], list[Call]]:
+        """ Return all calls made and received between <start> and <end>
+        inclusive by the phone line <number>, or by all of this customer's
+        phone lines if <number> is not provided, as a tuple in the following
+        format:
+        (outgoing calls, incoming calls)
+
+        The calls of each phone line are in chronological order.
+        """
+        calls = ([], [])
+        nid = None if number is None else NUMBERS.lookup(number)
+        for line in self._phone_lines:
+            if number is None or line.get_number_id() == nid:
+                line_calls = line.get_calls_between(start, end)
+                calls[0].extend(line_calls[0])
+                calls[1].extend(line_calls[1])
+        return calls
+
+    def get_call_history(self, number: Union[str, int] = None) \
+            -> list[CallHistory]:
         """ Return the call history for <number>, stored into a list.
         If <number> is not provided, return a list of all call histories for all
         phone lines owned by this customer.
         """
         history = []
+        nid = None if number is None else NUMBERS.lookup(number)
         for line in self._phone_lines:
             if number is not None:
-                if line.get_number() == number:
+                if line.get_number_id() == nid:
                     history.append(line.get_call_history())
             else:
                 history.append(line.get_call_history())
         return history
 
 
+def get_version(customers: list[Customer]) -> tuple[int, int]:
+    """ Return the numbers of calls and of phone lines of <customers>, which
+    change whenever calls are added to them or lines cancelled.
+    """
+    calls = lines = 0
+    for customer in customers:
+        calls += len(customer.get_call_set())
+        lines += len(customer.get_number_ids())
+    return calls, lines
+
+
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'phoneline', 'call', 'callhistory'
+            'python_ta', 'typing', 'phoneline', 'call', 'callhistory',
+            'collections.abc', 'datetime', 'bill', 'numberregistry'
         ],
         'allowed-io': ['print_bill'],
         'disable': ['R0902', 'R0913'],
@@ -11,11 +11,24 @@ any changes, are expressly prohibited.
 All of the files in this directory and all subdirectories are:
 Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
 """
+import re
 import time
 import datetime
-from typing import Any, Optional
-from call import Call
+from array import array
+from collections.abc import KeysView, Sequence
+from multiprocessing.pool import Pool
+from typing import Any, Iterable, Iterator, Optional, Union
+from call import Call, MONTH_SHIFT, pack_month, pack_time, unpack_time
+from callbitmap import CallBitmap
+from callgraph import CallGraph
+from callstore import SharedCallStore
 from customer import Customer
+from monthindex import MonthIndex, month_number
+from numberregistry import NUMBERS
+from topk import top_customers
+
+# Maximum number of calls yielded at once by Filter.apply_chunks
+CHUNK_SIZE = 256
 
 
 class Filter:
@@ -53,12 +66,133 @@ class Filter:
         """
         raise NotImplementedError
 
+    def apply_chunks(self, customers: list[Customer],
+                     data: list[Call],
+                     filter_string: str,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[list[Call]]:
+        """ Yield the calls that apply() returns for the same arguments, in
+        the same order, as consecutive lists of at most <chunk_size> calls.
+
+        Subclasses that can find their matches one at a time override this,
+        so that the first chunk is available before the whole of <data> has
+        been scanned. This default simply splits the result of apply().
+
+        Precondition:
+        - chunk_size > 0
+        """
+        yield from _chunked(self.apply(customers, data, filter_string),
+                            chunk_size)
+
+    def apply_new(self, customers: list[Customer],
+                  new_data: list[Call],
+                  filter_string: str) -> list[Call]:
+        """ Return the calls from <new_data> that this filter keeps, when it
+        was applied with <filter_string> before the calls of <new_data> were
+        added to <customers>, e.g. by live ingestion.
+
+        This lets a filtered view be extended with new calls without applying
+        its filters to all of the calls again. This default returns apply() on
+        <new_data>. Subclasses whose apply() returns all of <data> when none
+        of it matches override this, since <new_data> is only a part of the
+        calls. Filters that depend on all of the calls (e.g. "Nd" time ranges)
+        are evaluated on <new_data> alone.
+        """
+        return self.apply(customers, new_data, filter_string)
+
+    def to_query(self, customers: list[Customer], data: Sequence[Call],
+                 filter_string: str) -> Optional[tuple]:
+        """ Return the query that selects the calls of <data> kept by this
+        filter with <filter_string>, to be run on the columns of a
+        SharedCallStore by match_indices(), or None if the filter string is
+        invalid, in which case apply() returns <data> unchanged.
+
+        The query is a small Tuple, which is cheap to send to another process,
+        unlike <customers> and <data>.
+        """
+        raise NotImplementedError
+
+    def apply_bitmap(self, customers: list[Customer], data: CallBitmap,
+                     filter_string: str) -> CallBitmap:
+        """ Return the bitmap of the calls that apply() keeps from the calls
+        of the bitmap <data>, whose index must hold every call of
+        <customers>.
+
+        The calls of the index selected by the query of this filter are
+        found once per query, and kept by the index; applying the filter to
+        any bitmap is then an intersection of bitmaps. The calls of <data>
+        are only listed if the query depends on them (e.g. "Nd" time ranges).
+        """
+        query = self.to_query(customers, _BitmapCalls(data), filter_string)
+        if query is None:
+            return data
+        selected = data.index.get_query_bitmap(
+            query, lambda calls: run_queries(calls, [query], customers))
+        return data & selected
+
+    def normalize(self, filter_string: str) -> str:
+        """ Return the canonical form of <filter_string>: a filter string for
+        which apply() gives the same result, and which is the same for all of
+        the filter strings equivalent to <filter_string>, e.g. to use as a
+        cache key. This default returns <filter_string> itself.
+        """
+        return filter_string
+
     def __str__(self) -> str:
         """ Return a description of this filter to be displayed in the UI menu
         """
         raise NotImplementedError
 
 
+def _chunked(calls: Iterable[Call], chunk_size: int) -> Iterator[list[Call]]:
+    """ Yield the calls from <calls> in order, grouped into lists of at most
+    <chunk_size> calls.
+    """
+    chunk = []
+    for call in calls:
+        chunk.append(call)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _unique(calls: Iterable[Call]) -> Iterator[Call]:
+    """ Yield the calls from <calls> in order, skipping the calls already
+    yielded.
+    """
+    seen = set()
+    for call in calls:
+        if call not in seen:
+            seen.add(call)
+            yield call
+
+
+def _apply_query(f: Filter, customers: list[Customer], data: list[Call],
+                 filter_string: str) -> list[Call]:
+    """ Return the calls from <data> selected by the query of the filter <f>
+    with <filter_string>, or <data> if the filter string is invalid.
+    """
+    query = f.to_query(customers, data, filter_string)
+    if query is None:
+        return data
+    return list(run_queries(data, [query], customers))
+
+
+def _apply_query_chunks(f: Filter, customers: list[Customer],
+                        data: list[Call], filter_string: str,
+                        chunk_size: int) -> Iterator[list[Call]]:
+    """ Yield the calls that _apply_query() returns, in chunks of at most
+    <chunk_size> calls, as they are found in <data>.
+    """
+    query = f.to_query(customers, data, filter_string)
+    if query is None:
+        yield from _chunked(data, chunk_size)
+    else:
+        yield from _chunked(run_queries(data, [query], customers),
+                            chunk_size)
+
+
 class ResetFilter(Filter):
     """
     A class for resetting all previously applied filters, if any.
@@ -78,11 +212,38 @@ class ResetFilter(Filter):
         """
         filtered_calls = []
         for c in customers:
-            customer_history = c.get_history()
             # only take outgoing calls, we don't want to include calls twice
-            filtered_calls.extend(customer_history[0])
+            for line_calls in c.get_outgoing_views():
+                filtered_calls.extend(line_calls)
         return filtered_calls
 
+    def apply_new(self, customers: list[Customer],
+                  new_data: list[Call],
+                  filter_string: str) -> list[Call]:
+        """ Return all of the calls from <new_data>, which a reset shows.
+        """
+        return new_data
+
+    def apply_bitmap(self, customers: list[Customer], data: CallBitmap,
+                     filter_string: str) -> CallBitmap:
+        """ Return the bitmap of all of the calls of <customers>, in the index
+        of <data>.
+        """
+        index = data.index
+        index.add(self.apply(customers, [], filter_string))
+        return index.get_all()
+
+    def to_query(self, customers: list[Customer], data: Sequence[Call],
+                 filter_string: str) -> Optional[tuple]:
+        """ Return the query selecting every call of a store.
+        """
+        return ('all',)
+
+    def normalize(self, filter_string: str) -> str:
+        """ Return the empty string, since the filter string is ignored.
+        """
+        return ''
+
     def __str__(self) -> str:
         """ Return a description of this filter to be displayed in the UI menu
         """
@@ -94,34 +255,10 @@ def helper_one(new_call: Any, phone_number_: Any, result_calls: list) -> None:
     This is a helper function that helps apply the Customer Filter
     ("c") by adding customer calls to an existing list.
     """
-    if new_call.src_number == phone_number_:
+    if new_call.src_id == NUMBERS.lookup(phone_number_):
         result_calls.append(new_call)
 
 
-def _add_call_if_matched(call: Call, phone_number: str,
-                         return_list: list[Call]) -> None:
-    """helper function to add a call to the return list if it matches the
-    phone number. """
-    # if call.src_number == phone_number or call.dst_number == phone_number:
-    if phone_number in {call.src_number, call.dst_number}:
-        if call not in return_list:
-            return_list.append(call)
-
-
-def _filter_calls_by_customer(customers: list[Customer],
-                              data: list[Call],
-                              filter_string: str) -> list[Call]:
-    """helper function to filter calls based on customer ID."""
-    return_list = []
-    for customer in customers:
-        if str(customer.get_id()) == filter_string:
-            phone_numbers = customer.get_phone_numbers()
-            for phone_number in phone_numbers:
-                for call in data:
-                    _add_call_if_matched(call, phone_number, return_list)
-    return return_list
-
-
 class CustomerFilter(Filter):
     """
     A class for selecting only the calls from a given customer.
@@ -144,15 +281,70 @@ class CustomerFilter(Filter):
 
         Do not mutate any of the function arguments!
         """
-        try:
-            return_list = _filter_calls_by_customer(customers, data,
-                                                    filter_string)
-            if return_list:
-                return return_list
-            else:
-                return data
-        except (IndexError, TypeError, ValueError):
+        query = self.to_query(customers, data, filter_string)
+        if query is None:
             return data
+        return list(_unique(run_queries(data, [query], customers))) or data
+
+    def apply_chunks(self, customers: list[Customer],
+                     data: list[Call],
+                     filter_string: str,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[list[Call]]:
+        """ Yield the calls that apply() returns, in chunks of at most
+        <chunk_size> calls, as they are found in <data>.
+
+        Since apply() returns <data> when the customer has no calls in it,
+        the whole of <data> is yielded once the scan finds no match.
+        """
+        query = self.to_query(customers, data, filter_string)
+        found = False
+        if query is not None:
+            for chunk in _chunked(
+                    _unique(run_queries(data, [query], customers)),
+                    chunk_size):
+                found = True
+                yield chunk
+        if not found:
+            yield from _chunked(data, chunk_size)
+
+    def apply_new(self, customers: list[Customer],
+                  new_data: list[Call],
+                  filter_string: str) -> list[Call]:
+        """ Return the calls from <new_data> made or received by the customer
+        with the id specified in <filter_string>, or all of <new_data> if
+        the filter string is invalid.
+
+        Unlike apply(), no call is returned when the customer has none in
+        <new_data>.
+        """
+        query = self.to_query(customers, new_data, filter_string)
+        if query is None:
+            return new_data
+        return list(_unique(run_queries(new_data, [query], customers)))
+
+    def apply_bitmap(self, customers: list[Customer], data: CallBitmap,
+                     filter_string: str) -> CallBitmap:
+        """ Return the bitmap of the calls of <data> made or received by the
+        customer with the id specified in <filter_string>, or <data> if
+        there are none, like apply().
+        """
+        return super().apply_bitmap(customers, data, filter_string) or data
+
+    def to_query(self, customers: list[Customer], data: Sequence[Call],
+                 filter_string: str) -> Optional[tuple]:
+        """ Return the query selecting the calls made or received by the
+        customer with the id specified in <filter_string>. As for apply(),
+        apply_shared() keeps all of the calls if none of them match.
+
+        With <customers>, run_queries() selects the calls of the call set of
+        the customer, like apply().
+        """
+        numbers = frozenset(nid for customer in customers
+                            if str(customer.get_id()) == filter_string
+                            for nid in customer.get_number_ids())
+        if not numbers:
+            return None
+        return ('customer', numbers)
 
     def __str__(self) -> str:
         """ Return a description of this filter to be displayed in the UI menu
@@ -160,6 +352,31 @@ class CustomerFilter(Filter):
         return "Filter events based on customer ID"
 
 
+def _parse_duration(filter_string: str) -> Optional[tuple[bool, int]]:
+    """Helper function to parse a "Lxxx" or "Gxxx" filter_string into a
+    (less_than, seconds) pair. Return None if the filter_string is invalid."""
+    if len(filter_string.strip()) == 0 or filter_string[0] not in 'LG':
+        return None
+    try:
+        return filter_string[0] == 'L', int(filter_string[1:4])
+    except ValueError:
+        return None
+
+
+def _match_duration(data: Iterable[Call], less_than: bool,
+                    seconds: int) -> Iterator[Call]:
+    """Helper function to yield, in order, the calls from <data> lasting less
+    than <seconds> if <less_than> is True, or more than <seconds> otherwise."""
+    if less_than:
+        for call in data:
+            if call.duration < seconds:
+                yield call
+    else:
+        for call in data:
+            if call.duration > seconds:
+                yield call
+
+
 class DurationFilter(Filter):
     """
     A class for selecting only the calls lasting either over or under a
@@ -184,31 +401,37 @@ class DurationFilter(Filter):
 
         Do not mutate any of the function arguments!
         """
-        if len(filter_string.strip()) == 0:
-            return data
+        return _apply_query(self, customers, data, filter_string)
 
-        return_list = []
-        try:
-            for i in data:
-                if filter_string[0] == 'L':
-                    curr_text = int(filter_string[1:4])
-                    if i.duration < curr_text:
-                        return_list.append(i)
-                elif filter_string[0] == 'G':
-                    curr_text = int(filter_string[1:4])
-                    if i.duration > curr_text:
-                        return_list.append(i)
-                else:
-                    return data
-            # do error checking
-        except IndexError:
-            return data
-        except TypeError:
-            return data
-        except ValueError:
-            return data
-        else:  # if there are no errors as of this point
-            return return_list
+    def apply_chunks(self, customers: list[Customer],
+                     data: list[Call],
+                     filter_string: str,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[list[Call]]:
+        """ Yield the calls that apply() returns, in chunks of at most
+        <chunk_size> calls, as they are found in <data>.
+        """
+        yield from _apply_query_chunks(self, customers, data, filter_string,
+                                       chunk_size)
+
+    def to_query(self, customers: list[Customer], data: Sequence[Call],
+                 filter_string: str) -> Optional[tuple]:
+        """ Return the query selecting the calls lasting less or more than
+        the duration specified in <filter_string>.
+        """
+        bound = _parse_duration(filter_string)
+        if bound is None:
+            return None
+        return ('duration',) + bound
+
+    def normalize(self, filter_string: str) -> str:
+        """ Return <filter_string> as "Lxxx" or "Gxxx", or unchanged if it is
+        invalid.
+        """
+        bound = _parse_duration(filter_string)
+        if bound is None:
+            return filter_string
+        less_than, seconds = bound
+        return ('L' if less_than else 'G') + '%03d' % seconds
 
     def __str__(self) -> str:
         """ Return a description of this filter to be displayed in the UI menu
@@ -245,17 +468,30 @@ def _is_call_within_boundary(call: Call, north: float, south: float,
            (north <= dst_long <= south and west <= dst_lat <= east)
 
 
-def _filter_calls_by_location(data: list[Call], north: float, south: float,
-                              west: float, east: float) -> list[Call]:
+def _match_location(data: Iterable[Call], north: float, south: float,
+                    west: float, east: float) -> Iterator[Call]:
     """
-    This helper function filters calls based on the coordinates
-    and arguments provided
+    This helper function yields, in order, the calls from <data> within the
+    boundary given by the coordinates
     """
-    return_list = []
     for call in data:
         if _is_call_within_boundary(call, north, south, west, east):
-            return_list.append(call)
-    return return_list
+            yield call
+
+
+def _parse_boundary(filter_string: str) \
+        -> Optional[tuple[float, float, float, float]]:
+    """
+    This helper function returns the (north, south, west, east) boundary
+    described by <filter_string>, or None if it is not a valid boundary
+    """
+    try:
+        north, west, south, east = _parse_coordinates(filter_string)
+    except (IndexError, TypeError, ValueError):
+        return None
+    if _is_valid_boundary(north, south, west, east):
+        return north, south, west, east
+    return None
 
 
 class LocationFilter(Filter):
@@ -289,15 +525,38 @@ class LocationFilter(Filter):
 
         Do not mutate any of the function arguments!
         """
-        try:
-            north, west, south, east = _parse_coordinates(filter_string)
-        except (IndexError, TypeError, ValueError):
-            return data
+        return _apply_query(self, customers, data, filter_string)
 
-        if _is_valid_boundary(north, south, west, east):
-            return _filter_calls_by_location(data, north, south, west, east)
-        else:
-            return data
+    def apply_chunks(self, customers: list[Customer],
+                     data: list[Call],
+                     filter_string: str,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[list[Call]]:
+        """ Yield the calls that apply() returns, in chunks of at most
+        <chunk_size> calls, as they are found in <data>.
+        """
+        yield from _apply_query_chunks(self, customers, data, filter_string,
+                                       chunk_size)
+
+    def to_query(self, customers: list[Customer], data: Sequence[Call],
+                 filter_string: str) -> Optional[tuple]:
+        """ Return the query selecting the calls made or received within the
+        location specified in <filter_string>.
+        """
+        boundary = _parse_boundary(filter_string)
+        if boundary is None:
+            return None
+        return ('location',) + boundary
+
+    def normalize(self, filter_string: str) -> str:
+        """ Return the coordinates of <filter_string> as written by repr(),
+        separated by a comma and a space, or <filter_string> unchanged if it
+        is invalid.
+        """
+        boundary = _parse_boundary(filter_string)
+        if boundary is None:
+            return filter_string
+        north, south, west, east = boundary
+        return ', '.join(map(repr, (north, west, south, east)))
 
     def __str__(self) -> str:
         """ Return a description of this filter to be displayed in the UI menu
@@ -307,12 +566,908 @@ class LocationFilter(Filter):
                "upperLong, upperLat\" (e.g., -79.6, 43.6, -79.3, 43.7)"
 
 
+def _parse_timestamp(text: str, end_of_day: bool) -> datetime.datetime:
+    """Helper function to parse a "YYYY-MM-DD HH:MM:SS" or "YYYY-MM-DD"
+    timestamp. A bare date stands for the start of that day, or for its last
+    second if <end_of_day> is True. Raise ValueError if <text> is invalid."""
+    text = text.strip()
+    try:
+        return datetime.datetime.strptime(text, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        day = datetime.datetime.strptime(text, "%Y-%m-%d")
+        if end_of_day:
+            return day.replace(hour=23, minute=59, second=59)
+        return day
+
+
+def _parse_time_range(filter_string: str, data: list[Call]) \
+        -> Optional[tuple[datetime.datetime, datetime.datetime]]:
+    """Helper function to parse the filter_string of a TimeRangeFilter into
+    a (start, end) pair. Return None if the filter_string is invalid."""
+    text = filter_string.strip()
+    try:
+        if text[-1:] in ('d', 'D'):
+            days = int(text[:-1])
+            if days < 0 or not data:
+                return None
+            end = unpack_time(max(call.packed_time for call in data))
+            return end - datetime.timedelta(days=days), end
+        first, last = text.split(',')
+        start = _parse_timestamp(first, False)
+        end = _parse_timestamp(last, True)
+    except (ValueError, OverflowError):
+        # OverflowError: N days before the end is out of the range of dates
+        return None
+    if start > end:
+        return None
+    return start, end
+
+
+def _match_time(data: Iterable[Call], first: int,
+                last: int) -> Iterator[Call]:
+    """Helper function to yield, in order, the calls from <data> made between
+    the packed times <first> and <last> inclusive."""
+    for call in data:
+        if first <= call.packed_time <= last:
+            yield call
+
+
+class TimeRangeFilter(Filter):
+    """
+    A class for selecting only the calls made within a given period of time
+    """
+
+    def apply(self, customers: list[Customer],
+              data: list[Call],
+              filter_string: str) \
+            -> list[Call]:
+        """ Return a list of all unique calls from <data> made within the
+        period specified by the <filter_string>.
+
+        The <customers> list contains all customers from the input dataset.
+
+        The filter string is valid if and only if it has one of these forms:
+        - "start, end": two timestamps, each either "YYYY-MM-DD HH:MM:SS" or
+          "YYYY-MM-DD", with start no later than end. A bare end date includes
+          the whole of that day. Calls made exactly at start or end match.
+        - "Nd": the last N days of the call records, ending at the latest call
+          in <data>.
+        - If the filter string is invalid, return the original list <data>
+
+        Do not mutate any of the function arguments!
+        """
+        return _apply_query(self, customers, data, filter_string)
+
+    def apply_chunks(self, customers: list[Customer],
+                     data: list[Call],
+                     filter_string: str,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[list[Call]]:
+        """ Yield the calls that apply() returns, in chunks of at most
+        <chunk_size> calls, as they are found in <data>.
+        """
+        yield from _apply_query_chunks(self, customers, data, filter_string,
+                                       chunk_size)
+
+    def to_query(self, customers: list[Customer], data: Sequence[Call],
+                 filter_string: str) -> Optional[tuple]:
+        """ Return the query selecting the calls made in the period of time
+        specified in <filter_string>.
+        """
+        time_range = _parse_time_range(filter_string, data)
+        if time_range is None:
+            return None
+        start, end = time_range
+        # compare packed times; as call times are whole seconds, a start
+        # within a second starts at the next one
+        return ('time', pack_time(start) + (start.microsecond > 0),
+                pack_time(end))
+
+    def normalize(self, filter_string: str) -> str:
+        """ Return <filter_string> as "Nd" or as two "YYYY-MM-DD HH:MM:SS"
+        timestamps, or unchanged if it is invalid.
+        """
+        text = filter_string.strip()
+        if text[-1:] in ('d', 'D'):
+            try:
+                days = int(text[:-1])
+            except ValueError:
+                return filter_string
+            return filter_string if days < 0 else str(days) + 'd'
+        time_range = _parse_time_range(text, [])
+        if time_range is None:
+            return filter_string
+        return ', '.join(t.strftime("%Y-%m-%d %H:%M:%S") for t in time_range)
+
+    def __str__(self) -> str:
+        """ Return a description of this filter to be displayed in the UI menu
+        """
+        return "Filter calls made in a period of time. Format: " \
+               "\"start, end\" (e.g., 2018-01-01, 2018-01-15 12:00:00) " \
+               "or \"Nd\" for the last N days (e.g., 7d)"
+
+
+def _parse_months(filter_string: str) \
+        -> Optional[tuple[tuple[int, int], tuple[int, int]]]:
+    """Helper function to parse a "YYYY-MM" or "YYYY-MM, YYYY-MM"
+    filter_string into the (month, year) of its first and last months.
+    Return None if the filter_string is invalid."""
+    months = []
+    for text in filter_string.split(','):
+        try:
+            month_start = datetime.datetime.strptime(text.strip(), "%Y-%m")
+        except ValueError:
+            return None
+        months.append((month_start.month, month_start.year))
+    if len(months) == 1:
+        return months[0], months[0]
+    if len(months) != 2 or \
+            month_number(*months[0]) > month_number(*months[1]):
+        return None
+    return months[0], months[1]
+
+
+class MonthFilter(Filter):
+    """
+    A class for selecting only the calls made in one or more billing cycles
+    """
+
+    def apply(self, customers: list[Customer],
+              data: list[Call],
+              filter_string: str) \
+            -> list[Call]:
+        """ Return a list of all calls from <data> made in the months
+        specified by the <filter_string>.
+
+        The <customers> list contains all customers from the input dataset.
+
+        The filter string is valid if and only if it has one of these forms:
+        - "YYYY-MM": the calls made in that month
+        - "YYYY-MM, YYYY-MM": the calls made from the first month to the last
+          month inclusive, the first month being no later than the last
+        - If the filter string is invalid, return the original list <data>
+
+        Use apply_index() instead to take the calls of the months from a
+        MonthIndex of <data>, without scanning the other months.
+
+        Do not mutate any of the function arguments!
+        """
+        return _apply_query(self, customers, data, filter_string)
+
+    def apply_chunks(self, customers: list[Customer],
+                     data: list[Call],
+                     filter_string: str,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[list[Call]]:
+        """ Yield the calls that apply() returns, in chunks of at most
+        <chunk_size> calls, as they are found in <data>.
+        """
+        yield from _apply_query_chunks(self, customers, data, filter_string,
+                                       chunk_size)
+
+    def apply_index(self, index: MonthIndex,
+                    filter_string: str) -> Optional[list[Call]]:
+        """ Return the calls of <index> made in the months specified by the
+        <filter_string>, as apply() does for the list of calls of <index>,
+        in time proportional to the number of calls of these months. Return
+        None if the <filter_string> is invalid.
+        """
+        months = _parse_months(filter_string)
+        if months is None:
+            return None
+        return index.get_calls(*months)
+
+    def to_query(self, customers: list[Customer], data: Sequence[Call],
+                 filter_string: str) -> Optional[tuple]:
+        """ Return the query selecting the calls made in the months specified
+        in <filter_string>.
+        """
+        months = _parse_months(filter_string)
+        if months is None:
+            return None
+        first, last = months
+        return ('time', pack_month(*first),
+                (month_number(*last) + 1 << MONTH_SHIFT) - 1)
+
+    def normalize(self, filter_string: str) -> str:
+        """ Return <filter_string> as one or two "YYYY-MM" months, or
+        unchanged if it is invalid.
+        """
+        months = _parse_months(filter_string)
+        if months is None:
+            return filter_string
+        return ', '.join(f'{year:04d}-{month:02d}' for month, year in months)
+
+    def __str__(self) -> str:
+        """ Return a description of this filter to be displayed in the UI menu
+        """
+        return "Filter calls made in billing months. Format: \"YYYY-MM\" " \
+               "or \"first, last\" (e.g., 2018-01, 2018-03)"
+
+
+def _parse_top_k(filter_string: str) \
+        -> Optional[tuple[int, Optional[int], Optional[int]]]:
+    """Helper function to parse a "K" or "K YYYY-MM" filter_string into a
+    (k, month, year) tuple, where month and year are None if no month is
+    given. Return None if the filter_string is invalid."""
+    parts = filter_string.split()
+    try:
+        k = int(parts[0])
+        month = year = None
+        if len(parts) == 2:
+            month_start = datetime.datetime.strptime(parts[1], "%Y-%m")
+            month, year = month_start.month, month_start.year
+        elif len(parts) != 1:
+            return None
+    except (IndexError, ValueError):
+        return None
+    if k <= 0:
+        return None
+    return k, month, year
+
+
+def _find_top_sources(customers: list[Customer], k: int,
+                      month: Optional[int], year: Optional[int]) \
+        -> tuple[frozenset[int], Optional[int], Optional[int]]:
+    """Helper function to return the ids of the numbers of the <k> customers
+    with the most outgoing minutes in <month> of <year>, or in all months if
+    they are None, with the first and last packed times of that month, or
+    None if no month is given."""
+    top = {cid for cid, _ in top_customers(customers, k, month, year)}
+    sources = set()
+    for customer in customers:
+        if customer.get_id() in top:
+            sources.update(customer.get_number_ids())
+
+    first = last = None
+    if month is not None:
+        first = pack_month(month, year)
+        last = pack_month(month % 12 + 1, year + month // 12) - 1
+    return frozenset(sources), first, last
+
+
+def _match_sources(data: Iterable[Call], sources: frozenset[int],
+                   first: Optional[int],
+                   last: Optional[int]) -> Iterator[Call]:
+    """Helper function to yield, in order, the calls from <data> made by one
+    of the numbers of id in <sources>, between the packed times <first> and
+    <last> inclusive, or at any time if they are None."""
+    for call in data:
+        if call.src_id in sources and \
+                (first is None or first <= call.packed_time <= last):
+            yield call
+
+
+class TopCustomersFilter(Filter):
+    """
+    A class for selecting only the calls made by the customers with the most
+    outgoing minutes
+    """
+
+    def apply(self, customers: list[Customer],
+              data: list[Call],
+              filter_string: str) \
+            -> list[Call]:
+        """ Return a list of all unique calls from <data> made by the top K
+        customers by outgoing minutes, as specified by the <filter_string>.
+
+        The <customers> list contains all customers from the input dataset.
+
+        The filter string is valid if and only if it has one of these forms:
+        - "K": the K customers with the most outgoing minutes over all months
+        - "K YYYY-MM": the K customers with the most outgoing minutes in that
+          month; only their calls made in that month are kept
+        where K is a positive integer.
+        - If the filter string is invalid, return the original list <data>
+
+        Do not mutate any of the function arguments!
+        """
+        return _apply_query(self, customers, data, filter_string)
+
+    def apply_chunks(self, customers: list[Customer],
+                     data: list[Call],
+                     filter_string: str,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[list[Call]]:
+        """ Yield the calls that apply() returns, in chunks of at most
+        <chunk_size> calls, as they are found in <data>.
+        """
+        yield from _apply_query_chunks(self, customers, data, filter_string,
+                                       chunk_size)
+
+    def to_query(self, customers: list[Customer], data: Sequence[Call],
+                 filter_string: str) -> Optional[tuple]:
+        """ Return the query selecting the calls made by the top K customers,
+        as specified in <filter_string>.
+        """
+        top_k = _parse_top_k(filter_string)
+        if top_k is None:
+            return None
+        return ('sources',) + _find_top_sources(customers, *top_k)
+
+    def normalize(self, filter_string: str) -> str:
+        """ Return <filter_string> as "K" or "K YYYY-MM", or unchanged if it
+        is invalid.
+        """
+        top_k = _parse_top_k(filter_string)
+        if top_k is None:
+            return filter_string
+        k, month, year = top_k
+        if month is None:
+            return str(k)
+        return '%d %04d-%02d' % (k, year, month)
+
+    def __str__(self) -> str:
+        """ Return a description of this filter to be displayed in the UI menu
+        """
+        return "Filter calls made by the top K customers by outgoing " \
+               "minutes. Format: \"K\" or \"K YYYY-MM\" for one month " \
+               "(e.g., 10 2018-01)"
+
+
+def _parse_hops(filter_string: str) -> Optional[tuple[str, int]]:
+    """Helper function to parse an "ID K" filter_string into a (customer id,
+    k) tuple. Return None if the filter_string is invalid."""
+    parts = filter_string.split()
+    try:
+        cid, hops = parts
+        hops = int(hops)
+    except ValueError:
+        return None
+    if hops <= 0:
+        return None
+    return cid, hops
+
+
+def _find_hop_sources(customers: list[Customer],
+                      filter_string: str) -> Optional[set[int]]:
+    """Helper function to return the ids of the numbers at most K - 1 hops
+    away from the phone lines of the customer, in the call graph of
+    <customers>, for an "ID K" filter_string. Return None if the
+    filter_string is invalid or there is no such customer."""
+    parsed = _parse_hops(filter_string)
+    if parsed is None:
+        return None
+    cid, hops = parsed
+    numbers = [nid for customer in customers if str(customer.get_id()) == cid
+               for nid in customer.get_number_ids()]
+    if not numbers:
+        return None
+    graph = CallGraph.of_customers(customers)
+    return graph.get_ids_within(numbers, hops - 1)
+
+
+def _match_numbers(data: Iterable[Call],
+                   numbers: frozenset[int]) -> Iterator[Call]:
+    """Helper function to yield, in order, the calls from <data> made or
+    received by one of the numbers of id in <numbers>."""
+    for call in data:
+        if call.src_id in numbers or call.dst_id in numbers:
+            yield call
+
+
+class CallGraphFilter(Filter):
+    """
+    A class for selecting only the calls within K hops of a customer in the
+    call graph
+    """
+
+    def apply(self, customers: list[Customer],
+              data: list[Call],
+              filter_string: str) \
+            -> list[Call]:
+        """ Return a list of all unique calls from <data> within K hops of
+        the customer specified by the <filter_string>.
+
+        The <customers> list contains all customers from the input dataset.
+        A call is within K hops of the customer if it is made or received by
+        a number that is at most K - 1 calls away from one of the customer's
+        phone lines: for K = 1, these are the calls of the customer, for
+        K = 2, the calls of the customer and of everyone they called or were
+        called by, and so on.
+
+        The filter string is valid if and only if it has the form "ID K",
+        where ID is a valid customer ID and K is a positive integer.
+        - If the filter string is invalid, return the original list <data>
+
+        Do not mutate any of the function arguments!
+        """
+        return _apply_query(self, customers, data, filter_string)
+
+    def apply_chunks(self, customers: list[Customer],
+                     data: list[Call],
+                     filter_string: str,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[list[Call]]:
+        """ Yield the calls that apply() returns, in chunks of at most
+        <chunk_size> calls, as they are found in <data>.
+        """
+        yield from _apply_query_chunks(self, customers, data, filter_string,
+                                       chunk_size)
+
+    def to_query(self, customers: list[Customer], data: Sequence[Call],
+                 filter_string: str) -> Optional[tuple]:
+        """ Return the query selecting the calls within K hops of the
+        customer specified in <filter_string>.
+        """
+        sources = _find_hop_sources(customers, filter_string)
+        if sources is None:
+            return None
+        return ('numbers', frozenset(sources))
+
+    def normalize(self, filter_string: str) -> str:
+        """ Return <filter_string> as "ID K", or unchanged if it is invalid.
+        """
+        parsed = _parse_hops(filter_string)
+        if parsed is None:
+            return filter_string
+        return '%s %d' % parsed
+
+    def __str__(self) -> str:
+        """ Return a description of this filter to be displayed in the UI menu
+        """
+        return "Filter calls within K hops of a customer in the call " \
+               "graph. Format: \"ID K\" (e.g., 5555 2)"
+
+
+# Estimated cost of checking a call against a query of each kind, relative to
+# comparing one of its attributes
+QUERY_COSTS = {'calls': 0.5, 'customer': 1.0, 'numbers': 1.0,
+               'sources': 1.5, 'duration': 1.0, 'time': 1.0, 'location': 4.0}
+
+# Number of calls of the data sampled to estimate the selectivity of a query
+SAMPLE_SIZE = 256
+
+
+def _match_query(data: Iterable[Call], query: tuple) -> Iterator[Call]:
+    """ Yield, in order, the calls from <data> selected by <query>, as
+    returned by Filter.to_query().
+    """
+    kind = query[0]
+    if kind == 'all':
+        return iter(data)
+    if kind == 'calls':
+        return (call for call in data if call in query[1])
+    if kind in ('customer', 'numbers'):
+        return _match_numbers(data, query[1])
+    if kind == 'duration':
+        return _match_duration(data, *query[1:])
+    if kind == 'location':
+        return _match_location(data, *query[1:])
+    if kind == 'time':
+        return _match_time(data, *query[1:])
+    if kind == 'sources':
+        return _match_sources(data, *query[1:])
+    if kind == 'and':
+        for subquery in query[1:]:
+            data = _match_query(data, subquery)
+        return iter(data)
+    raise ValueError('unknown query: ' + str(kind))
+
+
+def _index_query(customers: list[Customer], query: tuple,
+                 size: int) -> tuple:
+    """ Return a ('calls', calls) query equivalent to <query>, for calls of
+    <customers>, where calls is a set of the calls it selects found in the
+    call histories of their phone lines, or <query> itself if it is not a
+    customer or sources query.
+
+    Checking whether a call is in a set only hashes the call, instead of
+    reading its numbers. A customer query always uses its call set, like
+    CustomerFilter. A sources query only uses one if it holds at most half
+    of <size> calls, since building it costs about as much as a scan.
+    Queries on numbers are never indexed: their numbers may not belong to
+    any customer, and the calls between such a number and a line outside
+    the query are in no call history of these lines.
+    """
+    kind = query[0]
+    if kind not in ('customer', 'sources'):
+        return query
+    numbers = query[1]
+    call_sets = []
+    for customer in customers:
+        ids = [nid for nid in customer.get_number_ids() if nid in numbers]
+        if kind == 'sources':
+            first, last = query[2:]
+            for nid in ids:
+                history = customer.get_phone_line(nid).get_call_history()
+                outgoing = history.get_outgoing_view()
+                if first is not None:
+                    outgoing = history.get_calls_between(
+                        unpack_time(first), unpack_time(last))[0]
+                call_sets.append(outgoing)
+        elif ids and len(ids) == len(customer.get_number_ids()):
+            call_sets.append(customer.get_call_set())
+        else:
+            call_sets.extend(
+                customer.get_phone_line(nid).get_call_history().get_call_set()
+                for nid in ids)
+
+    if kind != 'customer' and sum(map(len, call_sets)) > size // 2:
+        return query
+    if len(call_sets) == 1 and kind == 'customer':
+        return 'calls', call_sets[0]
+    return 'calls', frozenset().union(*call_sets)
+
+
+def _estimate_selectivity(query: tuple, sample: list[Call],
+                          size: int) -> float:
+    """ Return an estimate of the fraction of calls selected by <query>, among
+    <size> calls of which <sample> is a sample. It is never 0 or 1, so that a
+    small sample does not rule out any call.
+    """
+    if query[0] == 'calls':
+        # the size of the set of calls bounds the number of calls selected
+        selected, total = len(query[1]), size
+    else:
+        selected = sum(1 for _ in _match_query(sample, query))
+        total = len(sample)
+    return min(selected + 1, total + 1) / (total + 2)
+
+
+def plan_queries(queries: list[tuple], data: Sequence[Call]) -> list[tuple]:
+    """ Return the <queries> in the order in which to check the calls of
+    <data> against them, so that the calls rejected by any of them are
+    rejected as cheaply as possible.
+
+    A query is checked earlier the lower its cost per call rejected: its
+    cost in QUERY_COSTS over the fraction of calls it rejects, estimated on
+    at most SAMPLE_SIZE calls spread over <data>.
+    """
+    if len(queries) < 2:
+        return list(queries)
+    sample = list(data[::max(1, len(data) // SAMPLE_SIZE)])
+    ranks = {}
+    for query in queries:
+        selectivity = _estimate_selectivity(query, sample, len(data))
+        ranks[id(query)] = QUERY_COSTS.get(query[0], 1.0) / (1 - selectivity)
+    return sorted(queries, key=lambda query: ranks[id(query)])
+
+
+def run_queries(data: Sequence[Call], queries: list[tuple],
+                customers: Optional[list[Customer]] = None) -> Iterator[Call]:
+    """ Yield, in order, the calls from <data> selected by every one of the
+    <queries>, as returned by Filter.to_query().
+
+    If <customers> is not None, the customer and sources queries may use the
+    call histories of <customers> as an index (see _index_query()), in which
+    case they only select calls of <customers>.
+
+    The calls are checked in a single pass over <data>: each call goes
+    through the queries, in the order of plan_queries(), until one of them
+    rejects it.
+    """
+    queries = [subquery for query in queries
+               for subquery in (query[1:] if query[0] == 'and' else [query])]
+    if customers is not None:
+        queries = [_index_query(customers, query, len(data))
+                   for query in queries]
+    calls = iter(data)
+    for query in plan_queries(queries, data):
+        calls = _match_query(calls, query)
+    return calls
+
+
+def _parse_term(customers: list[Customer], data: Sequence[Call],
+                term: str) -> Optional[tuple]:
+    """ Return the query of the <term> of a filter query, or None if it is
+    not a valid term.
+    """
+    match = re.fullmatch(r'(\w+)\s*\((.*)\)', term)
+    if match is not None:
+        name, arguments = match.group(1).lower(), match.group(2)
+        if name not in QUERY_FUNCTIONS:
+            return None
+        filter_class, separator = QUERY_FUNCTIONS[name]
+        filter_string = separator.join(argument.strip()
+                                       for argument in arguments.split(','))
+        return filter_class().to_query(customers, data, filter_string)
+
+    match = re.fullmatch(r'(\w+)\s*([<>=])\s*(\S+)', term)
+    if match is None:
+        return None
+    name, operator, value = match.groups()
+    if name.lower() == 'customer' and operator == '=':
+        return CustomerFilter().to_query(customers, data, value)
+    if name.lower() == 'duration' and operator != '=':
+        try:
+            return 'duration', operator == '<', int(value)
+        except ValueError:
+            return None
+    return None
+
+
+def parse_query(customers: list[Customer], data: Sequence[Call],
+                text: str) -> Optional[list[tuple]]:
+    """ Return the queries of the terms of the filter query <text>, or None
+    if it is not a valid filter query. See QueryFilter.apply() for the
+    syntax of a filter query.
+    """
+    queries = []
+    for term in re.split(r'\s+and\s+', text.strip(), flags=re.IGNORECASE):
+        query = _parse_term(customers, data, term.strip())
+        if query is None:
+            return None
+        queries.append(query)
+    return queries
+
+
+class QueryFilter(Filter):
+    """
+    A class for selecting only the calls that match every criterion of a
+    query, combining the criteria of the other filters
+    """
+
+    def apply(self, customers: list[Customer],
+              data: list[Call],
+              filter_string: str) \
+            -> list[Call]:
+        """ Return a list of all calls from <data> that match every term of
+        the query in <filter_string>.
+
+        The <customers> list contains all customers from the input dataset.
+
+        The filter string is valid if and only if it is made of one or more
+        of these terms, separated by "AND" (in any case):
+        - "customer=ID": the calls made or received by the customer, whose
+          ID must be valid; unlike CustomerFilter, no call matches if the
+          customer has none in <data>
+        - "duration<N", "duration>N": the calls lasting less or more than N
+          seconds
+        - "bbox(lowerLong, lowerLat, upperLong, upperLat)": as LocationFilter
+        - "time(start, end)", "time(Nd)": as TimeRangeFilter
+        - "month(YYYY-MM)", "month(first, last)": as MonthFilter
+        - "top(K)", "top(K, YYYY-MM)": as TopCustomersFilter
+        - "hops(ID, K)": as CallGraphFilter
+        e.g. "customer=3895 AND duration>120 AND
+        bbox(-79.6, 43.6, -79.3, 43.7)".
+        - If the filter string is invalid, return the original list <data>
+
+        The calls of <data> are only scanned once, whatever the number of
+        terms.
+
+        Do not mutate any of the function arguments!
+        """
+        queries = parse_query(customers, data, filter_string)
+        if queries is None:
+            return data
+        return list(run_queries(data, queries, customers))
+
+    def apply_chunks(self, customers: list[Customer],
+                     data: list[Call],
+                     filter_string: str,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[list[Call]]:
+        """ Yield the calls that apply() returns, in chunks of at most
+        <chunk_size> calls, as they are found in <data>.
+        """
+        yield from _apply_query_chunks(self, customers, data, filter_string,
+                                       chunk_size)
+
+    def to_query(self, customers: list[Customer], data: Sequence[Call],
+                 filter_string: str) -> Optional[tuple]:
+        """ Return the query selecting the calls that match every term of
+        the query in <filter_string>, in the order of plan_queries().
+        """
+        queries = parse_query(customers, data, filter_string)
+        if queries is None:
+            return None
+        return ('and',) + tuple(plan_queries(queries, data))
+
+    def normalize(self, filter_string: str) -> str:
+        """ Return <filter_string> with each run of whitespace replaced by a
+        single space.
+        """
+        return ' '.join(filter_string.split())
+
+    def __str__(self) -> str:
+        """ Return a description of this filter to be displayed in the UI menu
+        """
+        return "Filter calls with a query of terms joined by AND: " \
+               "customer=ID, duration<N, duration>N, bbox(...), time(...), " \
+               "month(...), top(...), hops(...) " \
+               "(e.g., customer=3895 AND duration>120)"
+
+
+# The functions of filter queries, with the filter whose filter string is
+# made of their arguments, and the separator of the arguments in it
+QUERY_FUNCTIONS = {'bbox': (LocationFilter, ', '),
+                   'time': (TimeRangeFilter, ', '),
+                   'month': (MonthFilter, ', '),
+                   'top': (TopCustomersFilter, ' '),
+                   'hops': (CallGraphFilter, ' ')}
+
+
+def apply_by_month(f: Filter, customers: list[Customer], index: MonthIndex,
+                   filter_string: str, months_string: str = '') \
+        -> Iterator[tuple[tuple[int, int], list[Call]]]:
+    """ Yield the (month, year) of each month of <index> in the months of
+    <months_string>, as for MonthFilter, or of every month of <index> if it
+    is empty, in chronological order, with the calls that the filter <f>
+    keeps with <filter_string> from the calls of <index> made that month.
+
+    The filter is applied to each month on its own, e.g. "Nd" time ranges end
+    at the latest call of the month, and only the partitions of the months
+    yielded are read. An invalid <months_string> yields nothing.
+    """
+    months = index.get_months()
+    if months_string:
+        bounds = _parse_months(months_string)
+        if bounds is None:
+            return
+        first, last = (month_number(*month) for month in bounds)
+        months = [(month, year) for month, year in months
+                  if first <= month_number(month, year) <= last]
+    for month, year in months:
+        calls = list(index.get_partition(month, year))
+        yield (month, year), f.apply(customers, calls, filter_string)
+
+
+class _BitmapCalls(Sequence):
+    """ A read-only sequence of the calls of a bitmap, which are only listed
+    once an item is first needed.
+    """
+    # === Private Attributes ===
+    # _bitmap:
+    #     the bitmap of the calls
+    # _calls:
+    #     the calls of _bitmap, in order, or None until they are needed
+    _bitmap: CallBitmap
+    _calls: Optional[list[Call]]
+
+    def __init__(self, bitmap: CallBitmap) -> None:
+        """ Create the sequence of the calls of <bitmap>.
+        """
+        self._bitmap = bitmap
+        self._calls = None
+
+    def __len__(self) -> int:
+        """ Return the number of calls in this sequence
+        """
+        return len(self._bitmap)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        """ Return the call at <index> of this sequence, or a list of the
+        calls of a slice.
+        """
+        if self._calls is None:
+            self._calls = self._bitmap.to_calls()
+        return self._calls[index]
+
+    def __iter__(self) -> Iterator[Call]:
+        """ Return an iterator over the calls of this sequence, in order.
+        """
+        if self._calls is None:
+            self._calls = self._bitmap.to_calls()
+        return iter(self._calls)
+
+
+class _IndexedCalls(Sequence):
+    """ A read-only sequence of the calls of a list at some indices, without
+    copying them.
+    """
+    # === Private Attributes ===
+    # _calls:
+    #     the calls
+    # _indices:
+    #     the indices in _calls of the calls of this sequence
+    _calls: Sequence[Call]
+    _indices: Sequence[int]
+
+    def __init__(self, calls: Sequence[Call], indices: Sequence[int]) -> None:
+        """ Create the sequence of the calls of <calls> at <indices>.
+        """
+        self._calls = calls
+        self._indices = indices
+
+    def __len__(self) -> int:
+        """ Return the number of calls in this sequence
+        """
+        return len(self._indices)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        """ Return the call at <index> of this sequence, or a list of the
+        calls of a slice.
+        """
+        if isinstance(index, slice):
+            return [self._calls[i] for i in self._indices[index]]
+        return self._calls[self._indices[index]]
+
+
+def match_indices(store: SharedCallStore, indices: Iterable[int],
+                  query: tuple) -> array:
+    """ Return the indices from <indices>, in order, of the calls of <store>
+    selected by <query>, as returned by Filter.to_query().
+    """
+    kind = query[0]
+    if kind == 'all':
+        return array('l', range(len(store)))
+    if kind == 'and':
+        for subquery in query[1:]:
+            indices = match_indices(store, indices, subquery)
+        return array('l', indices)
+    if kind in ('customer', 'numbers'):
+        numbers = query[1]
+        src, dst = store.src_id, store.dst_id
+        return array('l', [i for i in indices
+                           if src[i] in numbers or dst[i] in numbers])
+    if kind == 'duration':
+        _, less_than, seconds = query
+        durations = store.duration
+        if less_than:
+            return array('l', [i for i in indices if durations[i] < seconds])
+        return array('l', [i for i in indices if durations[i] > seconds])
+    if kind == 'location':
+        _, north, south, west, east = query
+        src_long, src_lat = store.src_long, store.src_lat
+        dst_long, dst_lat = store.dst_long, store.dst_lat
+        return array('l', [
+            i for i in indices
+            if (north <= src_long[i] <= south and west <= src_lat[i] <= east)
+            or (north <= dst_long[i] <= south and west <= dst_lat[i] <= east)])
+    if kind == 'time':
+        _, first, last = query
+        times = store.packed_time
+        return array('l', [i for i in indices if first <= times[i] <= last])
+    if kind == 'sources':
+        _, sources, first, last = query
+        src, times = store.src_id, store.packed_time
+        return array('l', [i for i in indices if src[i] in sources and (
+            first is None or first <= times[i] <= last)])
+    raise ValueError('unknown query: ' + str(kind))
+
+
+def _match_chunk(handle: tuple[str, int], indices: array,
+                 query: tuple) -> array:
+    """ Return match_indices() for the store of <handle>, in a worker process.
+    """
+    store = SharedCallStore.attach(handle)
+    try:
+        return match_indices(store, indices, query)
+    finally:
+        store.close()
+
+
+def apply_shared(f: Filter, customers: list[Customer], calls: Sequence[Call],
+                 store: SharedCallStore, indices: array, filter_string: str,
+                 pool: Optional[Pool] = None, num_chunks: int = 0) -> array:
+    """ Return the indices of the calls kept by the filter <f> with
+    <filter_string>, among the calls of <store> at <indices>, like apply() on
+    these calls. <store> holds <calls>, in order; map the indices back to
+    calls with [calls[i] for i in result].
+
+    If <pool> is not None, the indices are split into <num_chunks> chunks
+    (by default, one per process of <pool>), which are matched by its
+    processes. Only the query, the name of the store and the indices are sent
+    to the processes, which read the calls from the store in shared memory.
+    """
+    query = f.to_query(customers, _IndexedCalls(calls, indices),
+                       filter_string)
+    if query is None:
+        return indices
+    # a reset selects every call of the store, even from no indices, and no
+    # other query selects any call from them
+    if pool is None or query[0] == 'all' or not indices:
+        result = match_indices(store, indices, query)
+    else:
+        # pylint: disable=protected-access
+        num_chunks = num_chunks or pool._processes
+        size = max(1, -(-len(indices) // num_chunks))
+        result = array('l')
+        for chunk in pool.starmap(
+                _match_chunk,
+                [(store.get_handle(), indices[i:i + size], query)
+                 for i in range(0, len(indices), size)]):
+            result.extend(chunk)
+    if not result and query[0] == 'customer':
+        return indices
+    return result
+
+
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing', 'time', 'datetime', 'call', 'customer'
+            'python_ta', 'typing', 'time', 'datetime', 'call', 'customer',
+            'collections.abc', 'numberregistry', 'topk', 'callgraph',
+            'array', 'multiprocessing.pool', 'callstore', 're', 'callbitmap',
+            'monthindex'
         ],
         'max-nested-blocks': 4,
         'allowed-io': ['apply', '__str__'],
@@ -0,0 +1,181 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains a cache of the results of filters, for the filters that
+are applied again and again with the same filter strings.
+
+A result is cached under the class of its filter, its normalized filter
+string (see Filter.normalize), the list of calls it was applied to, and the
+version of the customers: their numbers of calls and of phone lines. The
+ingestion of new calls changes the version, so results cached before it are
+never returned afterwards.
+
+Lists of calls are identified by tokens rather than compared call by call: a
+list gets a new token the first time it is seen, and a result returned from
+the cache gets the token of the cached result, so that the filters applied to
+it afterwards are found in the cache too.
+"""
+from collections import OrderedDict
+from typing import Optional
+from call import Call
+from customer import Customer, get_version
+from filter import Filter, ResetFilter
+
+# Default maximum number of results kept in a cache
+CACHE_SIZE = 64
+
+
+class FilterCache:
+    """ A size-bounded cache of the results of filters, evicting the least
+    recently used result first.
+
+    Results returned from the cache are equal to the results apply() would
+    return: a new list of the same calls, or the list of calls the filter was
+    applied to itself, if apply() returns it. As for apply(), the lists of
+    calls filtered must not be mutated, since they are identified by their
+    token.
+
+    === Public Attributes ===
+    hits:
+         number of results found in the cache
+    misses:
+         number of results not found in the cache
+    """
+    # === Private Attributes ===
+    # _max_size:
+    #     the maximum number of results kept
+    # _entries:
+    #     the results kept, from the least recently used, keyed by filter
+    #     class, normalized filter string, token of the calls filtered and
+    #     version of the customers, with the token of the result; None as a
+    #     result stands for the calls filtered themselves
+    # _tokens:
+    #     the lists of calls seen, with their token, keyed by their id; the
+    #     lists are kept so that their id is not reused
+    # _next_token:
+    #     the token of the next new list of calls
+    hits: int
+    misses: int
+    _max_size: int
+    _entries: OrderedDict[tuple, tuple[Optional[list[Call]], int]]
+    _tokens: OrderedDict[int, tuple[list[Call], int]]
+    _next_token: int
+
+    def __init__(self, max_size: int = CACHE_SIZE) -> None:
+        """ Create an empty cache of at most <max_size> results.
+        """
+        self.hits = 0
+        self.misses = 0
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._tokens = OrderedDict()
+        self._next_token = 0
+
+    def __len__(self) -> int:
+        """ Return the number of results in this cache
+        """
+        return len(self._entries)
+
+    def _get_token(self, data: list[Call]) -> int:
+        """ Return the token of <data>, giving it a new one if it was never
+        seen.
+        """
+        entry = self._tokens.get(id(data))
+        if entry is not None and entry[0] is data:
+            self._tokens.move_to_end(id(data))
+            return entry[1]
+        self._next_token += 1
+        self._set_token(data, self._next_token)
+        return self._next_token
+
+    def _set_token(self, data: list[Call], token: int) -> None:
+        """ Give <data> the <token>, forgetting the least recently seen lists
+        once there are too many.
+        """
+        self._tokens[id(data)] = (data, token)
+        self._tokens.move_to_end(id(data))
+        while len(self._tokens) > 2 * self._max_size:
+            self._tokens.popitem(last=False)
+
+    def _get_key(self, f: Filter, customers: list[Customer], data: list[Call],
+                 filter_string: str) -> tuple:
+        """ Return the key of the result of <f> applied to <data> with
+        <filter_string>.
+        """
+        # a reset does not depend on the calls filtered
+        token = None if isinstance(f, ResetFilter) else self._get_token(data)
+        return (type(f), f.normalize(filter_string), token,
+                get_version(customers))
+
+    def get(self, f: Filter, customers: list[Customer], data: list[Call],
+            filter_string: str) -> Optional[list[Call]]:
+        """ Return the result of f.apply(customers, data, filter_string) if it
+        is in this cache, or None.
+        """
+        key = self._get_key(f, customers, data, filter_string)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        result, token = entry
+        if result is None:
+            return data
+        result = list(result)
+        self._set_token(result, token)
+        return result
+
+    def put(self, f: Filter, customers: list[Customer], data: list[Call],
+            filter_string: str, result: list[Call]) -> None:
+        """ Add a copy of <result>, the result of f.apply(customers, data,
+        filter_string), to this cache, evicting the least recently used
+        result if it is full.
+        """
+        key = self._get_key(f, customers, data, filter_string)
+        if result is data:
+            self._entries[key] = (None, self._get_token(data))
+        else:
+            self._entries[key] = (list(result), self._get_token(result))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def apply(self, f: Filter, customers: list[Customer], data: list[Call],
+              filter_string: str) -> list[Call]:
+        """ Return f.apply(customers, data, filter_string), from this cache
+        if possible.
+        """
+        result = self.get(f, customers, data, filter_string)
+        if result is None:
+            result = f.apply(customers, data, filter_string)
+            self.put(f, customers, data, filter_string, result)
+        return result
+
+    def invalidate(self) -> None:
+        """ Remove every result from this cache, e.g. after the customers
+        were changed in a way that does not change their version.
+        """
+        self._entries.clear()
+        self._tokens.clear()
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'collections', 'call', 'customer', 'filter'
+        ],
+    })
@@ -0,0 +1,171 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains the running usage statistics of a phone line. A CallHistory
+updates one UsageStats for its outgoing calls and one for its incoming calls
+every time a call is registered, in constant time, so that the statistics can
+be queried without rescanning the history. Only the most frequent numbers are
+counted when they are asked for, from the calls of the history, since keeping
+a running count for every other party would take as much memory as the calls.
+
+The median duration is estimated with a log-linear histogram: durations under
+16 seconds are counted exactly, and longer ones in buckets spanning 1/8 of a
+power of two, so the estimate is within about 6% of a duration in the middle
+of the distribution.
+"""
+from collections import Counter
+from collections.abc import Collection
+from typing import Union
+from call import Call
+from numberregistry import NUMBERS
+
+# Number of bits of a duration kept by its histogram bucket
+BUCKET_BITS = 4
+
+
+def _bucket(duration: int) -> int:
+    """ Return the histogram bucket of <duration> seconds. Buckets are ordered
+    like the durations they hold.
+
+    >>> [_bucket(d) for d in [0, 15, 16, 17, 31, 32]]
+    [0, 15, 24, 24, 31, 32]
+    """
+    shift = duration.bit_length() - BUCKET_BITS
+    if shift <= 0:
+        return duration
+    return ((shift + 1) << (BUCKET_BITS - 1)) + (duration >> shift)
+
+
+def _bucket_middle(bucket: int) -> float:
+    """ Return the middle of the range of durations held by <bucket>
+    """
+    if bucket < 1 << BUCKET_BITS:
+        return bucket
+    shift = (bucket >> (BUCKET_BITS - 1)) - 2
+    low = (bucket - ((shift + 1) << (BUCKET_BITS - 1))) << shift
+    return low + ((1 << shift) - 1) / 2
+
+
+class UsageStats:
+    """ Running statistics of the calls of a phone line in one direction.
+
+    === Public Attributes ===
+    count:
+         number of calls
+    total:
+         total duration of the calls, in seconds
+    max_duration:
+         duration of the longest call, in seconds, or 0 if there are no calls
+
+    === Representation Invariants ===
+    - count >= 0
+    - total >= max_duration >= 0
+    """
+    # === Private Attributes ===
+    # _calls:
+    #     the calls these statistics are about, from which the most frequent
+    #     other parties are counted
+    # _outgoing:
+    #     whether the calls are outgoing, so that the other party of a call is
+    #     its destination, rather than its source
+    # _histogram:
+    #     the number of calls in each histogram bucket of durations
+    count: int
+    total: int
+    max_duration: int
+    _calls: Collection[Call]
+    _outgoing: bool
+    _histogram: dict[int, int]
+
+    def __init__(self, calls: Collection[Call] = (),
+                 outgoing: bool = True) -> None:
+        """ Create statistics of no calls, about the calls of <calls>, which
+        are outgoing if <outgoing> is True and incoming otherwise.
+
+        <calls> must be a live collection, such as a view of a call history,
+        to which each call added with add_call() is added too.
+        """
+        self.count = 0
+        self.total = 0
+        self.max_duration = 0
+        self._calls = calls
+        self._outgoing = outgoing
+        self._histogram = {}
+
+    def add_call(self, duration: int) -> None:
+        """ Add a call lasting <duration> seconds to these statistics.
+        """
+        self.count += 1
+        self.total += duration
+        if duration > self.max_duration:
+            self.max_duration = duration
+        bucket = _bucket(duration)
+        self._histogram[bucket] = self._histogram.get(bucket, 0) + 1
+
+    def get_mean(self) -> float:
+        """ Return the mean call duration in seconds, or 0 if there are no
+        calls
+        """
+        if self.count == 0:
+            return 0
+        return self.total / self.count
+
+    def get_median(self) -> float:
+        """ Return an estimate of the median call duration in seconds, or 0 if
+        there are no calls. Durations under 16 seconds are exact.
+        """
+        seen = 0
+        for bucket in sorted(self._histogram):
+            seen += self._histogram[bucket]
+            if 2 * seen >= self.count:
+                return _bucket_middle(bucket)
+        return 0
+
+    def get_top_numbers(self, k: int = 3) -> list[tuple[str, int]]:
+        """ Return the <k> phone numbers called most often (or calling most
+        often, for incoming calls), with their number of calls, from the most
+        frequent. Ties are broken by the first number called.
+
+        The calls are counted when this method is called.
+        """
+        if self._outgoing:
+            numbers = Counter(call.dst_id for call in self._calls)
+        else:
+            numbers = Counter(call.src_id for call in self._calls)
+        top = numbers.most_common(k)
+        return [(NUMBERS.get_number(nid), count) for nid, count in top]
+
+    def get_summary(self, k: int = 3) \
+            -> dict[str, Union[int, float, list[tuple[str, int]]]]:
+        """ Return these statistics as a dictionary with the keys "count",
+        "total", "mean", "max", "median" and "top", the latter holding the
+        <k> most frequent numbers as returned by get_top_numbers().
+        """
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.get_mean(),
+                'max': self.max_duration,
+                'median': self.get_median(),
+                'top': self.get_top_numbers(k)}
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'collections', 'collections.abc', 'call',
+            'numberregistry'
+        ],
+    })
@@ -0,0 +1,298 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains the live ingestion of events, once the customers have been
+built from the dataset. Events arrive as JSON Lines, one event per line in the
+format of the "events" of the dataset, from a file that is followed as it
+grows, a FIFO, or a local TCP socket.
+
+A background thread only reads the lines of a source and queues them. The
+LiveIngestor processes the queued events in the thread that owns the model,
+in batches, through the same code as process_event_history: the customers
+make and receive the calls, and are advanced to a new month when an event of
+a new month arrives.
+"""
+import json
+import os
+import queue
+import socket
+import threading
+from typing import Iterable, Iterator, Optional
+from application import _map_numbers_to_customers, _process_events
+from call import Call, MONTH_SHIFT, pack_month, parse_time
+from customer import Customer
+from smslog import SMSLog
+
+# Maximum number of events processed by one call to LiveIngestor.poll()
+BATCH_SIZE = 1000
+
+# Seconds to wait before checking a followed file or a socket for new data
+POLL_INTERVAL = 0.2
+
+# Keys that events of each type must have
+EVENT_KEYS = {'call': ('src_number', 'dst_number', 'time', 'duration',
+                       'src_loc', 'dst_loc'),
+              'sms': ('src_number', 'dst_number', 'time')}
+
+
+def _is_number(value: object) -> bool:
+    """ Return whether <value> is an int or a float, but not a bool.
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_location(value: object) -> bool:
+    """ Return whether <value> is a location: a list of two numbers.
+    """
+    return (isinstance(value, list) and len(value) == 2
+            and all(_is_number(coordinate) for coordinate in value))
+
+
+# Checks that the value of each key of an event must pass
+FIELD_CHECKS = {
+    'src_number': lambda value: isinstance(value, str),
+    'dst_number': lambda value: isinstance(value, str),
+    'time': lambda value: isinstance(value, str),
+    'duration': lambda value: (isinstance(value, int)
+                               and not isinstance(value, bool)
+                               and value >= 0),
+    'src_loc': _is_location,
+    'dst_loc': _is_location
+}
+
+
+def follow_file(path: str, stop: threading.Event,
+                poll_interval: float = POLL_INTERVAL) -> Iterator[str]:
+    """ Yield the lines of the file at <path>, then the lines appended to it
+    as they are written, like "tail -f", until <stop> is set. A line is only
+    yielded once its newline has been written.
+
+    A FIFO can be followed too: its lines are yielded until every writer has
+    closed it.
+    """
+    with open(path) as file:
+        partial = ''
+        while not stop.is_set():
+            line = file.readline()
+            if not line:
+                if os.path.isfile(path):
+                    stop.wait(poll_interval)
+                    continue
+                break
+            partial += line
+            if partial.endswith('\n'):
+                yield partial
+                partial = ''
+
+
+def socket_lines(port: int, stop: threading.Event,
+                 host: str = 'localhost') -> Iterator[str]:
+    """ Listen on <port> of <host> and yield the lines sent by the clients
+    that connect to it, one client at a time, until <stop> is set.
+    """
+    with socket.create_server((host, port)) as server:
+        server.settimeout(POLL_INTERVAL)
+        while not stop.is_set():
+            try:
+                client, _ = server.accept()
+            except socket.timeout:
+                continue
+            with client, client.makefile('r') as lines:
+                for line in lines:
+                    yield line
+                    if stop.is_set():
+                        break
+
+
+def _latest_month(customers: list[Customer]) -> Optional[int]:
+    """ Return the month index (12 * year + month - 1) of the latest month
+    that the phone lines of <customers> were advanced to, or None if they
+    were never advanced.
+    """
+    latest = None
+    for customer in customers:
+        for number in customer.get_phone_numbers():
+            line = customer.get_phone_line(number)
+            for month, year in line.get_bill_dates():
+                index = pack_month(month, year) >> MONTH_SHIFT
+                if latest is None or index > latest:
+                    latest = index
+    return latest
+
+
+def parse_event(line: str) -> Optional[dict]:
+    """ Return the event encoded by the JSON <line>, or None if it is not a
+    valid event.
+
+    An event is not valid when it lacks a key of its type, or when the value
+    of a key has the wrong type: the numbers and the time must be strings,
+    the duration a non-negative int, and the locations lists of two numbers.
+    Events of an unknown type are valid, and ignored by the processing like
+    in the dataset.
+
+    >>> parse_event('{"type": "other", "time": "2018-01-01 00:00:00"}')
+    {'type': 'other', 'time': '2018-01-01 00:00:00'}
+    >>> parse_event('{"type": "sms", "time": "2018-01-01 00:00:00"}') is None
+    True
+    >>> parse_event('{"type": "call", "src_number": "100-1200", '
+    ...             '"dst_number": "200-1200", "time": "2018-01-01 00:00:00", '
+    ...             '"duration": "60", "src_loc": [0, 0], '
+    ...             '"dst_loc": [0, 0]}') is None
+    True
+    """
+    try:
+        event = json.loads(line)
+        for key in EVENT_KEYS.get(event['type'], ()):
+            if not FIELD_CHECKS[key](event[key]):
+                return None
+        parse_time(event['time'])
+    except (ValueError, KeyError, TypeError):
+        return None
+    return event
+
+
+class LiveIngestor:
+    """ The live ingestion of events into the model.
+
+    Lines of events are queued by submit() or by the background thread of
+    start(), from any thread, and processed by poll(), in the thread that
+    owns the customers. Events must arrive in chronological order: an event
+    of an earlier month than the events already processed is rejected, since
+    the bills of that month are closed.
+
+    === Public Attributes ===
+    rejected:
+         number of lines that were not valid events, or were events of a month
+         already closed
+    processed:
+         number of events processed
+    """
+    # === Private Attributes ===
+    # _customers:
+    #     the customers that the events are processed for
+    # _owners:
+    #     maps the id of every phone number of _customers to its owner
+    # _sms_log:
+    #     the SMSLog that every SMS is added to, or None
+    # _billing_month:
+    #     the month index (12 * year + month - 1) of the month the customers
+    #     are in, or None if they were never advanced to a month
+    # _lines:
+    #     the lines submitted and not processed yet
+    # _stop:
+    #     set to stop the background thread of start()
+    rejected: int
+    processed: int
+    _customers: list[Customer]
+    _owners: dict[int, Customer]
+    _sms_log: Optional[SMSLog]
+    _billing_month: Optional[int]
+    _lines: queue.SimpleQueue
+    _stop: threading.Event
+
+    def __init__(self, customers: list[Customer],
+                 sms_log: Optional[SMSLog] = None) -> None:
+        """ Create a LiveIngestor of the events of <customers>, which may
+        already have processed the events of the dataset. If <sms_log> is not
+        None, every SMS is also added to it.
+        """
+        self.rejected = 0
+        self.processed = 0
+        self._customers = customers
+        self._owners = _map_numbers_to_customers(customers)
+        self._sms_log = sms_log
+        self._billing_month = _latest_month(customers)
+        self._lines = queue.SimpleQueue()
+        self._stop = threading.Event()
+
+    def submit(self, line: str) -> None:
+        """ Queue the JSON <line> of an event to be processed by the next
+        call to poll().
+        """
+        self._lines.put(line)
+
+    def start(self, source: Iterable[str]) -> threading.Thread:
+        """ Start and return a background thread that submits every line of
+        <source>, e.g. follow_file() or socket_lines() with the stop event
+        of get_stop_event().
+        """
+        def _submit_all() -> None:
+            """ Submit every line of <source> """
+            for line in source:
+                self.submit(line)
+
+        thread = threading.Thread(target=_submit_all, daemon=True)
+        thread.start()
+        return thread
+
+    def get_stop_event(self) -> threading.Event:
+        """ Return the event to set to stop the sources passed to start().
+        """
+        return self._stop
+
+    def stop(self) -> None:
+        """ Ask the sources passed to start() to stop.
+        """
+        self._stop.set()
+
+    def poll(self, max_events: int = BATCH_SIZE) -> list[Call]:
+        """ Process the events queued so far, up to <max_events> of them, and
+        return the Calls created, in chronological order.
+        """
+        events = []
+        while len(events) < max_events:
+            try:
+                line = self._lines.get_nowait()
+            except queue.Empty:
+                break
+            event = parse_event(line)
+            if event is None:
+                self.rejected += 1
+            else:
+                events.append(event)
+        return self.process(events)
+
+    def process(self, events: list[dict]) -> list[Call]:
+        """ Process the chronologically ordered <events> and return the Calls
+        created, in chronological order. Events of a month before the month of
+        the last event processed are rejected.
+        """
+        accepted = []
+        month = self._billing_month
+        for event in events:
+            event_month = parse_time(event['time']) >> MONTH_SHIFT
+            if month is None or event_month >= month:
+                accepted.append(event)
+                month = event_month
+        self.rejected += len(events) - len(accepted)
+
+        new_calls = []
+        self._billing_month = _process_events(
+            accepted, self._customers, self._owners, self._sms_log,
+            self._billing_month, new_calls)
+        self.processed += len(accepted)
+        return new_calls
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'json', 'os', 'queue', 'socket',
+            'threading', 'application', 'call', 'customer', 'smslog'
+        ],
+        'allowed-io': ['follow_file'],
+        'disable': ['W0212'],
+    })
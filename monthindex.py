@@ -0,0 +1,115 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains an index of calls partitioned by month, for the filters
+scoped to billing cycles.
+
+A CallHistory already groups the calls of one phone line by month, but the
+filters work on a single list of the calls of every line. A MonthIndex groups
+the calls of such a list by the month they were made in, keeping the position
+of each call in the list, so that the calls of a few months are found without
+scanning the others, and are returned in the order of the list.
+"""
+from collections.abc import Iterable
+from heapq import merge
+from call import Call, MONTH_SHIFT, pack_month
+from callhistory import CallsView
+
+
+def month_number(month: int, year: int) -> int:
+    """ Return the number of <month> of <year>, counting months from year 0,
+    which is also the packed time of a call made that month shifted right by
+    MONTH_SHIFT.
+    """
+    return pack_month(month, year) >> MONTH_SHIFT
+
+
+class MonthIndex:
+    """ The calls of a list, partitioned by the month they were made in.
+    """
+    # === Private Attributes ===
+    # _partitions:
+    #     the calls of each month, in the order of the list, keyed by the
+    #     number of the month (see month_number)
+    # _positions:
+    #     the position of every call in the list
+    _partitions: dict[int, list[Call]]
+    _positions: dict[Call, int]
+
+    def __init__(self, calls: Iterable[Call] = ()) -> None:
+        """ Create the index of the list of calls <calls>.
+        """
+        self._partitions = {}
+        self._positions = {}
+        self.add(calls)
+
+    def __len__(self) -> int:
+        """ Return the number of calls in this index
+        """
+        return len(self._positions)
+
+    def add(self, calls: Iterable[Call]) -> None:
+        """ Add the calls of <calls> that are not in this index yet, as if
+        they were appended to the list, in order.
+        """
+        positions = self._positions
+        for call in calls:
+            if call not in positions:
+                positions[call] = len(positions)
+                number = call.packed_time >> MONTH_SHIFT
+                partition = self._partitions.get(number)
+                if partition is None:
+                    self._partitions[number] = [call]
+                else:
+                    partition.append(call)
+
+    def get_months(self) -> list[tuple[int, int]]:
+        """ Return the (month, year) of every month with calls in this index,
+        in chronological order.
+        """
+        return [(number % 12 + 1, number // 12)
+                for number in sorted(self._partitions)]
+
+    def get_partition(self, month: int, year: int) -> CallsView:
+        """ Return a read-only view of the calls of this index made in <month>
+        of <year>, in the order of the list.
+        """
+        return CallsView(self._partitions.get(month_number(month, year), []))
+
+    def get_calls(self, first: tuple[int, int],
+                  last: tuple[int, int]) -> list[Call]:
+        """ Return the calls of this index made from the (month, year) <first>
+        to the (month, year) <last> inclusive, in the order of the list.
+
+        Only the partitions of these months are read: their calls are merged
+        back into the order of the list by position.
+        """
+        partitions = [self._partitions[number]
+                      for number in range(month_number(*first),
+                                          month_number(*last) + 1)
+                      if number in self._partitions]
+        if len(partitions) == 1:
+            return list(partitions[0])
+        return list(merge(*partitions, key=self._positions.__getitem__))
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'collections.abc', 'heapq', 'call',
+            'callhistory'
+        ],
+    })
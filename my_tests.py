@@ -1,13 +1,41 @@
 import datetime
+import io
+import asyncio
+import json
+import multiprocessing
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from array import array
 
 import pytest
 
+from billexport import export_bills, export_usage_stats
 from application import create_customers, process_event_history, \
-    find_customer_by_number
-from contract import Contract, TermContract, MTMContract, PrepaidContract
+    find_customer_by_number, process_event_history_sharded, new_month
+from billing import MonthlyBatch
+from call import Call, pack_time, pack_month, parse_time, unpack_time
+from contract import Contract, TermContract, MTMContract, PrepaidContract, \
+    RATE_PLANS, load_rate_plans
 from customer import Customer
-from filter import LocationFilter, ResetFilter, DurationFilter, CustomerFilter
+from numberregistry import NUMBERS, NumberRegistry
+from smslog import SMSLog
+from filter import LocationFilter, ResetFilter, DurationFilter, CustomerFilter, \
+    TimeRangeFilter, TopCustomersFilter, CallGraphFilter, QueryFilter, \
+    MonthFilter, apply_by_month, apply_shared, plan_queries
 from phoneline import PhoneLine
+from callbitmap import CallIndex
+from callgraph import CallGraph
+from callstore import SharedCallStore
+from filtercache import FilterCache
+from liveingest import LiveIngestor, follow_file
+from monthindex import MonthIndex
+from queryserver import QueryServer
+from snapshot import SnapshotPublisher
+from asyncfeed import AsyncEventServer, generate_load, send_events
+from topk import top_customers, top_destinations, top_lines
 
 test_dict = {'events': [
     {"type": "sms",
@@ -321,5 +349,1009 @@ def test_filters_no_calls() -> None:
             assert len(result) == expected_return_lengths[i][j]
 
 
+def test_filter_chunks_match_apply() -> None:
+    """ Test that the chunked results of the filters are, once joined, the
+    same calls in the same order as the list returned by apply()
+    """
+    customers = create_customers(test_dict)
+    process_event_history(test_dict, customers)
+    calls = ResetFilter().apply(customers, [], '')
+
+    cases = [(DurationFilter(), ["L050", "G010", "L000", "AA", ""]),
+             (CustomerFilter(), ["5555", "1111", "aaaaaaaa", ""]),
+             (LocationFilter(), ["-79.6, 43.6, -79.3, 43.7",
+                                 "-79.5, 43.6, -79.4, 43.65", "a,a,a,a"]),
+             (ResetFilter(), [""])]
+    for f, filter_strings in cases:
+        for filter_string in filter_strings:
+            expected = f.apply(customers, calls, filter_string)
+            chunks = list(f.apply_chunks(customers, calls, filter_string, 2))
+            assert all(0 < len(chunk) <= 2 for chunk in chunks)
+            assert [c for chunk in chunks for c in chunk] == expected
+
+
+def test_customer_call_index() -> None:
+    """ Test that the per-line and per-customer call indexes follow the
+    registered calls without copying them
+    """
+    customers = create_customers(test_dict)
+    customer = customers[0]
+    call_set = customer.get_call_set()
+    outgoing = customer.get_call_history('867-5309')[0].get_outgoing_view()
+    assert len(call_set) == 0 and len(outgoing) == 0
+
+    process_event_history(test_dict, customers)
+    # the views were created before the events and must see all of them
+    assert len(call_set) == 3
+    assert len(outgoing) == 1 and outgoing[0].src_number == '867-5309'
+    assert all(call in call_set for call in customer.get_history()[0])
+
+    customer.cancel_phone_line('867-5309')
+    # every call still involves one of the remaining lines
+    assert len(call_set) == 3
+    customer.cancel_phone_line('273-8255')
+    assert len(call_set) == 2
+
+
+def test_monthly_views() -> None:
+    """ Test that the monthly views and the cached flat history return the
+    same calls as get_monthly_history
+    """
+    customers = create_customers(test_dict)
+    line = customers[0]._phone_lines[0]
+    month_view = line.get_monthly_view(1, 2018)
+    all_view = line.get_monthly_view()
+
+    process_event_history(test_dict, customers)
+    for views, month in [(month_view, (1, 2018)), (all_view, (None, None))]:
+        history = line.get_monthly_history(*month)
+        assert list(views[0]) == history[0] and len(views[0]) == 1
+        assert list(views[1]) == history[1] and len(views[1]) == 1
+        assert history[0][0] in views[0]
+    assert list(line.get_monthly_view(2, 2018)[0]) == []
+    assert line.get_monthly_history(2, 2018)[0] == []
+
+    flat = line.get_call_history().get_flat_history()
+    assert list(flat[0]) == line.get_monthly_history()[0]
+    # the cache is rebuilt after a new registration
+    line.receive_call(history[0][0])
+    assert len(line.get_call_history().get_flat_history()[1]) == 2
+    assert len(all_view[1]) == 2
+
+
+def test_time_range_queries() -> None:
+    """ Test the time index of the call histories and the TimeRangeFilter
+    """
+    customers = create_customers(test_dict)
+    process_event_history(test_dict, customers)
+    customer = customers[0]
+    start = datetime.datetime(2018, 1, 1, 1, 1, 4)
+    end = datetime.datetime(2018, 1, 1, 1, 1, 5)
+
+    # calls are grouped by phone line, in chronological order within a line
+    outgoing, incoming = customer.get_calls_between(start, end)
+    assert [c.src_number for c in outgoing] == ['867-5309', '273-8255']
+    assert len(incoming) == 2
+    assert customer.get_calls_between(start, end, '649-2568') == \
+        ([], [outgoing[0]])
+
+    history = customer.get_call_history('273-8255')[0]
+    recent = history.get_recent_calls(0)
+    assert recent[0] == [] and [c.src_number for c in recent[1]] == \
+        ['649-2568']
+    assert len(history.get_recent_calls(1)[0]) == 1
+
+    calls = ResetFilter().apply(customers, [], '')
+    f = TimeRangeFilter()
+    assert len(f.apply(customers, calls, '2018-01-01 01:01:04, '
+                                         '2018-01-01 01:01:05')) == 2
+    assert len(f.apply(customers, calls, '2018-01-01, 2018-01-01')) == 3
+    assert len(f.apply(customers, calls, '2018-01-02, 2018-01-03')) == 0
+    assert len(f.apply(customers, calls, '0d')) == 1
+    for invalid in ['', 'd', '2018-01-02, 2018-01-01', 'a, b', '-1d',
+                    '1000000000d', '99999999999d', '800000d']:
+        assert f.apply(customers, calls, invalid) is calls
+
+
+def test_export_bills() -> None:
+    """ Test the bulk bill export in both formats, with and without a pool
+    of worker processes
+    """
+    customers = create_customers(test_dict)
+    process_event_history(test_dict, customers)
+
+    out = io.StringIO()
+    assert export_bills(customers, out, 'csv') == 3
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith('customer,number,month,year,type')
+    assert lines[1] == '5555,867-5309,1,2018,TERM,20.0,1,0,0.1,0,1,0.0,20.0'
+
+    out = io.StringIO()
+    assert export_bills(customers, out, 'jsonl', processes=2) == 3
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    bill = customers[0].generate_bill(1, 2018)
+    assert sum(row['total'] for row in rows) == pytest.approx(bill[1])
+    assert [row['number'] for row in rows] == \
+        [line['number'] for line in bill[2]]
+
+    out = io.StringIO()
+    assert export_bills(customers, out, 'jsonl', month=2, year=2018) == 0
+
+
+def test_sharded_ingestion() -> None:
+    """ Test that sharded ingestion produces the same bills and call histories
+    as the serial path
+    """
+    serial = create_customers(test_dict)
+    process_event_history(test_dict, serial)
+    sharded = create_customers(test_dict)
+    process_event_history_sharded(test_dict, sharded, 2)
+
+    for month, year in [(1, 2018), (2, 2018)]:
+        assert sharded[0].generate_bill(month, year) == \
+            serial[0].generate_bill(month, year)
+    for history in [0, 1]:
+        assert [str(c) for c in sharded[0].get_history()[history]] == \
+            [str(c) for c in serial[0].get_history()[history]]
+    # calls are shared by the source and destination call histories
+    outgoing, incoming = sharded[0].get_history()
+    assert set(outgoing) == set(incoming)
+
+
+def test_numbers_without_customers() -> None:
+    """ Test that the serial and sharded paths both skip the side of an
+    event whose number has no customer
+    """
+    events = list(test_dict['events'])
+    for i, event in enumerate(test_dict['events']):
+        events.append(dict(event, src_number='555-0100',
+                           time=event['time'][:-2] + str(10 + i)))
+        events.append(dict(event, dst_number='555-0101',
+                           time=event['time'][:-2] + str(20 + i)))
+    log = {'events': events, 'customers': test_dict['customers']}
+    serial = create_customers(log)
+    process_event_history(log, serial)
+    sharded = create_customers(log)
+    process_event_history_sharded(log, sharded, 2)
+    assert sharded[0].generate_bill(1, 2018) == \
+        serial[0].generate_bill(1, 2018)
+    for history in [0, 1]:
+        assert [str(c) for c in sharded[0].get_history()[history]] == \
+            [str(c) for c in serial[0].get_history()[history]]
+
+
+def test_batch_billing() -> None:
+    """ Test that billing a month of calls in a batch gives the same bills as
+    billing them one by one, including calls crossing the free minutes cap
+    """
+    durations = [3000, 1, 2999, 60, 61, 1200, 0, 5000]
+    calls = [Call('867-5309', '273-8255', datetime.datetime(2018, 1, 2), d,
+                  (-79.4, 43.6), (-79.5, 43.7)) for d in durations]
+    for split in [0, 3, len(calls)]:
+        one_by_one = create_single_customer_with_all_lines()
+        batched = create_single_customer_with_all_lines()
+        for number in one_by_one.get_phone_numbers():
+            line = one_by_one.get_phone_line(number)
+            for call in calls:
+                line.contract.bill_call(call)
+            line = batched.get_phone_line(number)
+            # bill in two batches, starting from a partly used bill
+            line.bill_calls([-(-d // 60) for d in durations[:split]])
+            line.bill_calls([-(-d // 60) for d in durations[split:]])
+        assert batched.generate_bill(1, 2018) == \
+            one_by_one.generate_bill(1, 2018)
+        assert batched.get_phone_line('649-2568').contract.balance == \
+            one_by_one.get_phone_line('649-2568').contract.balance
+
+    # the calls and SMSs of several lines in one batch
+    serial = create_customers(test_dict)
+    process_event_history(test_dict, serial)
+    customers = create_customers(test_dict)
+    new_month(customers, 1, 2018)
+    batch = MonthlyBatch()
+    for event in test_dict['events']:
+        line = customers[0].get_phone_line(event['src_number'])
+        if event['type'] == 'call':
+            batch.add_calls(line, [event['duration']])
+        else:
+            batch.add_sms(line)
+    assert len(batch) == 3
+    batch.bill()
+    assert len(batch) == 0
+    assert customers[0].generate_bill(1, 2018) == \
+        serial[0].generate_bill(1, 2018)
+
+
+def test_exact_money() -> None:
+    """ Test that bills and balances are kept in exact integer mills, without
+    floating point drift over many calls
+    """
+    customer = create_single_customer_with_all_lines()
+    call = Call('649-2568', '867-5309', datetime.datetime(2018, 1, 2), 60,
+                (-79.4, 43.6), (-79.5, 43.7))
+    for number in ['273-8255', '649-2568']:
+        line = customer.get_phone_line(number)
+        for _ in range(1000):
+            line.contract.bill_call(call)
+
+    cid, total, bills = customer.generate_bill_mills(1, 2018)
+    assert cid == 5555
+    assert [b['total'] for b in bills] == [20000, 100000, -75000]
+    assert total == 45000
+    assert customer.generate_bill(1, 2018)[1] == 45.0
+    assert bills[2]['min_rate'] == 25
+    prepaid = customer.get_phone_line('649-2568').contract
+    assert prepaid.balance_mills == -75000 and prepaid.balance == -75.0
+
+
+def test_rate_plans() -> None:
+    """ Test that create_customers picks contracts from the rate plan registry,
+    including a plan added from data without code changes
+    """
+    load_rate_plans({'family': {'bill_type': 'FAMILY',
+                                'monthly_fee_mills': 35000,
+                                'included_mins': 1,
+                                'min_rate_mills': 40}})
+    try:
+        log = {'events': test_dict['events'],
+               'customers': [{'id': 1234,
+                              'lines': [{'number': '867-5309',
+                                         'contract': 'family'},
+                                        {'number': '273-8255',
+                                         'contract': 'term'},
+                                        {'number': '649-2568',
+                                         'contract': 'prepaid'}]}]}
+        customer = create_customers(log)[0]
+        process_event_history(log, [customer])
+    finally:
+        del RATE_PLANS['family']
+
+    assert customer.get_phone_line('273-8255').contract.end == \
+        datetime.date(2019, 6, 25)
+    bills = customer.generate_bill_mills(1, 2018)[2]
+    # the 50 second call uses up the included minute
+    assert bills[0]['type'] == 'FAMILY' and bills[0]['free_mins'] == 1
+    assert bills[0]['total'] == 35000
+    assert [b['total'] for b in bills[1:]] == [20000, -99975]
+
+
+def test_lazy_bills() -> None:
+    """ Test that lazy bills are only created for months with billed calls,
+    and give the same bill summaries as eager bills
+    """
+    eager = create_customers(test_dict)
+    lazy = create_customers(test_dict, lazy_bills=True)
+    for customers in [eager, lazy]:
+        customers[0].new_month(12, 2017)
+        process_event_history(test_dict, customers)
+        customers[0].new_month(2, 2018)
+        customers[0].new_month(3, 2018)
+
+    for month, year in [(12, 2017), (1, 2018), (2, 2018), (3, 2018)]:
+        assert lazy[0].generate_bill(month, year) == \
+            eager[0].generate_bill(month, year)
+    prepaid = lazy[0].get_phone_line('649-2568')
+    assert prepaid.bills[(12, 2017)] is None
+    assert prepaid.bills[(1, 2018)] is not None
+    assert prepaid.bills[(3, 2018)] is None
+
+    assert lazy[0].cancel_phone_line('867-5309') == \
+        eager[0].cancel_phone_line('867-5309')
+    assert lazy[0].generate_bill(3, 2018) == eager[0].generate_bill(3, 2018)
+
+
+def test_number_registry() -> None:
+    """ Test that phone numbers get dense ids, which calls, lines and
+    customers store and compare instead of the number strings
+    """
+    registry = NumberRegistry()
+    assert [registry.intern(n) for n in ['111-1111', '222-2222', '111-1111']] \
+        == [0, 1, 0]
+    assert registry.lookup('333-3333') is None and len(registry) == 2
+    assert registry.get_number(1) == '222-2222' and registry.intern(7) == 7
+
+    customers = create_customers(test_dict)
+    process_event_history(test_dict, customers)
+    line = customers[0].get_phone_line('867-5309')
+    assert line.get_number_id() == NUMBERS.lookup('867-5309')
+    assert customers[0].get_phone_line(line.get_number_id()) is line
+    assert sorted(customers[0].get_number_ids()) == \
+        sorted(NUMBERS.lookup(n) for n in customers[0].get_phone_numbers())
+    call = line.get_call_history().get_outgoing_view()[0]
+    assert call.src_id == line.number_id and call.src_number == '867-5309'
+    assert call.dst_id in customers[0] and '867-5309' in customers[0]
+    assert line.get_bill(1, 2018)['number'] == '867-5309'
+    assert Call(call.src_id, '273-8255', call.time, 1, (0, 0), (0, 0)) \
+        .dst_id == NUMBERS.lookup('273-8255')
+
+
+def test_packed_times() -> None:
+    """ Test that calls store their time packed into an int, ordered like the
+    times themselves, and give it back as a datetime
+    """
+    times = [datetime.datetime(2017, 12, 31, 23, 59, 59),
+             datetime.datetime(2018, 1, 1),
+             datetime.datetime(2018, 1, 31, 23, 59, 59),
+             datetime.datetime(2018, 2, 1, 0, 0, 1)]
+    packed = [pack_time(t) for t in times]
+    assert packed == sorted(packed)
+    assert [unpack_time(p) for p in packed] == times
+    assert packed[1] == pack_month(1, 2018) == \
+        parse_time('2018-01-01 00:00:00')
+    assert pack_time(datetime.datetime(2018, 1, 1, 0, 0, 0, 999)) == packed[1]
+
+    call = Call('867-5309', '273-8255', times[2], 5, (0, 0), (0, 0))
+    assert call.packed_time == packed[2] and call.time == times[2]
+    assert call.get_bill_date() == (1, 2018)
+    assert Call('867-5309', '273-8255', packed[3], 5, (0, 0), (0, 0)) \
+        .time == times[3]
+
+    customers = create_customers(test_dict)
+    process_event_history(test_dict, customers)
+    out, _ = customers[0].get_calls_between(
+        datetime.datetime(2018, 1, 1, 1, 1, 4, 1),
+        datetime.datetime(2018, 1, 1, 1, 1, 5, 500))
+    assert [c.time for c in out] == [datetime.datetime(2018, 1, 1, 1, 1, 5)]
+
+
+def test_sms_counters() -> None:
+    """ Test that SMS events are counted per line and month, billed by plans
+    with an SMS rate, and optionally stored in an SMSLog
+    """
+    load_rate_plans({'texter': {'bill_type': 'TEXTER', 'included_sms': 1,
+                                'sms_rate_mills': 100}})
+    try:
+        log = {'events': test_dict['events'] + [
+            dict(test_dict['events'][0], time='2018-01-02 00:00:00'),
+            dict(test_dict['events'][1], time='2018-02-01 00:00:00')],
+               'customers': [{'id': 1234,
+                              'lines': [{'number': '867-5309',
+                                         'contract': 'texter'},
+                                        {'number': '273-8255',
+                                         'contract': 'mtm'},
+                                        {'number': '649-2568',
+                                         'contract': 'prepaid'}]}]}
+        serial = create_customers(log)
+        sms_log = SMSLog()
+        process_event_history(log, serial, sms_log)
+        lazy = create_customers(log, lazy_bills=True)
+        process_event_history(log, lazy)
+    finally:
+        del RATE_PLANS['texter']
+
+    texter = serial[0].get_phone_line('867-5309')
+    assert texter.get_sms_counts(1, 2018) == (2, 1)
+    assert texter.get_sms_counts() == (2, 1)
+    assert serial[0].get_phone_line('273-8255').get_sms_counts() == (2, 2)
+    bill = texter.get_bill(1, 2018)
+    assert (bill['free_sms'], bill['billed_sms']) == (1, 1)
+    assert bill['total'] == pytest.approx(0.1)
+    assert serial[0].get_phone_line('649-2568').get_bill(1, 2018)[
+        'billed_sms'] == 1
+    for month in [1, 2]:
+        assert lazy[0].generate_bill(month, 2018) == \
+            serial[0].generate_bill(month, 2018)
+
+    assert len(sms_log) == 5
+    assert list(sms_log)[0] == (NUMBERS.lookup('867-5309'),
+                                NUMBERS.lookup('273-8255'),
+                                parse_time('2018-01-01 01:01:01'))
+    assert sms_log.count_between(datetime.datetime(2018, 1, 1, 1, 1, 2),
+                                 datetime.datetime(2018, 1, 2)) == 3
+
+
+def test_usage_stats() -> None:
+    """ Test that the running usage statistics of each line match its call
+    history, and that they can be exported
+    """
+    log = {'events': [dict(test_dict['events'][3], duration=d,
+                           time=f'2018-01-0{i + 1} 00:00:00')
+                      for i, d in enumerate([10, 500, 12, 3000, 14])],
+           'customers': test_dict['customers']}
+    log['events'][2]['dst_number'] = '649-2568'
+    customers = create_customers(log)
+    process_event_history(log, customers)
+
+    out_stats, in_stats = customers[0].get_phone_line('273-8255') \
+        .get_usage_stats()
+    assert (out_stats.count, out_stats.total, out_stats.max_duration) == \
+        (5, 3536, 3000)
+    assert out_stats.get_mean() == pytest.approx(707.2)
+    # durations under 16 seconds are exact in the median histogram
+    assert out_stats.get_median() == 14
+    assert out_stats.get_top_numbers(2) == [('867-5309', 4), ('649-2568', 1)]
+    assert in_stats.count == 0 and in_stats.get_median() == 0
+    assert customers[0].get_phone_line('867-5309').get_usage_stats()[1] \
+        .get_summary(1)['top'] == [('273-8255', 4)]
+
+    out = io.StringIO()
+    assert export_usage_stats(customers, out) == 6
+    lines = out.getvalue().splitlines()
+    assert lines[0] == 'customer,number,direction,count,total,mean,max,' \
+                       'median,top'
+    assert '5555,273-8255,out,5,3536,707.2,3000,14,867-5309:4 649-2568:1' \
+        in lines
+
+
+def test_top_k() -> None:
+    """ Test the top-K queries over customers, lines and called numbers, and
+    the top customers filter
+    """
+    call = test_dict['events'][3]
+    log = {'events': [dict(call, src_number=src, dst_number=dst, duration=d,
+                           time=time)
+                      for src, dst, d, time in [
+                          ('111-1111', '333-3333', 600, '2018-01-01 00:00:00'),
+                          ('222-2222', '333-3333', 61, '2018-01-02 00:00:00'),
+                          ('333-3333', '111-1111', 30, '2018-01-03 00:00:00'),
+                          ('222-2222', '111-1111', 900, '2018-02-01 00:00:00'),
+                          ('222-2222', '333-3333', 60, '2018-02-02 00:00:00')
+                      ]],
+           'customers': [{'id': 1, 'lines': [{'number': '111-1111',
+                                              'contract': 'mtm'}]},
+                         {'id': 2, 'lines': [{'number': '222-2222',
+                                              'contract': 'mtm'},
+                                             {'number': '333-3333',
+                                              'contract': 'mtm'}]}]}
+    customers = create_customers(log)
+    process_event_history(log, customers)
+
+    assert top_lines(customers, 2, 1, 2018) == [('111-1111', 10),
+                                                ('222-2222', 2)]
+    assert top_lines(customers, 1, by='calls') == [('222-2222', 3)]
+    assert top_customers(customers, 2) == [(2, 19), (1, 10)]
+    assert top_customers(customers, 5, 1, 2018) == [(1, 10), (2, 3)]
+    assert top_destinations(customers, 1) == [('333-3333', 3)]
+    assert top_destinations(customers, 2, 2, 2018) == [('111-1111', 1),
+                                                       ('333-3333', 1)]
+    with pytest.raises(ValueError):
+        top_lines(customers, 1, by='seconds')
+
+    calls = ResetFilter().apply(customers, [], '')
+    assert [c.duration for c in TopCustomersFilter().apply(
+        customers, calls, '1 2018-01')] == [600]
+    assert len(TopCustomersFilter().apply(customers, calls, '1')) == 4
+    for invalid in ['', '0', 'x', '1 2018-13', '1 2018-01 x']:
+        assert TopCustomersFilter().apply(customers, calls, invalid) == calls
+
+
+def test_call_graph() -> None:
+    """ Test the neighbour, degree and hop queries of the call graph, and
+    the call graph filter
+    """
+    call = test_dict['events'][3]
+    log = {'events': [dict(call, src_number=src, dst_number=dst, duration=d)
+                      for src, dst, d in [('111-1111', '222-2222', 60),
+                                          ('222-2222', '111-1111', 30),
+                                          ('222-2222', '333-3333', 10),
+                                          ('333-3333', '444-4444', 5),
+                                          ('444-4444', '444-4444', 1)]],
+           'customers': [{'id': cid, 'lines': [{'number': number,
+                                                'contract': 'mtm'}]}
+                         for cid, number in [(1, '111-1111'), (2, '222-2222'),
+                                             (3, '333-3333'),
+                                             (4, '444-4444')]]}
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    graph = CallGraph.from_customers(customers)
+
+    assert graph.get_neighbours('222-2222') == [('111-1111', 2, 90),
+                                                ('333-3333', 1, 10)]
+    assert graph.get_degree('444-4444') == 1
+    assert graph.get_degree('999-9999') == 0
+    assert list(graph.get_neighbour_ids('111-1111')) == \
+        [NUMBERS.lookup('222-2222')]
+    assert graph.get_two_hop_ids('111-1111') == {NUMBERS.lookup('333-3333')}
+    assert graph.get_ids_within(['111-1111'], 3) == \
+        {NUMBERS.lookup(n) for n in ['111-1111', '222-2222', '333-3333',
+                                     '444-4444']}
+
+    calls = ResetFilter().apply(customers, [], '')
+    assert [c.duration for c in CallGraphFilter().apply(
+        customers, calls, '1 1')] == [60, 30]
+    assert [c.duration for c in CallGraphFilter().apply(
+        customers, calls, '1 2')] == [60, 30, 10]
+    assert len(CallGraphFilter().apply(customers, calls, '1 9')) == 5
+    for invalid in ['', '1', '1 0', '7 1', '1 x', '1 2 3']:
+        assert CallGraphFilter().apply(customers, calls, invalid) == calls
+
+    # the graph is only rebuilt once calls are added
+    graph = CallGraph.of_customers(customers)
+    assert CallGraph.of_customers(customers) is graph
+    call = Call('111-1111', '444-4444', parse_time('2018-01-02 00:00:00'), 20,
+                (-79.4, 43.6), (-79.5, 43.7))
+    customers[0].make_call(call)
+    customers[3].receive_call(call)
+    assert CallGraph.of_customers(customers) is not graph
+    assert [c.duration for c in CallGraphFilter().apply(
+        customers, calls + [call], '1 1')] == [60, 30, 20]
+
+
+def test_live_ingestion(tmp_path) -> None:
+    """ Test that events ingested live, in batches, give the same bills and
+    histories as processing the whole log, and that invalid or late events
+    are rejected
+    """
+    events = test_dict['events'] + [
+        dict(event, time='2018-02' + event['time'][7:])
+        for event in test_dict['events']]
+    log = {'events': events, 'customers': test_dict['customers']}
+    serial = create_customers(log)
+    process_event_history(log, serial)
+
+    live = create_customers(log)
+    process_event_history({'events': events[:4]}, live)
+    ingestor = LiveIngestor(live)
+    for event in events[4:8]:
+        ingestor.submit(json.dumps(event))
+    ingestor.submit('{"type": "call", "time": "2018-02-01 00:00:00"}')
+    call = next(event for event in events[4:8] if event['type'] == 'call')
+    for duration in [None, '60', -1, True, 1.5]:
+        ingestor.submit(json.dumps(dict(call, duration=duration)))
+    ingestor.submit(json.dumps(dict(call, src_loc=[0])))
+    ingestor.submit(json.dumps(dict(call, dst_number=5555)))
+    ingestor.submit(json.dumps(events[0]))
+    for event in events[8:]:
+        ingestor.submit(json.dumps(event))
+
+    new_calls = []
+    while True:
+        batch = ingestor.poll(max_events=3)
+        if not batch and ingestor.processed + ingestor.rejected == 17:
+            break
+        new_calls.extend(batch)
+    assert (ingestor.processed, ingestor.rejected) == (8, 9)
+    assert [c.duration for c in new_calls] == [50, 50, 10, 50, 50]
+    for month, year in [(1, 2018), (2, 2018)]:
+        assert live[0].generate_bill(month, year) == \
+            serial[0].generate_bill(month, year)
+    for history in [0, 1]:
+        assert [str(c) for c in live[0].get_history()[history]] == \
+            [str(c) for c in serial[0].get_history()[history]]
+
+    # only the new calls of the customer are kept, even if there are none
+    assert CustomerFilter().apply_new(live, new_calls, '5555') == new_calls
+    assert CustomerFilter().apply_new(serial, new_calls, '5555') == []
+    assert CustomerFilter().apply_new(live, new_calls, 'x') == new_calls
+
+    path = tmp_path / 'events.jsonl'
+    path.write_text('{"a": 1}\n{"b"')
+    stop = threading.Event()
+    lines = follow_file(str(path), stop, poll_interval=0.01)
+    assert next(lines) == '{"a": 1}\n'
+    with open(path, 'a') as file:
+        file.write(': 2}\n')
+    assert next(lines) == '{"b": 2}\n'
+    stop.set()
+    assert list(lines) == []
+
+
+def test_async_ingestion(tmp_path) -> None:
+    """ Test that events sent by several producers to the asyncio front end
+    are merged in order and give the same bills as processing the whole log
+    """
+    events = test_dict['events'] + [
+        dict(event, time='2018-02' + event['time'][7:])
+        for event in test_dict['events']]
+    log = {'events': events, 'customers': test_dict['customers']}
+    serial = create_customers(log)
+    process_event_history(log, serial)
+
+    live = create_customers(log)
+    ingestor = LiveIngestor(live)
+    server = AsyncEventServer(str(tmp_path / 'events.sock'), ingestor,
+                              batch_size=4)
+    server.start()
+    try:
+        generate_load(server.get_address(), events, num_producers=3)
+        asyncio.run(send_events(server.get_address(), ['not an event']))
+        new_calls = []
+        deadline = time.time() + 10
+        while ingestor.processed < len(events) and time.time() < deadline:
+            new_calls.extend(server.poll())
+            time.sleep(0.01)
+    finally:
+        server.stop()
+
+    metrics = server.get_metrics()
+    assert (metrics['received'], metrics['rejected'],
+            metrics['processed']) == (12, 1, 12)
+    assert metrics['queued_events'] == metrics['queued_batches'] == 0
+    assert len(new_calls) == 6
+    for month, year in [(1, 2018), (2, 2018)]:
+        assert live[0].generate_bill(month, year) == \
+            serial[0].generate_bill(month, year)
+    assert [str(c) for c in live[0].get_history()[0]] == \
+        [str(c) for c in serial[0].get_history()[0]]
+
+    # events held back by a silent producer are kept when the server stops
+    live = create_customers(log)
+    ingestor = LiveIngestor(live)
+    server = AsyncEventServer(str(tmp_path / 'held.sock'), ingestor,
+                              batch_size=4)
+    server.start()
+    silent = socket.socket(socket.AF_UNIX)
+    try:
+        silent.connect(server.get_address())
+        silent.recv(64)
+        asyncio.run(send_events(server.get_address(),
+                                [json.dumps(event) for event in events]))
+        deadline = time.time() + 10
+        while server.received < len(events) and time.time() < deadline:
+            time.sleep(0.01)
+        assert server.poll() == []
+    finally:
+        server.stop()
+        silent.close()
+    assert len(server.poll()) == 6 and ingestor.processed == len(events)
+
+
+def test_query_server() -> None:
+    """ Test the bill, filter and history queries of the query server, its
+    errors, and that its cache is dropped when the model is updated
+    """
+    customers = create_customers(test_dict)
+    process_event_history(test_dict, customers)
+    server = QueryServer(customers)
+    server.start()
+    url = f'http://localhost:{server.get_port()}'
+
+    def _get(query: str) -> tuple[int, dict]:
+        """ Return the status and JSON response of <query> """
+        try:
+            with urllib.request.urlopen(url + query) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, json.loads(error.read())
+
+    try:
+        cid, total, bills = customers[0].generate_bill(1, 2018)
+        assert _get('/bill?customer=5555&month=1&year=2018') == \
+            (200, {'customer': cid, 'total': total, 'bills': bills})
+        status, calls = _get('/calls?customer=5555&duration=G20&limit=1')
+        assert (status, calls['count'], len(calls['calls'])) == (200, 2, 1)
+        assert calls['calls'][0]['duration'] == 50
+        status, history = _get('/history?number=867-5309'
+                               '&start=2018-01-01&end=2018-01-01T01:01:04')
+        assert [c['duration'] for c in history['incoming']] == [10]
+        assert history['outgoing'] == []
+
+        assert _get('/bill?customer=1&month=1&year=2018')[0] == 404
+        assert _get('/bill?customer=5555&month=x')[0] == 400
+        assert _get('/calls?colour=red')[0] == 400
+        assert _get('/calls?customer=5555&limit=-1')[0] == 400
+        assert _get('/history?number=867-5309&start=x&end=x')[0] == 400
+        assert _get('/nothing')[0] == 404
+
+        hits = server.cache_hits
+        _get('/calls?customer=5555&duration=G20&limit=1')
+        assert server.cache_hits == hits + 1
+        with server.writing():
+            call = Call('867-5309', '273-8255',
+                        parse_time('2018-01-02 00:00:00'), 30,
+                        (-79.4, 43.6), (-79.5, 43.7))
+            customers[0].make_call(call)
+            customers[0].receive_call(call)
+        status, calls = _get('/calls?customer=5555&duration=G20&limit=1')
+        assert calls['count'] == 3
+        assert server.cache_hits == hits + 1
+    finally:
+        server.stop()
+    # a server that was never started stops without waiting
+    QueryServer(customers).stop()
+
+
+def test_snapshots() -> None:
+    """ Test that snapshots answer like the model when they are taken, are
+    not changed by later events, and share the lines that did not change
+    """
+    log = {'events': test_dict['events'],
+           'customers': test_dict['customers']
+           + [{'id': 1, 'lines': [{'number': '111-1111',
+                                   'contract': 'mtm'}]}]}
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    publisher = SnapshotPublisher(customers)
+    assert publisher.get() is None
+    first = publisher.publish()
+
+    assert first.get_bill(5555, 1, 2018) == \
+        customers[0].generate_bill(1, 2018)
+    assert first.get_bill(7, 1, 2018) is None
+    assert first.get_calls() == tuple(ResetFilter().apply(customers, [], ''))
+    start = datetime.datetime(2018, 1, 1, 1, 1, 4, 1)
+    end = datetime.datetime(2018, 1, 1, 1, 1, 6)
+    assert first.get_calls_between('649-2568', start, end) == \
+        tuple(map(tuple, customers[0].get_phone_line(
+            '649-2568').get_calls_between(start, end)))
+    assert first.get_calls_between('999-9999', start, end) == ((), ())
+
+    ingestor = LiveIngestor(customers)
+    ingestor.process([dict(event, time='2018-02' + event['time'][7:])
+                      for event in test_dict['events']])
+    second = publisher.publish()
+    assert publisher.get() is second
+    assert (first.version, second.version) == (0, 1)
+    assert len(first.get_calls()) == 3 and len(second.get_calls()) == 6
+    assert first.get_bill(5555, 2, 2018) == (5555, 0.0, [])
+    assert second.get_bill(5555, 2, 2018) == \
+        customers[0].generate_bill(2, 2018)
+    assert second.get_line('867-5309') is not first.get_line('867-5309')
+
+    # the idle customer changes with the new month, but not afterwards
+    assert second.get_line('111-1111') is not first.get_line('111-1111')
+    assert publisher.publish().get_line('111-1111') is \
+        second.get_line('111-1111')
+
+
+def test_shared_store() -> None:
+    """ Test that filtering the calls of a shared store, in this process and
+    in a pool of processes, keeps the same calls as apply()
+    """
+    customers = create_customers(test_dict)
+    process_event_history(test_dict, customers)
+    calls = ResetFilter().apply(customers, [], '')
+    store = SharedCallStore.create(calls)
+    assert len(store) == 3 and list(store.duration) == \
+        [call.duration for call in calls]
+    queries = [(ResetFilter(), ''), (CustomerFilter(), '5555'),
+               (CustomerFilter(), '1234'), (DurationFilter(), 'G010'),
+               (DurationFilter(), 'X'), (TimeRangeFilter(), '1d'),
+               (TimeRangeFilter(), '2018-01-01 01:01:05, 2018-01-02'),
+               (LocationFilter(), '-79.5, 43.6, -79.4, 43.7'),
+               (TopCustomersFilter(), '1 1 2018'),
+               (CallGraphFilter(), '5555 1')]
+    try:
+        with multiprocessing.Pool(2) as pool:
+            for f, filter_string in queries:
+                for subset in (calls, calls[1:], []):
+                    expected = f.apply(customers, subset, filter_string)
+                    indices = array('l', [calls.index(c) for c in subset])
+                    for workers in (None, pool):
+                        found = apply_shared(f, customers, calls, store,
+                                             indices, filter_string, workers)
+                        assert [calls[i] for i in found] == expected
+    finally:
+        store.close()
+        store.unlink()
+
+
+def test_query_filter() -> None:
+    """ Test that a filter query keeps the same calls as applying the filters
+    of its terms one after the other, whatever the order of the terms, and
+    that the planner checks the most selective terms first
+    """
+    extra = [dict(test_dict['events'][4], src_number='111-1111',
+                  time='2018-01-02 10:00:00', duration=200),
+             dict(test_dict['events'][4], dst_number='111-1111',
+                  time='2018-01-03 10:00:00', duration=300)]
+    log = {'events': test_dict['events'] + extra,
+           'customers': test_dict['customers']
+           + [{'id': 1, 'lines': [{'number': '111-1111',
+                                   'contract': 'mtm'}]}]}
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    calls = ResetFilter().apply(customers, [], '')
+    bbox = '-79.5, 43.6, -79.4, 43.7'
+    cases = [('customer=1 AND duration>250', [(CustomerFilter(), '1'),
+                                              (DurationFilter(), 'G250')]),
+             ('duration<100 and bbox(-79.5,43.6,-79.4,43.7)',
+              [(DurationFilter(), 'L100'), (LocationFilter(), bbox)]),
+             ('time(2018-01-02, 2018-01-03) AND top(1, 2018-01)',
+              [(TimeRangeFilter(), '2018-01-02, 2018-01-03'),
+               (TopCustomersFilter(), '1 2018-01')]),
+             ('hops(1, 1) AND customer=5555',
+              [(CallGraphFilter(), '1 1'), (CustomerFilter(), '5555')])]
+    for query, filters in cases:
+        expected = calls
+        for f, filter_string in filters:
+            expected = f.apply(customers, expected, filter_string)
+        assert 0 < len(expected) < len(calls)
+        terms = query.replace(' and ', ' AND ').split(' AND ')
+        reordered = ' AND '.join(reversed(terms))
+        for text in (query, reordered):
+            assert QueryFilter().apply(customers, calls, text) == expected
+            assert [call for chunk in QueryFilter().apply_chunks(
+                customers, calls, text, 1) for call in chunk] == expected
+
+    # unlike CustomerFilter, a customer without calls keeps none
+    short_calls = DurationFilter().apply(customers, calls, 'L100')
+    assert QueryFilter().apply(customers, short_calls, 'customer=1') == []
+    for invalid in ('', 'customer=7', 'duration=10', 'duration>x',
+                    'customer=1 AND', 'bbox(1, 2, 3, 4)', 'size(3)'):
+        assert QueryFilter().apply(customers, calls, invalid) is calls
+
+    long_calls = ('duration', False, 250)
+    everything = ('duration', False, -1)
+    assert plan_queries([everything, long_calls], calls) == \
+        [long_calls, everything]
+
+
+def test_hops_external_number() -> None:
+    """ Test that the calls between a number without a customer, within the
+    hops of a call graph filter, and a line outside them are kept
+    """
+    call = test_dict['events'][3]
+    pairs = [('111-1111', '999-9999', 60), ('999-9999', '222-2222', 30)]
+    pairs += [('222-2222', '333-3333', 1)] * 19
+    log = {'events': [dict(call, src_number=src, dst_number=dst, duration=d)
+                      for src, dst, d in pairs],
+           'customers': [{'id': cid, 'lines': [{'number': number,
+                                                'contract': 'mtm'}]}
+                         for cid, number in [(1, '111-1111'), (2, '222-2222'),
+                                             (3, '333-3333')]]}
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    # the call from 999-9999 is only in the incoming calls of a line
+    calls = list(dict.fromkeys(call for customer in customers
+                               for history in customer.get_history()
+                               for call in history))
+    expected = [c for c in calls if c.duration in (60, 30)]
+    assert len(expected) == 2
+    assert CallGraphFilter().apply(customers, calls, '1 2') == expected
+    assert QueryFilter().apply(customers, calls, 'hops(1, 2)') == expected
+    assert CallGraphFilter().apply_new(customers, calls[1:], '1 2') == \
+        expected[1:]
+
+
+def test_filter_cache() -> None:
+    """ Test that cached filter results equal recomputed ones, are found
+    again for equivalent filter strings and chained filters, are evicted
+    least recently used first, and are not returned once calls are ingested
+    """
+    log = {'events': test_dict['events'],
+           'customers': test_dict['customers']}
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    cache = FilterCache(max_size=3)
+    calls = cache.apply(ResetFilter(), customers, [], '')
+    assert calls == ResetFilter().apply(customers, [], '')
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    short = cache.apply(DurationFilter(), customers, calls, 'L020')
+    assert short == DurationFilter().apply(customers, calls, 'L020')
+    again = cache.apply(DurationFilter(), customers, calls, 'L20')
+    assert again == short and again is not short
+    assert (cache.hits, cache.misses) == (1, 2)
+    # the filters applied to a cached result are cached too
+    bbox = '-79.6, 43.6, -79.3, 43.7'
+    located = cache.apply(LocationFilter(), customers, again, bbox)
+    assert cache.apply(LocationFilter(), customers, short,
+                       '-79.60, 43.6, -79.3, 43.70') == located
+    assert (cache.hits, cache.misses) == (2, 3)
+    # an invalid filter string returns the very list filtered
+    assert cache.apply(DurationFilter(), customers, calls, 'X') is calls
+    assert cache.apply(DurationFilter(), customers, calls, 'X') is calls
+    assert len(cache) == 3 and (cache.hits, cache.misses) == (3, 4)
+
+    # the least recently used result, the reset, was evicted
+    cache.apply(ResetFilter(), customers, calls, '')
+    assert cache.misses == 5
+
+    ingestor = LiveIngestor(customers)
+    ingestor.process([dict(event, time='2018-02' + event['time'][7:])
+                      for event in test_dict['events']])
+    recomputed = cache.apply(DurationFilter(), customers, calls, 'L020')
+    assert cache.misses == 6 and recomputed == short
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_call_bitmaps() -> None:
+    """ Test that filter results as bitmaps hold the calls that apply()
+    keeps, and that they combine with AND, OR and NOT like lists of calls
+    """
+    log = {'events': test_dict['events'],
+           'customers': test_dict['customers']}
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    calls = ResetFilter().apply(customers, [], '')
+    index = CallIndex(calls[1:])
+    index.add(calls)
+    assert len(index) == 3
+    everything = index.get_all()
+    assert everything.to_calls() == calls[1:] + calls[:1]
+    assert index.to_bitmap([calls[2], calls[0]]).to_calls() == \
+        [calls[2], calls[0]]
+
+    bbox = '-79.5, 43.6, -79.4, 43.7'
+    for f, filter_string in [(DurationFilter(), 'G020'),
+                             (LocationFilter(), bbox),
+                             (CustomerFilter(), '5555'),
+                             (TimeRangeFilter(), '2018-01-01 01:01:05, 1d'),
+                             (TimeRangeFilter(), '0d')]:
+        for subset in (calls, calls[:2]):
+            expected = f.apply(customers, subset, filter_string)
+            found = f.apply_bitmap(customers, index.to_bitmap(subset),
+                                   filter_string)
+            assert sorted(map(id, found.to_calls())) == \
+                sorted(map(id, expected))
+    assert DurationFilter().apply_bitmap(customers, everything, 'X') \
+        is everything
+    assert ResetFilter().apply_bitmap(customers, index.to_bitmap([]), '') \
+        == everything
+
+    longer = DurationFilter().apply_bitmap(customers, everything, 'G020')
+    early = TimeRangeFilter().apply_bitmap(
+        customers, everything, '2018-01-01 01:01:04, 2018-01-01 01:01:05')
+    longer_calls, early_calls = longer.to_calls(), early.to_calls()
+    assert 0 < len(longer) < 3 and 0 < len(early) < 3
+    assert (longer & early).to_calls() == \
+        [call for call in longer_calls if call in early_calls]
+    assert (longer | early).to_calls() == \
+        [call for call in everything.to_calls()
+         if call in longer_calls or call in early_calls]
+    assert (~longer).to_calls() == \
+        [call for call in everything.to_calls() if call not in longer_calls]
+    assert (everything - longer) == ~longer
+
+    # the bitmaps of queries are extended with the calls added to the index
+    ingestor = LiveIngestor(customers)
+    ingestor.process([dict(event, time='2018-02' + event['time'][7:])
+                      for event in test_dict['events']])
+    calls = ResetFilter().apply(customers, [], '')
+    index.add(calls)
+    longer = DurationFilter().apply_bitmap(customers, index.get_all(), 'G020')
+    assert len(longer) == 2 * len(longer_calls)
+
+
+def test_month_partitions() -> None:
+    """ Test that the calls of months taken from a MonthIndex are the calls
+    that MonthFilter keeps, and that filters run month by month
+    """
+    log = {'events': test_dict['events'],
+           'customers': test_dict['customers']}
+    customers = create_customers(log)
+    process_event_history(log, customers)
+    ingestor = LiveIngestor(customers)
+    for month in ('2018-02', '2018-03'):
+        ingestor.process([dict(event, time=month + event['time'][7:])
+                          for event in test_dict['events']])
+    calls = ResetFilter().apply(customers, [], '')
+    index = MonthIndex(calls)
+    assert len(index) == len(calls) == 9
+    assert index.get_months() == [(1, 2018), (2, 2018), (3, 2018)]
+    assert list(index.get_partition(4, 2018)) == []
+
+    f = MonthFilter()
+    for filter_string in ('2018-02', '2018-01, 2018-02', ' 2018-02,2018-03',
+                          '2017-06, 2018-12', '2018-04'):
+        first, last = f.normalize(filter_string).split(', ')
+        expected = [call for call in calls
+                    if first <= call.time.strftime('%Y-%m') <= last]
+        assert f.apply(customers, calls, filter_string) == expected
+        assert f.apply_index(index, filter_string) == expected
+    assert f.normalize('2018-1') == '2018-01, 2018-01'
+    for filter_string in ('2018-03, 2018-01', '2018', '2018-01, 2, 3'):
+        assert f.apply(customers, calls, filter_string) is calls
+        assert f.apply_index(index, filter_string) is None
+    assert QueryFilter().apply(customers, calls,
+                               'month(2018-02) AND duration>20') == \
+        DurationFilter().apply(customers, f.apply(customers, calls, '2018-02'),
+                               'G020')
+
+    results = list(apply_by_month(DurationFilter(), customers, index, 'G020',
+                                  '2018-02, 2018-05'))
+    assert [month for month, _ in results] == [(2, 2018), (3, 2018)]
+    for (month, year), kept in results:
+        assert kept == DurationFilter().apply(
+            customers, f.apply(customers, calls, f'{year}-{month:02d}'),
+            'G020')
+    assert len(list(apply_by_month(ResetFilter(), customers, index, ''))) \
+        == 3
+    assert list(apply_by_month(ResetFilter(), customers, index, '', 'x')) \
+        == []
+
+    # new calls are added to the partitions of their months
+    index.add(calls[:2])
+    assert len(index) == 9
+    new_calls = [Call('867-5309', '273-8255',
+                      datetime.datetime(2018, 2, 3, 10, 0, 0), 60,
+                      (-79.4, 43.6), (-79.5, 43.7))]
+    index.add(new_calls)
+    assert f.apply_index(index, '2018-02') == \
+        f.apply(customers, calls + new_calls, '2018-02')
+
+
 if __name__ == '__main__':
     pytest.main(['my_tests.py'])
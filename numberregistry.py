@@ -0,0 +1,90 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+"""
+from typing import Optional, Union
+
+
+class NumberRegistry:
+    """ A registry of phone numbers, mapping each "###-####" number to a
+    dense integer id: the first number registered gets id 0, the next one 1,
+    and so on. Ids are never reused, so an id identifies the same number for
+    as long as the registry exists.
+
+    Calls, phone lines and call histories store and compare these ids, and
+    only turn them back into strings for display and export.
+    """
+    # === Private Attributes ===
+    # _ids:
+    #     maps each registered number to its id
+    # _numbers:
+    #     the registered numbers, indexed by their id
+    _ids: dict[str, int]
+    _numbers: list[str]
+
+    def __init__(self) -> None:
+        """ Create a new, empty NumberRegistry.
+        """
+        self._ids = {}
+        self._numbers = []
+
+    def intern(self, number: Union[str, int]) -> int:
+        """ Return the id of the phone number <number>, registering it first
+        if it is not registered yet. If <number> is already an id, return it.
+        """
+        if isinstance(number, int):
+            return number
+        nid = self._ids.get(number)
+        if nid is None:
+            nid = len(self._numbers)
+            self._ids[number] = nid
+            self._numbers.append(number)
+        return nid
+
+    def lookup(self, number: Union[str, int]) -> Optional[int]:
+        """ Return the id of the phone number <number>, or None if it is not
+        registered. Unlike intern(), never registers <number>. If <number> is
+        already an id, return it.
+        """
+        if isinstance(number, int):
+            return number
+        return self._ids.get(number)
+
+    def get_number(self, nid: int) -> str:
+        """ Return the phone number with the id <nid>.
+
+        Precondition: <nid> is the id of a registered number.
+        """
+        return self._numbers[nid]
+
+    def __len__(self) -> int:
+        """ Return the number of registered phone numbers
+        """
+        return len(self._numbers)
+
+    def __contains__(self, number: str) -> bool:
+        """ Return whether the phone number <number> is registered
+        """
+        return number in self._ids
+
+
+# The registry shared by the whole model. Phone lines register their numbers
+# as they are created, so create_customers registers every number of the
+# dataset before any call is loaded.
+NUMBERS = NumberRegistry()
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['python_ta', 'typing'],
+    })
@@ -11,25 +11,30 @@ any changes, are expressly prohibited.
 All of the files in this directory and all subdirectories are:
 Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
 """
-from typing import Optional, Union
+import datetime
+from typing import Optional, Sequence, Union
 from call import Call
-from callhistory import CallHistory
+from callhistory import CallHistory, MonthlyCallsView
 from bill import Bill
-from contract import Contract
+from contract import Contract, PlanContract
+from numberregistry import NUMBERS
+from linestats import UsageStats
 
 
 class PhoneLine:
     """ MewbileTech customer's phone line.
 
     === Public Attributes ===
-    number:
-         phone number
+    number_id:
+         id of the phone number of this line in the NUMBERS registry
     contract:
          current contract for this phone, represented by a Contract instance
     bills:
          dictionary containing all the bills for this phoneline
          each key is a (month, year) tuple and the corresponding value is
          the Bill object for that month+year date.
+         With lazy bills, the value is None for a month in which no call has
+         been billed yet; get_bill() still summarizes it.
     callhistory:
          call history for this phone line, represented as a CallHistory object
 
@@ -37,18 +42,39 @@ class PhoneLine:
     - the <bills> dictionary contains as keys only those month+year combinations
     for dates that are encountered at least in one call from the input dataset.
     """
-    number: str
+    # === Private Attributes ===
+    # _lazy_bills:
+    #     whether Bill objects are only created once a call is billed in
+    #     their month
+    # _start_balances:
+    #     with lazy bills and a prepaid plan, the balance in mills at the
+    #     start of each month whose Bill has not been created yet
+    # _latest_month:
+    #     the (month, year) of the last month started, or None
+    number_id: int
     contract: Contract
-    bills: dict[tuple[int, int], Bill]
+    bills: dict[tuple[int, int], Optional[Bill]]
     callhistory: CallHistory
+    _lazy_bills: bool
+    _start_balances: dict[tuple[int, int], int]
+    _latest_month: Optional[tuple[int, int]]
 
-    def __init__(self, number: str, contract: Contract) -> None:
+    def __init__(self, number: str, contract: Contract,
+                 lazy_bills: bool = False) -> None:
         """ Create a new PhoneLine with <number> and <contract>.
+
+        If <lazy_bills> is True, starting a month only records it in <bills>
+        (and the prepaid balance, if any), and the Bill is created when the
+        first call of the month is billed. Lazy bills need a contract with a
+        rate plan; other contracts always get their bills right away.
         """
-        self.number = number
+        self.number_id = NUMBERS.intern(number)
         self.contract = contract
         self.callhistory = CallHistory()
         self.bills = {}
+        self._lazy_bills = lazy_bills and isinstance(contract, PlanContract)
+        self._start_balances = {}
+        self._latest_month = None
 
     def new_month(self, month: int, year: int) -> None:
         """ Advance to a new month (specified by <month> and <year>) in the
@@ -57,8 +83,43 @@ class PhoneLine:
         create a new bill.
         """
         if (month, year) not in self.bills:
-            self.bills[(month, year)] = Bill()
-            self.contract.new_month(month, year, self.bills[(month, year)])
+            self._latest_month = (month, year)
+            if self._lazy_bills:
+                self.bills[(month, year)] = None
+                if self.contract.plan.prepaid:
+                    self._start_balances[(month, year)] = \
+                        self.contract.balance_mills
+            else:
+                self.bills[(month, year)] = Bill()
+                self.contract.new_month(month, year,
+                                        self.bills[(month, year)])
+
+    def _open_latest_bill(self) -> None:
+        """ Create the Bill of the last month started, if it is still pending,
+        and advance the contract to it, as new_month() does without lazy
+        bills.
+        """
+        key = self._latest_month
+        if key is not None and self.bills[key] is None:
+            self._start_balances.pop(key, None)
+            self.bills[key] = Bill()
+            self.contract.new_month(key[0], key[1], self.bills[key])
+
+    def _get_bill_object(self, month: int, year: int) -> Bill:
+        """ Return the Bill for <month> and <year>. If the bill is pending,
+        return a new Bill with the fixed costs of that month, without storing
+        it.
+
+        Precondition:
+        - (month, year) in self.bills
+        """
+        bill = self.bills[(month, year)]
+        if bill is None:
+            bill = Bill()
+            self.contract.charge_month(
+                month, year, bill,
+                self._start_balances.get((month, year), 0))
+        return bill
 
     def make_call(self, call: Call) -> None:
         """ Add the <call> to this phone line's callhistory, and bill it
@@ -67,13 +128,14 @@ class PhoneLine:
         month must be <started> by advancing to the right month from <call>.
         """
         # new_month() automatically checks if there's no months
-        month = call.time.month
-        year = call.time.year
+        month, year = call.get_bill_date()
         self.new_month(month, year)
         # MAKE a call --> outgoing
         self.callhistory.register_outgoing_call(call)
 
         # they should only be billed for outgoing calls
+        if self._lazy_bills:
+            self._open_latest_bill()
         self.contract.bill_call(call)
 
     def receive_call(self, call: Call) -> None:
@@ -84,15 +146,59 @@ class PhoneLine:
         <call>.
         """
         # new_month() automatically checks if there's no months
-        month = call.time.month
-        year = call.time.year
+        month, year = call.get_bill_date()
         self.new_month(month, year)
         # RECEIVE a call --> incoming
         self.callhistory.register_incoming_call(call)
 
+    def send_sms(self, month: int, year: int) -> None:
+        """ Count an SMS sent from this phone line in <month> of <year>, and
+        bill it according to the contract for this phone line. As for calls,
+        the month is started first if needed.
+        """
+        self.new_month(month, year)
+        self.callhistory.register_outgoing_sms(month, year)
+        if self._lazy_bills:
+            self._open_latest_bill()
+        self.contract.bill_sms()
+
+    def receive_sms(self, month: int, year: int) -> None:
+        """ Count an SMS received by this phone line in <month> of <year>.
+        Incoming SMSs are not billed under any contract.
+        """
+        self.new_month(month, year)
+        self.callhistory.register_incoming_sms(month, year)
+
+    def bill_sms(self, count: int) -> None:
+        """ Bill a batch of <count> SMSs, already counted in this line's
+        callhistory, as send_sms() would bill them one by one.
+
+        Precondition:
+        - all the SMSs were sent in the current monthly billing cycle of this
+        line's contract
+        """
+        if self._lazy_bills:
+            self._open_latest_bill()
+        self.contract.bill_sms(count)
+
+    def bill_calls(self, minutes: Sequence[int]) -> None:
+        """ Bill a batch of outgoing calls, already registered in this line's
+        callhistory, given as the number of minutes <minutes> each call is
+        charged for, in the order the calls were made.
+
+        Precondition:
+        - all the calls were made in the current monthly billing cycle of this
+        line's contract
+        """
+        if self._lazy_bills:
+            self._open_latest_bill()
+        self.contract.bill_calls(minutes)
+
     def cancel_line(self) -> float:
         """ Cancel this line's contract and return the outstanding bill amount
         """
+        if self._lazy_bills:
+            self._open_latest_bill()
         return self.contract.cancel_contract()
 
     # ----------------------------------------------------------
@@ -101,11 +207,23 @@ class PhoneLine:
     # but feel free to read them to get a sense of what these do.
     # ----------------------------------------------------------
 
+    @property
+    def number(self) -> str:
+        """ The phone number of this line
+        """
+        return NUMBERS.get_number(self.number_id)
+
     def get_number(self) -> str:
         """ Return the phone number for this line
         """
         return self.number
 
+    def get_number_id(self) -> int:
+        """ Return the id of the phone number of this line in the NUMBERS
+        registry
+        """
+        return self.number_id
+
     def get_call_history(self) -> CallHistory:
         """ Return the CallHistory for this line
         """
@@ -127,6 +245,74 @@ class PhoneLine:
         """
         return self.callhistory.get_monthly_history(month, year)
 
+    def get_monthly_view(self, month: int = None, year: int = None) -> \
+            tuple[MonthlyCallsView, MonthlyCallsView]:
+        """ Return read-only views of the calls get_monthly_history() would
+        return for <month> and <year>, without copying them, as a Tuple
+        (outgoing calls, incoming calls).
+
+        Precondition:
+        - <month> and <year> are either both specified, or are both missing/None
+        """
+        return self.callhistory.get_monthly_view(month, year)
+
+    def get_sms_counts(self, month: int = None, year: int = None) \
+            -> tuple[int, int]:
+        """ Return the number of SMSs this line sent and received in <month>
+        of <year>, or in all months if <month> and <year> are both None, as a
+        Tuple (sent, received).
+        """
+        return self.callhistory.get_sms_counts(month, year)
+
+    def get_outgoing_minutes(self, month: int = None, year: int = None) -> int:
+        """ Return the number of minutes charged for the outgoing calls of
+        this line (free or billed) in <month> of <year>, or in all months if
+        <month> and <year> are both None, as counted by its bills.
+        """
+        if month is not None and year is not None:
+            bills = [self.bills.get((month, year))]
+        else:
+            bills = self.bills.values()
+        # a pending lazy bill has no calls billed yet
+        return sum(bill.free_min + bill.billed_min for bill in bills
+                   if bill is not None)
+
+    def get_usage_stats(self) -> tuple[UsageStats, UsageStats]:
+        """ Return the running statistics of all calls this line has made and
+        received, as a Tuple (outgoing stats, incoming stats), without
+        rescanning its callhistory.
+        """
+        return self.callhistory.get_usage_stats()
+
+    def get_billing_state(self) -> tuple:
+        """ Return the bills, the contract and the pending monthly balances of
+        this phone line, which hold all of its billing state
+        """
+        return self.bills, self.contract, self._start_balances, \
+            self._latest_month
+
+    def set_billing_state(self, state: tuple) -> None:
+        """ Replace the billing state of this phone line with <state>, as
+        returned by get_billing_state() on an identical phone line.
+        """
+        self.bills, self.contract, self._start_balances, \
+            self._latest_month = state
+
+    def get_bill_dates(self) -> list[tuple[int, int]]:
+        """ Return the (month, year) of every bill of this phone line, in the
+        order the months were started
+        """
+        return list(self.bills)
+
+    def get_calls_between(self, start: datetime.datetime,
+                          end: datetime.datetime) \
+            -> tuple[list[Call], list[Call]]:
+        """ Return all calls this line has made and received between <start>
+        and <end> inclusive, in chronological order, as a Tuple
+        (outgoing calls, incoming calls).
+        """
+        return self.callhistory.get_calls_between(start, end)
+
     def get_bill(self, month: int, year: int) \
             -> Optional[dict[str, Union[float, int]]]:
         """ Return a bill summary for the <month>+<year> billing cycle, as a
@@ -145,7 +331,21 @@ class PhoneLine:
         if (month, year) not in self.bills:
             return None
 
-        bill_summary = self.bills[(month, year)].get_summary()
+        bill_summary = self._get_bill_object(month, year).get_summary()
+        bill_summary['number'] = self.number
+        return bill_summary
+
+    def get_bill_mills(self, month: int, year: int) \
+            -> Optional[dict[str, Union[int, str]]]:
+        """ Return a bill summary for the <month>+<year> billing cycle like
+        get_bill(), with the amounts of money ("fixed", "min_rate" and "total")
+        as integers in mills.
+        If no bill exists for this month+year, return None.
+        """
+        if (month, year) not in self.bills:
+            return None
+
+        bill_summary = self._get_bill_object(month, year).get_summary_mills()
         bill_summary['number'] = self.number
         return bill_summary
 
@@ -155,8 +355,9 @@ if __name__ == '__main__':
 
     python_ta.check_all(config={
         'allowed-import-modules': [
-            'python_ta', 'typing',
-            'call', 'callhistory', 'bill', 'contract'
+            'python_ta', 'typing', 'datetime',
+            'call', 'callhistory', 'bill', 'contract', 'numberregistry',
+            'linestats'
         ],
         'generated-members': 'pygame.*'
     })
@@ -0,0 +1,386 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains a local HTTP server answering queries over the customers,
+with JSON responses, for services that embed the model:
+
+    GET /bill?customer=ID&month=M&year=Y
+        the bill of a customer, as returned by Customer.generate_bill()
+    GET /calls?FILTER=STRING&FILTER=STRING...&limit=N
+        the calls kept by a chain of filters, applied in the order of the
+        parameters, where FILTER is one of the keys of FILTERS and STRING is
+        its filter string, e.g. /calls?customer=5555&duration=G300; at most
+        N >= 0 of them are listed, with their count
+    GET /history?number=NUMBER&start=START&end=END
+        the calls made and received by a phone line between two times, in
+        the ISO format, e.g. "2018-01-05T10:00:00" or "2018-01-05"
+
+Each request is answered in its own thread. The model can keep being updated,
+e.g. by live ingestion, as long as every update is made in a
+QueryServer.writing() block: readers wait for the update to finish, and the
+update waits for the readers in progress. Responses are cached by query until
+the next update.
+"""
+import datetime
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, Optional
+from urllib.parse import parse_qsl, urlsplit
+from call import Call
+from customer import Customer
+from filter import CallGraphFilter, CustomerFilter, DurationFilter, \
+    LocationFilter, QueryFilter, ResetFilter, TimeRangeFilter, \
+    TopCustomersFilter
+
+# The filters of /calls queries, by parameter name
+FILTERS = {'customer': CustomerFilter, 'duration': DurationFilter,
+           'location': LocationFilter, 'time': TimeRangeFilter,
+           'top': TopCustomersFilter, 'hops': CallGraphFilter,
+           'query': QueryFilter}
+
+# Default maximum number of calls in a /calls response
+CALLS_LIMIT = 1000
+
+# Maximum number of responses kept in the cache
+CACHE_SIZE = 1024
+
+
+class QueryError(Exception):
+    """ An invalid query, answered with an HTTP error <status>.
+    """
+    status: int
+
+    def __init__(self, status: int, message: str) -> None:
+        """ Create an error of HTTP status <status> described by <message>.
+        """
+        super().__init__(message)
+        self.status = status
+
+
+class ReadWriteLock:
+    """ A lock that any number of readers can hold at once, or one writer.
+    Writers take precedence: once a writer waits, new readers wait for it.
+    """
+    # === Private Attributes ===
+    # _condition:
+    #     notified when the lock is released
+    # _readers:
+    #     the number of readers holding the lock
+    # _writing:
+    #     whether a writer holds the lock
+    # _waiting_writers:
+    #     the number of writers waiting for the lock
+    _condition: threading.Condition
+    _readers: int
+    _writing: bool
+    _waiting_writers: int
+
+    def __init__(self) -> None:
+        """ Create a released lock.
+        """
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def reading(self) -> Iterator[None]:
+        """ Hold this lock as a reader for the duration of a with block.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: not self._writing and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def writing(self) -> Iterator[None]:
+        """ Hold this lock as the writer for the duration of a with block.
+        """
+        with self._condition:
+            self._waiting_writers += 1
+            self._condition.wait_for(
+                lambda: not self._writing and not self._readers)
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+def _call_to_json(call: Call) -> dict[str, Any]:
+    """ Return <call> as a dictionary in the format of the events of the
+    dataset
+    """
+    return {'src_number': call.src_number,
+            'dst_number': call.dst_number,
+            'time': call.time.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': call.duration,
+            'src_loc': list(call.src_loc),
+            'dst_loc': list(call.dst_loc)}
+
+
+def _get_int(params: dict[str, str], name: str) -> int:
+    """ Return the integer parameter <name> of <params>.
+
+    Raise a QueryError if it is missing or not an integer.
+    """
+    try:
+        return int(params[name])
+    except (KeyError, ValueError):
+        raise QueryError(400, 'expected an integer ' + name) from None
+
+
+def _get_time(params: dict[str, str], name: str) -> datetime.datetime:
+    """ Return the time parameter <name> of <params>.
+
+    Raise a QueryError if it is missing or not a valid time.
+    """
+    try:
+        return datetime.datetime.fromisoformat(params[name])
+    except (KeyError, ValueError):
+        raise QueryError(400, 'expected a time ' + name) from None
+
+
+class QueryServer:
+    """ A local HTTP server answering queries over customers.
+
+    === Public Attributes ===
+    requests:
+         number of queries answered
+    cache_hits:
+         number of queries answered from the cache
+    """
+    # === Private Attributes ===
+    # _customers:
+    #     the customers queried
+    # _lock:
+    #     held by the queries as readers, and by the updates of the model
+    # _cache:
+    #     the encoded responses of the queries since the last update, keyed
+    #     by path and parameters, from the oldest
+    # _cache_lock:
+    #     held to access _cache and the counters
+    # _all_calls:
+    #     every call of the customers, once, or None if not gathered since
+    #     the last update
+    # _server:
+    #     the HTTP server
+    # _thread:
+    #     the thread running the HTTP server, once started
+    requests: int
+    cache_hits: int
+    _customers: list[Customer]
+    _lock: ReadWriteLock
+    _cache: dict[tuple, bytes]
+    _cache_lock: threading.Lock
+    _all_calls: Optional[list[Call]]
+    _server: ThreadingHTTPServer
+    _thread: Optional[threading.Thread]
+
+    def __init__(self, customers: list[Customer], port: int = 0,
+                 host: str = 'localhost') -> None:
+        """ Create a server answering queries over <customers> on <port> of
+        <host>; a <port> of 0 picks a free port (see get_port()).
+        """
+        self.requests = 0
+        self.cache_hits = 0
+        self._customers = customers
+        self._lock = ReadWriteLock()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._all_calls = None
+        self._server = ThreadingHTTPServer((host, port), _QueryHandler)
+        self._server.daemon_threads = True
+        self._server.query_server = self
+        self._thread = None
+
+    def get_port(self) -> int:
+        """ Return the port this server listens on.
+        """
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        """ Start answering queries in a background thread.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ Stop answering queries, and close the server, even if it was
+        never started.
+        """
+        if self._thread is not None:
+            # shutdown() waits for serve_forever(), only run once started
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    @contextmanager
+    def writing(self) -> Iterator[None]:
+        """ Wait for the queries in progress, then block new ones for the
+        duration of a with block, in which the customers can be updated.
+        The cached responses are dropped.
+        """
+        with self._lock.writing():
+            try:
+                yield
+            finally:
+                with self._cache_lock:
+                    self._cache.clear()
+                self._all_calls = None
+
+    def answer(self, path: str, params: list[tuple[str, str]]) -> bytes:
+        """ Return the JSON response to the query of <path> with the
+        parameters <params>, in order, from the cache if possible.
+
+        Raise a QueryError if the query is invalid.
+        """
+        key = (path, tuple(params))
+        with self._cache_lock:
+            self.requests += 1
+            response = self._cache.get(key)
+            if response is not None:
+                self.cache_hits += 1
+                return response
+
+        with self._lock.reading():
+            if path == '/bill':
+                result = self._get_bill(dict(params))
+            elif path == '/calls':
+                result = self._get_calls(params)
+            elif path == '/history':
+                result = self._get_history(dict(params))
+            else:
+                raise QueryError(404, 'unknown query ' + path)
+            response = json.dumps(result).encode()
+            with self._cache_lock:
+                if len(self._cache) >= CACHE_SIZE:
+                    del self._cache[next(iter(self._cache))]
+                self._cache[key] = response
+        return response
+
+    def _find_customer(self, cid: int) -> Customer:
+        """ Return the customer with the id <cid>.
+
+        Raise a QueryError if there is no such customer.
+        """
+        for customer in self._customers:
+            if customer.get_id() == cid:
+                return customer
+        raise QueryError(404, 'unknown customer ' + str(cid))
+
+    def _get_bill(self, params: dict[str, str]) -> dict[str, Any]:
+        """ Return the answer to a /bill query with the parameters <params>.
+        """
+        customer = self._find_customer(_get_int(params, 'customer'))
+        cid, total, bills = customer.generate_bill(
+            _get_int(params, 'month'), _get_int(params, 'year'))
+        return {'customer': cid, 'total': total, 'bills': bills}
+
+    def _get_calls(self, params: list[tuple[str, str]]) -> dict[str, Any]:
+        """ Return the answer to a /calls query with the parameters <params>.
+        """
+        limit = CALLS_LIMIT
+        filters = []
+        for name, filter_string in params:
+            if name == 'limit':
+                limit = _get_int({name: filter_string}, name)
+                if limit < 0:
+                    raise QueryError(400, 'expected a limit of 0 or more')
+            elif name in FILTERS:
+                filters.append((FILTERS[name](), filter_string))
+            else:
+                raise QueryError(400, 'unknown filter ' + name)
+
+        calls = self._get_all_calls()
+        for f, filter_string in filters:
+            calls = f.apply(self._customers, calls, filter_string)
+        return {'count': len(calls),
+                'calls': [_call_to_json(call) for call in calls[:limit]]}
+
+    def _get_all_calls(self) -> list[Call]:
+        """ Return every call of the customers, once, gathering them if they
+        were updated since the last time.
+        """
+        calls = self._all_calls
+        if calls is None:
+            calls = ResetFilter().apply(self._customers, [], '')
+            self._all_calls = calls
+        return calls
+
+    def _get_history(self, params: dict[str, str]) -> dict[str, Any]:
+        """ Return the answer to a /history query with the parameters
+        <params>.
+        """
+        number = params.get('number')
+        for customer in self._customers:
+            line = customer.get_phone_line(number) if number else None
+            if line is not None:
+                outgoing, incoming = line.get_calls_between(
+                    _get_time(params, 'start'), _get_time(params, 'end'))
+                return {'number': number,
+                        'outgoing': [_call_to_json(c) for c in outgoing],
+                        'incoming': [_call_to_json(c) for c in incoming]}
+        raise QueryError(404, 'unknown number ' + str(number))
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    """ The handler of the HTTP requests of a QueryServer.
+    """
+
+    def do_GET(self) -> None:
+        """ Answer a GET request with the JSON response of its query.
+        """
+        url = urlsplit(self.path)
+        try:
+            body = self.server.query_server.answer(url.path,
+                                                   parse_qsl(url.query))
+            status = 200
+        except QueryError as error:
+            body = json.dumps({'error': str(error)}).encode()
+            status = error.status
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:
+        """ Do not log every request.
+        """
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'datetime', 'json', 'threading',
+            'contextlib', 'http.server', 'urllib.parse', 'call', 'customer',
+            'filter'
+        ],
+        'disable': ['C0103'],
+    })
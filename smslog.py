@@ -0,0 +1,91 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains the optional compact storage for SMS events. The phone
+lines only count their SMSs; an SMSLog passed to the event processing
+functions of application.py also keeps every SMS, as three parallel integer
+arrays of source number ids, destination number ids and packed times, instead
+of one object per SMS.
+"""
+import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterator
+from call import pack_time
+
+
+class SMSLog:
+    """ A chronologically ordered log of SMSs.
+
+    Each SMS is a Tuple (source number id, destination number id, packed
+    time), where the ids are those of the NUMBERS registry and the time is
+    packed by call.pack_time().
+    """
+    # === Private Attributes ===
+    # _src_ids:
+    #     the source number id of each SMS
+    # _dst_ids:
+    #     the destination number id of each SMS
+    # _times:
+    #     the packed time of each SMS, in non-decreasing order
+    _src_ids: array
+    _dst_ids: array
+    _times: array
+
+    def __init__(self) -> None:
+        """ Create an empty SMSLog.
+        """
+        self._src_ids = array('l')
+        self._dst_ids = array('l')
+        self._times = array('q')
+
+    def add(self, src_id: int, dst_id: int, packed_time: int) -> None:
+        """ Add an SMS from the number with id <src_id> to the number with id
+        <dst_id>, sent at <packed_time>, to the end of this log.
+
+        Precondition:
+        - <packed_time> is not before the time of the last SMS in this log
+        """
+        self._src_ids.append(src_id)
+        self._dst_ids.append(dst_id)
+        self._times.append(packed_time)
+
+    def __len__(self) -> int:
+        """ Return the number of SMSs in this log
+        """
+        return len(self._times)
+
+    def __iter__(self) -> Iterator[tuple[int, int, int]]:
+        """ Yield every SMS of this log, in chronological order
+        """
+        return zip(self._src_ids, self._dst_ids, self._times)
+
+    def count_between(self, start: datetime.datetime,
+                      end: datetime.datetime) -> int:
+        """ Return the number of SMSs sent between <start> and <end>
+        inclusive, by bisecting the times of this log.
+        """
+        first = pack_time(start) + (start.microsecond > 0)
+        return bisect_right(self._times, pack_time(end)) \
+            - bisect_left(self._times, first)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'datetime', 'array', 'bisect', 'call'
+        ],
+    })
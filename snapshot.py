@@ -0,0 +1,276 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains immutable snapshots of the customers, for readers that run
+alongside the ingestion of new events.
+
+A ModelSnapshot holds the calls and the bill summaries of every phone line as
+they were when it was taken, in tuples and arrays that are never modified, so
+that any number of threads (or processes forked after it was taken) can read
+it without locking. A SnapshotPublisher publishes a new snapshot by replacing
+its reference to the current one: readers keep using the snapshot they got,
+and only see a new one once it is complete.
+
+Publishing is copy-on-write: the snapshot of a phone line that did not change
+since the previous snapshot is shared with it, so publishing after a small
+batch of events only copies the lines that the batch touched.
+"""
+import datetime
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+from typing import NamedTuple, Optional, Union
+from bill import to_dollars, to_mills
+from call import Call, pack_time
+from customer import Customer
+from numberregistry import NUMBERS
+from phoneline import PhoneLine
+
+
+class LineSnapshot(NamedTuple):
+    """ The snapshot of a phone line.
+
+    === Attributes ===
+    number_id:
+        the id of the phone number of the line
+    outgoing:
+        the calls made by the line, in chronological order
+    incoming:
+        the calls received by the line, in chronological order
+    outgoing_times:
+        the packed times (see call.pack_time) of the calls of outgoing
+    incoming_times:
+        the packed times of the calls of incoming
+    bills:
+        the (month, year) of every bill of the line, with its summary as a
+        Tuple of (key, value) pairs, as returned by PhoneLine.get_bill()
+    key:
+        the state of the line when the snapshot was taken, which changes
+        whenever its calls, SMSs or bills change
+    """
+    number_id: int
+    outgoing: tuple[Call, ...]
+    incoming: tuple[Call, ...]
+    outgoing_times: array
+    incoming_times: array
+    bills: tuple[tuple[tuple[int, int], tuple], ...]
+    key: tuple
+
+
+class CustomerSnapshot(NamedTuple):
+    """ The snapshot of a customer.
+
+    === Attributes ===
+    cid:
+        the id of the customer
+    lines:
+        the snapshots of the phone lines of the customer, in order
+    """
+    cid: int
+    lines: tuple[LineSnapshot, ...]
+
+
+def _line_key(line: PhoneLine) -> tuple:
+    """ Return the state of <line> that changes whenever its calls, SMSs or
+    bills change: the months of its bills, its numbers of calls and SMSs, and
+    the total of its latest bill.
+    """
+    dates = line.get_bill_dates()
+    latest = line.get_bill(*dates[-1]) if dates else None
+    history = line.get_call_history()
+    return (len(dates), history.count_calls(), line.get_sms_counts(),
+            None if latest is None else latest['total'])
+
+
+def _freeze_line(line: PhoneLine, key: tuple) -> LineSnapshot:
+    """ Return the snapshot of <line>, whose state is <key>.
+    """
+    history = line.get_call_history()
+    outgoing = tuple(history.get_outgoing_view())
+    incoming = tuple(history.get_incoming_view())
+    bills = []
+    for month, year in line.get_bill_dates():
+        summary = line.get_bill(month, year)
+        if summary is not None:
+            bills.append(((month, year), tuple(summary.items())))
+    return LineSnapshot(line.get_number_id(), outgoing, incoming,
+                        array('q', [call.packed_time for call in outgoing]),
+                        array('q', [call.packed_time for call in incoming]),
+                        tuple(bills), key)
+
+
+class ModelSnapshot:
+    """ An immutable snapshot of customers.
+
+    === Public Attributes ===
+    version:
+         the number of this snapshot; later snapshots have greater numbers
+    customers:
+         the snapshots of the customers, in order
+    """
+    # === Private Attributes ===
+    # _customers_by_id:
+    #     the snapshots of the customers, keyed by their id
+    # _lines:
+    #     the snapshots of the phone lines, keyed by the id of their number
+    # _calls:
+    #     every call, once, in the order of ResetFilter, or None until
+    #     get_calls() is first called
+    version: int
+    customers: tuple[CustomerSnapshot, ...]
+    _customers_by_id: dict[int, CustomerSnapshot]
+    _lines: dict[int, LineSnapshot]
+    _calls: Optional[tuple[Call, ...]]
+
+    def __init__(self, customers: list[Customer], version: int = 0,
+                 previous: Optional['ModelSnapshot'] = None) -> None:
+        """ Take the snapshot of <customers>, numbered <version>, sharing the
+        snapshots of the phone lines that did not change since <previous>,
+        if it is not None.
+
+        The snapshot must be taken while <customers> are not being updated.
+        """
+        self.version = version
+        old_lines = {} if previous is None else previous._lines
+        self._lines = {}
+        snapshots = []
+        for customer in customers:
+            lines = []
+            for number in customer.get_phone_numbers():
+                line = customer.get_phone_line(number)
+                key = _line_key(line)
+                snapshot = old_lines.get(line.get_number_id())
+                if snapshot is None or snapshot.key != key:
+                    snapshot = _freeze_line(line, key)
+                self._lines[snapshot.number_id] = snapshot
+                lines.append(snapshot)
+            snapshots.append(CustomerSnapshot(customer.get_id(),
+                                              tuple(lines)))
+        self.customers = tuple(snapshots)
+        self._customers_by_id = {c.cid: c for c in self.customers}
+        self._calls = None
+
+    def get_calls(self) -> tuple[Call, ...]:
+        """ Return every call of this snapshot once, in the same order as
+        ResetFilter: the calls made by each phone line of each customer.
+        """
+        if self._calls is None:
+            # a race between readers only computes the same tuple twice
+            self._calls = tuple(chain.from_iterable(
+                line.outgoing for customer in self.customers
+                for line in customer.lines))
+        return self._calls
+
+    def get_bill(self, cid: int, month: int, year: int) \
+            -> Optional[tuple[int, float, list[dict]]]:
+        """ Return the bill of the customer with id <cid> for <month> of
+        <year>, like Customer.generate_bill(), or None if there is no such
+        customer in this snapshot.
+        """
+        customer = self._customers_by_id.get(cid)
+        if customer is None:
+            return None
+        bills = []
+        total = 0
+        for line in customer.lines:
+            for date, summary in line.bills:
+                if date == (month, year):
+                    bills.append(dict(summary))
+                    total += to_mills(bills[-1]['total'])
+        return cid, to_dollars(total), bills
+
+    def get_line(self, number: Union[str, int]) -> Optional[LineSnapshot]:
+        """ Return the snapshot of the phone line of <number>, a phone number
+        or its id, or None if there is no such line in this snapshot.
+        """
+        nid = NUMBERS.lookup(number)
+        return None if nid is None else self._lines.get(nid)
+
+    def get_calls_between(self, number: Union[str, int],
+                          start: datetime.datetime,
+                          end: datetime.datetime) \
+            -> tuple[tuple[Call, ...], tuple[Call, ...]]:
+        """ Return the calls made and received by the phone line of <number>,
+        a phone number or its id, between <start> and <end> inclusive, in
+        chronological order, like PhoneLine.get_calls_between(). Return empty
+        Tuples if there is no such line.
+        """
+        line = self.get_line(number)
+        if line is None:
+            return (), ()
+        first = pack_time(start) + (start.microsecond > 0)
+        last = pack_time(end)
+        return (line.outgoing[bisect_left(line.outgoing_times, first):
+                              bisect_right(line.outgoing_times, last)],
+                line.incoming[bisect_left(line.incoming_times, first):
+                              bisect_right(line.incoming_times, last)])
+
+
+class SnapshotPublisher:
+    """ The publisher of the snapshots of customers that keep being updated.
+
+    The thread that updates the customers calls publish() between updates,
+    e.g. after each batch of live events, and any thread calls get() for the
+    latest complete snapshot.
+    """
+    # === Private Attributes ===
+    # _customers:
+    #     the customers whose snapshots are published
+    # _current:
+    #     the latest snapshot published, or None
+    # _lock:
+    #     held while a snapshot is being taken, so that publish() can be
+    #     called from several threads
+    _customers: list[Customer]
+    _current: Optional[ModelSnapshot]
+    _lock: threading.Lock
+
+    def __init__(self, customers: list[Customer]) -> None:
+        """ Create a publisher of the snapshots of <customers>, without any
+        snapshot yet.
+        """
+        self._customers = customers
+        self._current = None
+        self._lock = threading.Lock()
+
+    def publish(self) -> ModelSnapshot:
+        """ Take a new snapshot of the customers, make it the current one, and
+        return it. Must not be called while the customers are being updated.
+        """
+        with self._lock:
+            previous = self._current
+            version = 0 if previous is None else previous.version + 1
+            snapshot = ModelSnapshot(self._customers, version, previous)
+            # replacing the reference is atomic: readers see either snapshot
+            self._current = snapshot
+        return snapshot
+
+    def get(self) -> Optional[ModelSnapshot]:
+        """ Return the latest snapshot published, or None if there is none.
+        """
+        return self._current
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'datetime', 'threading', 'array', 'bisect',
+            'itertools', 'bill', 'call', 'customer', 'numberregistry',
+            'phoneline'
+        ],
+        'disable': ['W0212'],
+    })
@@ -0,0 +1,106 @@
+"""
+CSC148, Winter 2024
+Assignment 1
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) 2022 Bogdan Simion, Diane Horton, Jacqueline Smith
+
+=== Module Description ===
+
+This file contains top-K queries over the customers, phone lines and called
+numbers, for a single month or for all months.
+
+The queries read counters that are already kept up to date during ingestion
+(the minutes on the bills, and the number of calls in each month of a call
+history), so no call is scanned. The K largest are selected with a heap, in
+O(n log K) time for n lines. Ties keep the order of the customers and of
+their phone lines.
+"""
+from heapq import nlargest
+from typing import Iterator
+from customer import Customer
+from phoneline import PhoneLine
+
+# The measures that lines and customers can be ranked by: the minutes charged
+# for their outgoing calls, or the number of their outgoing calls
+TOP_K_MEASURES = ('minutes', 'calls')
+
+
+def _iter_lines(customers: list[Customer]) \
+        -> Iterator[tuple[Customer, PhoneLine]]:
+    """ Yield every phone line of <customers> with its owner, in order
+    """
+    for customer in customers:
+        for number in customer.get_phone_numbers():
+            yield customer, customer.get_phone_line(number)
+
+
+def _line_usage(line: PhoneLine, by: str, month: int, year: int) -> int:
+    """ Return the outgoing usage of <line> measured by <by>, in <month> of
+    <year>, or in all months if they are both None.
+
+    Raise a ValueError if <by> is not in TOP_K_MEASURES.
+    """
+    if by == 'minutes':
+        return line.get_outgoing_minutes(month, year)
+    if by == 'calls':
+        return line.get_call_history().count_calls(month, year)[0]
+    raise ValueError('unknown measure: ' + str(by))
+
+
+def top_lines(customers: list[Customer], k: int, month: int = None,
+              year: int = None, by: str = 'minutes') -> list[tuple[str, int]]:
+    """ Return the <k> phone lines of <customers> with the most outgoing
+    usage, measured by <by> (see TOP_K_MEASURES), in <month> of <year>, or in
+    all months if <month> and <year> are both None. Each line is returned as
+    a Tuple (phone number, usage), from the highest usage.
+
+    Raise a ValueError if <by> is not in TOP_K_MEASURES.
+    """
+    usage = [(line.get_number(), _line_usage(line, by, month, year))
+             for _, line in _iter_lines(customers)]
+    return nlargest(k, usage, key=lambda item: item[1])
+
+
+def top_customers(customers: list[Customer], k: int, month: int = None,
+                  year: int = None, by: str = 'minutes') \
+        -> list[tuple[int, int]]:
+    """ Return the <k> customers of <customers> with the most outgoing usage
+    over all of their phone lines, like top_lines(), as Tuples
+    (customer id, usage), from the highest usage.
+
+    Raise a ValueError if <by> is not in TOP_K_MEASURES.
+    """
+    usage = {}
+    for customer, line in _iter_lines(customers):
+        cid = customer.get_id()
+        usage[cid] = usage.get(cid, 0) + _line_usage(line, by, month, year)
+    return nlargest(k, usage.items(), key=lambda item: item[1])
+
+
+def top_destinations(customers: list[Customer], k: int, month: int = None,
+                     year: int = None) -> list[tuple[str, int]]:
+    """ Return the <k> phone numbers of <customers> that received the most
+    calls in <month> of <year>, or in all months if <month> and <year> are
+    both None, as Tuples (phone number, number of calls received), from the
+    most called.
+    """
+    counts = [(line.get_number(),
+               line.get_call_history().count_calls(month, year)[1])
+              for _, line in _iter_lines(customers)]
+    return nlargest(k, counts, key=lambda item: item[1])
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'python_ta', 'typing', 'heapq', 'customer', 'phoneline'
+        ],
+    })
@@ -32,8 +32,13 @@ from typing import Optional, Union, Callable, Any
 import pygame
 
 from call import Drawable, Call
-from customer import Customer
-from filter import Filter, DurationFilter, CustomerFilter, LocationFilter, ResetFilter
+from customer import Customer, get_version
+from callbitmap import CallBitmap, CallIndex
+from filtercache import FilterCache
+from filter import (Filter, DurationFilter, CustomerFilter, LocationFilter,
+                    ResetFilter, TimeRangeFilter, TopCustomersFilter,
+                    CallGraphFilter, QueryFilter, MonthFilter, CHUNK_SIZE)
+from monthindex import MonthIndex
 
 # ----------------------------------------------------------------------------
 # NOTE: You do not need to understand any of the visualization details from
@@ -55,6 +60,15 @@ SCREEN_SIZE = (1000, 700)
 # Thread settings for Task 5
 NUM_THREADS = 1
 
+# Draw filter results chunk by chunk as they are found (single thread only)
+PROGRESSIVE_RENDERING = True
+
+# Keep the calls shown as a bitmap, to which the filters are applied; the
+# calls are only listed from it to be drawn, chunk by chunk if
+# PROGRESSIVE_RENDERING is set. Not used when NUM_THREADS is more than 1: the
+# filters are then applied to the calls by the threads.
+BITMAP_FILTERS = True
+
 
 def get_filter(unicode: str) -> Optional[Filter]:
     """Returns the filter class to use"""
@@ -67,6 +81,16 @@ def get_filter(unicode: str) -> Optional[Filter]:
         return CustomerFilter()
     elif unicode == "r":
         return ResetFilter()
+    elif unicode == "t":
+        return TimeRangeFilter()
+    elif unicode == "h":
+        return TopCustomersFilter()
+    elif unicode == "n":
+        return CallGraphFilter()
+    elif unicode == "q":
+        return QueryFilter()
+    elif unicode == "b":
+        return MonthFilter()
     return None
 
 
@@ -82,11 +106,30 @@ class Visualizer:
     #   on the pygame window.
     # _map: the Map object responsible for converting between longitude/latitude
     #   coordinates and the pixels of the visualization window.
+    # _filters: the operations applied since the last reset, in order: "and"
+    #   or "or" with a filter and its filter string, or "not" alone.
+    # _cache: the results of the filters applied so far.
+    # _index: the positions of the calls, for the bitmaps of the calls shown.
+    # _index_version: the version of the customers (see get_version) when
+    #   their calls were last added to _index, or None.
+    # _shown: the calls last listed from a bitmap to be drawn, with that
+    #   bitmap, or None.
+    # _next_or: whether the next filter is OR-ed with the calls shown,
+    #   instead of applied to them.
+    # _months: the calls shown by month while no filter is applied since the
+    #   last reset, or None until a month filter is first applied.
     _uiscreen: pygame.Surface
     _screen: pygame.Surface
     _mouse_down: bool
     _map: 'Map'
     _quit: bool
+    _filters: list[tuple[str, Optional[Filter], str]]
+    _cache: FilterCache
+    _index: CallIndex
+    _index_version: Optional[tuple[int, int]]
+    _shown: Optional[tuple[list[Call], CallBitmap]]
+    _next_or: bool
+    _months: Optional[MonthIndex]
     r: Tk
 
     def __init__(self) -> None:
@@ -115,11 +158,25 @@ class Visualizer:
                             (SCREEN_SIZE[0] + 10, 200))
         self._uiscreen.blit(font.render("R: reset filter", True, WHITE),
                             (SCREEN_SIZE[0] + 10, 250))
+        self._uiscreen.blit(font.render("T: time range", True, WHITE),
+                            (SCREEN_SIZE[0] + 10, 300))
+        self._uiscreen.blit(font.render("H: top customers", True, WHITE),
+                            (SCREEN_SIZE[0] + 10, 350))
+        self._uiscreen.blit(font.render("N: call graph hops", True, WHITE),
+                            (SCREEN_SIZE[0] + 10, 400))
+        self._uiscreen.blit(font.render("Q: query", True, WHITE),
+                            (SCREEN_SIZE[0] + 10, 450))
 
         self._uiscreen.blit(font.render("M: monthly bill", True, WHITE),
                             (SCREEN_SIZE[0] + 10, 500))
-        self._uiscreen.blit(font.render("X: quit application", True, WHITE),
+        self._uiscreen.blit(font.render("O: OR next filter", True, WHITE),
+                            (SCREEN_SIZE[0] + 10, 550))
+        self._uiscreen.blit(font.render("I: invert (NOT)", True, WHITE),
+                            (SCREEN_SIZE[0] + 10, 600))
+        self._uiscreen.blit(font.render("B: billing months", True, WHITE),
                             (SCREEN_SIZE[0] + 10, 650))
+        self._uiscreen.blit(font.render("X: quit application", True, WHITE),
+                            (SCREEN_SIZE[0] + 10, 675))
 
         self._screen = self._uiscreen.subsurface((0, 0), SCREEN_SIZE)
         self._screen.fill(WHITE)
@@ -129,6 +186,13 @@ class Visualizer:
         # Initial render
         self.render_drawables([])
         self._quit = False
+        self._filters = []
+        self._cache = FilterCache()
+        self._index = CallIndex()
+        self._index_version = None
+        self._shown = None
+        self._next_or = False
+        self._months = None
 
     def render_drawables(self, drawables: list[Drawable]) -> None:
         """Render the <drawables> to the screen
@@ -143,6 +207,131 @@ class Visualizer:
         # Show the new image
         pygame.display.flip()
 
+    def render_calls(self, calls: list[Call], clear: bool = True) -> None:
+        """Render the sprites and connection lines of <calls> to the screen.
+        If <clear> is False, draw them on top of what is already shown instead
+        of redrawing the background map first.
+        """
+        drawables = []
+        connections = []
+        for call in calls:
+            connections.append(call.get_connection())
+            drawables.extend(call.get_drawables())
+        # Put the connections on top of the other sprites
+        drawables.extend(connections)
+
+        if clear:
+            self.render_drawables(drawables)
+        else:
+            self._map.render_objects(drawables, self._screen)
+            pygame.display.flip()
+
+    def record_filter(self, f: Optional[Filter], filter_string: str,
+                      operation: str = 'and') -> None:
+        """Record that the filter <f> was applied with <filter_string> to the
+        calls shown, or OR-ed with them if <operation> is "or", or that they
+        were inverted if <operation> is "not", so that new calls can be
+        filtered the same way
+        """
+        if isinstance(f, ResetFilter) and operation == 'and':
+            self._filters = []
+            # the calls are shown again in the order of the customers
+            self._months = None
+        else:
+            self._filters.append((operation, f, filter_string))
+
+    def _get_months(self, drawables: list[Call]) -> MonthIndex:
+        """Return the month index of the calls shown, <drawables>, which
+        must be all of the calls, since no filter was applied since the last
+        reset
+        """
+        if self._months is None or len(self._months) != len(drawables):
+            self._months = MonthIndex(drawables)
+        return self._months
+
+    def _get_all_calls(self, customers: list[Customer]) -> CallBitmap:
+        """Return the bitmap of every call of <customers>, only gathering
+        their calls again if calls were added to them since the last time
+        """
+        version = get_version(customers)
+        if version != self._index_version:
+            self._index.add(ResetFilter().apply(customers, [], ''))
+            self._index_version = version
+        return self._index.get_all()
+
+    def _to_bitmap(self, customers: list[Customer],
+                   drawables: list[Call]) -> CallBitmap:
+        """Return the bitmap of the calls shown, <drawables>, without
+        reading them if they were listed from a bitmap by _to_calls()
+        """
+        self._get_all_calls(customers)
+        if self._shown is not None and self._shown[0] is drawables:
+            return self._shown[1]
+        return self._index.to_bitmap(drawables)
+
+    def _to_calls(self, bitmap: CallBitmap) -> list[Call]:
+        """Return the calls of <bitmap>, to be drawn, in the order of the
+        calls of the customers
+        """
+        calls = bitmap.to_calls()
+        self._shown = (calls, bitmap)
+        return calls
+
+    def and_filter(self, f: Filter, customers: list[Customer],
+                   drawables: list[Call], filter_string: str) -> list[Call]:
+        """Return the calls shown, <drawables>, that the filter <f> keeps
+        with <filter_string>, in the order of the calls of <customers>
+        """
+        kept = f.apply_bitmap(customers, self._to_bitmap(customers, drawables),
+                              filter_string)
+        self.record_filter(f, filter_string)
+        return self._to_calls(kept)
+
+    def or_filter(self, f: Filter, customers: list[Customer],
+                  drawables: list[Call], filter_string: str) -> list[Call]:
+        """Return the calls shown, <drawables>, together with the calls of
+        <customers> that the filter <f> keeps with <filter_string>, in the
+        order of the calls of <customers>
+        """
+        found = f.apply_bitmap(customers, self._get_all_calls(customers),
+                               filter_string)
+        self.record_filter(f, filter_string, 'or')
+        return self._to_calls(self._to_bitmap(customers, drawables) | found)
+
+    def invert(self, customers: list[Customer],
+               drawables: list[Call]) -> list[Call]:
+        """Return the calls of <customers> that are not among the calls
+        shown, <drawables>, in the order of the calls of <customers>
+        """
+        shown = self._to_bitmap(customers, drawables)
+        self.record_filter(None, '', 'not')
+        return self._to_calls(self._get_all_calls(customers) - shown)
+
+    def add_live_calls(self, customers: list[Customer],
+                       drawables: list[Call],
+                       new_calls: list[Call]) -> list[Call]:
+        """Return the calls shown, <drawables>, followed by the calls from
+        <new_calls> that pass the filters applied since the last reset.
+        Only <new_calls> are filtered; the <customers> list contains all
+        customers, including the calls of <new_calls>.
+        """
+        kept = new_calls
+        for operation, f, filter_string in self._filters:
+            if operation == 'not':
+                excluded = set(kept)
+                kept = [call for call in new_calls if call not in excluded]
+            elif operation == 'or':
+                added = set(kept)
+                added.update(f.apply_new(customers, new_calls, filter_string))
+                kept = [call for call in new_calls if call in added]
+            elif kept:
+                kept = f.apply_new(customers, kept, filter_string)
+        if self._months is not None and not self._filters:
+            self._months.add(kept)
+        if not kept:
+            return drawables
+        return drawables + kept
+
     def has_quit(self) -> bool:
         """Returns if the program has received the quit command
         """
@@ -183,10 +372,31 @@ class Visualizer:
                 self._quit = True
             elif event.type == pygame.KEYDOWN and event.unicode.lower() == 'x':
                 self._quit = True
+            elif event.type == pygame.KEYDOWN and event.unicode.lower() == 'o':
+                self._next_or = True
+                print("The next filter is OR-ed with the calls shown")
+            elif event.type == pygame.KEYDOWN and event.unicode.lower() == 'i':
+                new_drawables = self.invert(customers, new_drawables)
             elif event.type == pygame.KEYDOWN:
                 f = get_filter(event.unicode)
 
-                if f is not None:
+                if f is not None and self._next_or:
+                    self._next_or = False
+
+                    def or_wrapper(customers: list[Customer],
+                                   data: list[Call],
+                                   filter_string: str) -> list[Call]:
+                        """A wrapper that OR-s the calls kept by the filter
+                        with the calls shown
+                        """
+                        return self.or_filter(f, customers, data,
+                                              filter_string)
+
+                    new_drawables = self.entry_window(str(f),
+                                                      customers,
+                                                      drawables,
+                                                      or_wrapper)
+                elif f is not None:
                     def result_wrapper(fun: Callable[[list[Customer],
                                                       list[Call],
                                                       str], list[Call]],
@@ -232,12 +442,88 @@ class Visualizer:
                         new_data = []
                         for res in results:
                             new_data.extend(res[0])
+                        self.record_filter(f, filter_string)
+                        return new_data
+
+                    def progressive_wrapper(customers: list[Customer],
+                                            data: list[Call],
+                                            filter_string: str) \
+                            -> list[Call]:
+                        """A wrapper for the application of filters that
+                        draws each chunk of matched calls as soon as it is
+                        found
+                        """
+                        new_data = []
+                        self.render_drawables([])
+                        for chunk in f.apply_chunks(customers, data,
+                                                    filter_string):
+                            new_data.extend(chunk)
+                            self.render_calls(chunk, clear=False)
+                            # keep the window responsive during long scans
+                            pygame.event.pump()
+                        self.record_filter(f, filter_string)
+                        return new_data
+
+                    def month_wrapper(customers: list[Customer],
+                                      data: list[Call],
+                                      filter_string: str) -> list[Call]:
+                        """A wrapper that takes the calls of the months
+                        from the month index of the calls shown, instead of
+                        scanning all of them
+                        """
+                        new_data = f.apply_index(self._get_months(data),
+                                                 filter_string)
+                        self.record_filter(f, filter_string)
+                        return data if new_data is None else new_data
+
+                    def bitmap_wrapper(customers: list[Customer],
+                                       data: list[Call],
+                                       filter_string: str) -> list[Call]:
+                        """A wrapper that applies the filter to the bitmap
+                        of the calls shown, and draws the calls kept chunk by
+                        chunk if rendering is progressive
+                        """
+                        new_data = self.and_filter(f, customers, data,
+                                                   filter_string)
+                        if PROGRESSIVE_RENDERING:
+                            self.render_drawables([])
+                            for i in range(0, len(new_data), CHUNK_SIZE):
+                                self.render_calls(new_data[i:i + CHUNK_SIZE],
+                                                  clear=False)
+                                pygame.event.pump()
+                        return new_data
+
+                    if isinstance(f, MonthFilter) and not self._filters:
+                        wrapper = month_wrapper
+                    elif NUM_THREADS > 1:
+                        wrapper = threading_wrapper
+                    elif BITMAP_FILTERS:
+                        wrapper = bitmap_wrapper
+                    elif PROGRESSIVE_RENDERING:
+                        wrapper = progressive_wrapper
+                    else:
+                        wrapper = threading_wrapper
+
+                    def cached_wrapper(customers: list[Customer],
+                                       data: list[Call],
+                                       filter_string: str) -> list[Call]:
+                        """A wrapper that takes the result of the filter from
+                        the cache if it was applied to the same calls before
+                        """
+                        new_data = self._cache.get(f, customers, data,
+                                                   filter_string)
+                        if new_data is None:
+                            new_data = wrapper(customers, data, filter_string)
+                            self._cache.put(f, customers, data,
+                                            filter_string, new_data)
+                        else:
+                            self.record_filter(f, filter_string)
                         return new_data
 
                     new_drawables = self.entry_window(str(f),
                                                       customers,
                                                       drawables,
-                                                      threading_wrapper)
+                                                      cached_wrapper)
 
                 # Perform the billing for a selected customer:
                 if event.unicode == "m":
@@ -471,7 +757,8 @@ if __name__ == '__main__':
             'doctest', 'python_ta', 'typing',
             'tkinter', 'os', 'pygame',
             'threading', 'math', 'time',
-            'customer', 'call', 'filter',
+            'customer', 'call', 'filter', 'filtercache', 'callbitmap',
+            'monthindex',
         ],
         'allowed-io': [
             'entry_window', 'callback_wrapper', 'threading_wrapper',